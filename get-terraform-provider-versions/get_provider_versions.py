@@ -1,18 +1,202 @@
+import asyncio
 import sys
 import getopt
 import os
 import tempfile
-import subprocess
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from get_terraform_provider_versions.get_tf_provider_versions import (
+    PARSER_VERSION,
+    RegistrySnapshot,
+    get_default_registry_client,
+    TerraformProvider,
     TerraformProviders,
     show_usage,
-    parse_terraform_file,
+    parse_terraform_directory,
+)
+from get_terraform_provider_versions.clone import (
+    FETCH_MODE_FULL,
+    FETCH_MODES,
+    CloneCache,
+    CloneError,
+    clone_repository,
+)
+from get_terraform_provider_versions.journal import Journal
+from get_terraform_provider_versions.parse_cache import ParseCache
+from github.repo import (
+    REQUEST_STATS,
+    AsyncHttpUtil,
+    AsyncRepo,
+    GitHubApiError,
+    HttpUtil,
+    Metrics,
+    Repo,
+    ResponseCache,
+    measure_phase,
 )
-from github.repo import Repo
 
 GITHUB_ORGANIZATION = "dfds"
+# the number of items per worker that are submitted ahead of the results
+QUEUED_ITEMS_PER_WORKER = 2
+
+
+def run_workers(function, items, workers: int = 1):
+    """Apply a function to every item, using a bounded pool of worker threads.
+    :param function: The function to call for each item.
+    :param items: The items to process.  An iterator is consumed at most
+    QUEUED_ITEMS_PER_WORKER items per worker ahead of the results, so work on the
+    first items starts before the last have arrived, and a long iterator is not
+    held in memory.
+    :param workers: The maximum number of items to process concurrently.
+    :return: An iterator over the results, in the same order as the items.
+    """
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # the results are yielded in submission order, which keeps the output
+        # deterministic regardless of which repository finishes first
+        pending: deque = deque()
+        for item in items:
+            if len(pending) >= workers * QUEUED_ITEMS_PER_WORKER:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+def scan_repository(
+    repo: Repo,
+    r: dict,
+    fetch_mode: str = FETCH_MODE_FULL,
+    clone_cache: CloneCache = None,
+    parse_cache: ParseCache = None,
+) -> TerraformProviders:
+    """Detect, clone and parse a single GitHub repository.
+    :param repo: The Repo instance used to query GitHub.
+    :param r: The repository data as returned by the GitHub API.
+    :param fetch_mode: How to clone the repository, either 'full' or 'sparse'.
+    :param clone_cache: An optional cache of mirrors to clone the repository from.
+    :param parse_cache: An optional cache of previously parsed Terraform files.
+    :return: The providers found in the repository, or None if it could not be
+    cloned.
+    """
+    used_providers: TerraformProviders = TerraformProviders()
+    name: str = r.get("name")
+    metrics: Metrics = repo.http_utils.metrics
+
+    repo_has_hcl = repo.does_repo_contain_hcl(name, r.get("languages"))
+    if repo_has_hcl:
+        logging.info(
+            f"Performing Terraform provider analysis on the repository {name}."
+        )
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            clone_url: str = r.get("clone_url")
+            logging.info(f"\tCreating a local Clone of the GitHub repository {name}.")
+            try:
+                with measure_phase(metrics, "clone"):
+                    if clone_cache is None:
+                        clone_repository(clone_url, temp_folder, fetch_mode)
+                    else:
+                        clone_cache.clone_repository(
+                            name, clone_url, temp_folder, r.get("pushed_at"), fetch_mode
+                        )
+            except CloneError as e:
+                logging.error(f"Skipping the repository {name}: {e}")
+                return None
+            logging.info(f"\tClone of {name} complete.")
+
+            with measure_phase(metrics, "parse"):
+                used_providers = parse_terraform_directory(
+                    temp_folder, name, used_providers, parse_cache
+                )
+    else:
+        logging.info(
+            f"Skipping Terraform provider analysis \
+on the repository {name} because it does not \
+contain HCL code."
+        )
+    return used_providers
+
+
+def scan_with_journal(journal: Journal, name: str, scan) -> TerraformProviders:
+    """Scan a repository, unless the journal shows it was completed by an earlier
+    run, in which case the providers recorded for it are used instead.
+    :param journal: The journal of completed repositories, or None.
+    :param name: The name of the repository.
+    :param scan: A function without arguments that scans the repository, and
+    returns None if the scan failed.
+    :return: The providers found in the repository.
+    """
+    if journal is not None and name in journal:
+        logging.info(
+            f"Skipping repository {name}, because it was completed by an earlier run."
+        )
+        used_providers: TerraformProviders = TerraformProviders()
+        for record in journal.get(name) or []:
+            used_providers.append(TerraformProvider(**record))
+        return used_providers
+    used_providers = scan()
+    if used_providers is None:
+        # a failed scan is not journaled, so a resumed run tries it again
+        return TerraformProviders()
+    if journal is not None:
+        journal.record(name, [provider.__dict__ for provider in used_providers])
+    return used_providers
+
+
+def get_named_repos(repo: AsyncRepo, names: list) -> list:
+    """Look up the named repositories concurrently.
+    :param repo: The AsyncRepo used to query GitHub.  Its connection pool is
+    closed afterwards.
+    :param names: The names of the repositories.
+    :return: The repository data as returned by the GitHub API, in the same
+    order as the names, or None for a repository that could not be found.
+    """
+
+    async def lookup() -> list:
+        async with repo.http_utils:
+            fragments: list = await asyncio.gather(
+                *(repo.get_repo(name) for name in names)
+            )
+        return [None if "message" in data else data for data, in fragments]
+
+    return asyncio.run(lookup())
+
+
+def select_candidate_repos(repos, excluded_repos: list):
+    """Filter out the repositories that should not be scanned.
+    :param repos: An iterable of repositories as returned by the GitHub API.
+    :param excluded_repos: The names of the repositories excluded with -e.
+    :return: An iterator over the repositories to scan.
+    """
+    for r in repos:
+        name: str = r.get("name")
+
+        if name in excluded_repos:
+            logging.info(
+                f"Skipping repository {name}, because it has been explicitely excluded \
+                    using the -e parameter."
+            )
+        else:
+            is_archived: bool = r.get("archived", False)
+            is_disabled: bool = r.get("disabled", False)
+
+            if is_archived:
+                logging.info(
+                    f"Skipping repository {name}, \
+because this repo has been archived."
+                )
+            elif is_disabled:
+                logging.info(
+                    f"Skipping repository {name}, \
+because this repo has been disabled."
+                )
+            else:
+                yield r
 
 
 def main(argv):
@@ -27,13 +211,43 @@ def main(argv):
     process_repository: list = []
     local_path: str = ""
     output_format: str = "csv"
+    workers: int = 1
+    fetch_mode: str = FETCH_MODE_FULL
+    cache_dir: str = ""
+    parse_cache_file: str = ""
+    http_cache_dir: str = None
+    snapshot_file: str = ""
+    export_snapshot_file: str = ""
+    journal_file: str = ""
+    resume: bool = False
+    metrics_format: str = ""
+    metrics_file: str = None
+    use_async: bool = False
     COLOUR_END_CODE = "\033[0m"
 
     try:
         opts, args = getopt.getopt(
             argv,
-            "hr:o:l:e:p:",
-            ["repository=", "output=", "local=", "exlude=", "plain"],
+            "hr:o:l:e:p:w:f:c:k:s:x:",
+            [
+                "repository=",
+                "output=",
+                "local=",
+                "exlude=",
+                "plain",
+                "workers=",
+                "fetch=",
+                "cache-dir=",
+                "parse-cache=",
+                "snapshot=",
+                "export-snapshot=",
+                "http-cache=",
+                "async",
+                "journal=",
+                "resume",
+                "metrics=",
+                "metrics-file=",
+            ],
         )
     except getopt.GetoptError:
         show_usage()
@@ -54,13 +268,59 @@ def main(argv):
         elif opt in ("-p", "--plain"):
             if arg.lower() == "true":
                 plain_output: bool = True
+        elif opt in ("-w", "--workers"):
+            try:
+                workers: int = int(arg)
+            except ValueError:
+                show_usage()
+                sys.exit(2)
+        elif opt in ("-f", "--fetch"):
+            if arg not in FETCH_MODES:
+                show_usage()
+                sys.exit(2)
+            fetch_mode: str = arg
+        elif opt in ("-c", "--cache-dir"):
+            cache_dir: str = arg
+        elif opt in ("-k", "--parse-cache"):
+            parse_cache_file: str = arg
+        elif opt in ("-s", "--snapshot"):
+            snapshot_file: str = arg
+        elif opt in ("-x", "--export-snapshot"):
+            export_snapshot_file: str = arg
+        elif opt == "--http-cache":
+            http_cache_dir: str = arg
+        elif opt == "--async":
+            use_async: bool = True
+        elif opt == "--journal":
+            journal_file: str = arg
+        elif opt == "--resume":
+            resume: bool = True
+        elif opt == "--metrics":
+            if arg not in ("json", "prometheus"):
+                show_usage()
+                sys.exit(2)
+            metrics_format: str = arg
+        elif opt == "--metrics-file":
+            metrics_file: str = arg
 
     used_providers: TerraformProviders = TerraformProviders()
 
+    metrics: Metrics = None
+    if metrics_format != "":
+        metrics = Metrics()
+
+    parse_cache: ParseCache = None
+    if parse_cache_file != "":
+        parse_cache = ParseCache(parse_cache_file, PARSER_VERSION)
+
+    journal: Journal = None
+    if journal_file != "":
+        journal = Journal(journal_file, resume)
+
     if local_path != "":
         source_base: str = local_path
-        sub_directories = os.listdir(source_base)
-        for sub_directory in sub_directories:
+        sub_directories: list = []
+        for sub_directory in sorted(os.listdir(source_base)):
             if sub_directory in excluded_repos:
                 info_msg: str = (
                     f"Skipping repository {sub_directory}, because it"
@@ -69,25 +329,24 @@ def main(argv):
                 logging.info(info_msg)
             else:
                 if len(process_repository) == 0 or sub_directory in process_repository:
-                    sub_directory_path = os.path.join(source_base, sub_directory)
-                    for root, dirs, files in os.walk(sub_directory_path):
-                        for filename in files:
-                            file_path: str = os.path.join(root, filename)
-                            if (
-                                file_path.find(".terragrunt-cache") == -1
-                                and file_path.find(".git") == -1
-                            ):
-                                if file_path.endswith(".tf"):
-                                    used_providers: TerraformProviders = (
-                                        parse_terraform_file(
-                                            sub_directory_path,
-                                            sub_directory,
-                                            file_path,
-                                            used_providers,
-                                        )
-                                    )
-                                else:
-                                    continue
+                    sub_directories.append(sub_directory)
+
+        def parse_local_directory(sub_directory: str) -> TerraformProviders:
+            with measure_phase(metrics, "parse"):
+                return parse_terraform_directory(
+                    os.path.join(source_base, sub_directory),
+                    sub_directory,
+                    TerraformProviders(),
+                    parse_cache,
+                )
+
+        def scan_local_directory(sub_directory: str) -> TerraformProviders:
+            return scan_with_journal(
+                journal, sub_directory, lambda: parse_local_directory(sub_directory)
+            )
+
+        for result in run_workers(scan_local_directory, sub_directories, workers):
+            used_providers.extend(result)
     else:
         token: str = os.environ.get("GITHUB_OAUTH2_TOKEN")
         if token is None:
@@ -97,12 +356,35 @@ GITHUB_OAUTH2_TOKEN environment variable."
             )
             logging.error("The script cannot continue and will now terminate.")
             sys.exit(3)
-        repo: Repo = Repo(token=token, owner=GITHUB_ORGANIZATION)
+        http_utils: HttpUtil = HttpUtil(
+            token, cache=ResponseCache(http_cache_dir), metrics=metrics
+        )
+        repo: Repo = Repo(token=token, owner=GITHUB_ORGANIZATION, http_utils=http_utils)
 
         if len(process_repository) == 0:
-            repo_list: list = repo.get_all_repos()
+            # listed lazily, so scanning starts as soon as the first page arrives
+            repo_iter = repo.iter_all_repos_metadata()
+        elif use_async:
+            try:
+                async_repo: AsyncRepo = AsyncRepo(
+                    token=token,
+                    owner=GITHUB_ORGANIZATION,
+                    http_utils=AsyncHttpUtil(token),
+                )
+            except ImportError as e:
+                logging.error(f"{e} Install the async extra, or leave out --async.")
+                sys.exit(2)
+            repo_iter: list = get_named_repos(async_repo, process_repository)
+            if None in repo_iter:
+                logging.error(
+                    "The script cannot continue because the Repository \
+                    specified using the -r parameter could not be found at Github."
+                )
+                sys.exit(4)
+            # the accessors of repo use the looked up data instead of fetching it
+            repo.seed_repo_metadata(repo_iter)
         else:
-            repo_list: list = []
+            repo_iter: list = []
             for github_repository in process_repository:
                 repo_exist: bool = repo.does_repo_exist(github_repository)
                 if repo_exist is False:
@@ -112,78 +394,58 @@ GITHUB_OAUTH2_TOKEN environment variable."
                     )
                     sys.exit(4)
                 else:
-                    repo_list.append(repo.get_repo(github_repository))
+                    repo_iter.extend(repo.get_repo(github_repository))
 
-        for repos in repo_list:
-            for r in repos:
-                name: str = r.get("name")
+        candidate_repos = select_candidate_repos(repo_iter, excluded_repos)
 
-                if name in excluded_repos:
-                    logging.info(
-                        f"Skipping repository {name}, because it has been explicitely excluded \
-                            using the -e parameter."
-                    )
-                else:
-                    is_archived: bool = r.get("archived", False)
-                    is_disabled: bool = r.get("disabled", False)
+        clone_cache: CloneCache = None
+        if cache_dir != "":
+            clone_cache = CloneCache(cache_dir)
 
-                    if is_archived:
-                        logging.info(
-                            f"Skipping repository {name}, \
-because this repo has been archived."
-                        )
-                    elif is_disabled:
-                        logging.info(
-                            f"Skipping repository {name}, \
-because this repo has been disabled."
-                        )
-                    else:
-                        repo_has_hcl = repo.does_repo_contain_hcl(name)
-                        if repo_has_hcl:
-                            logging.info(
-                                f"Performing Terraform provider \
-analysis on the repository {name}."
-                            )
-
-                            f = tempfile.TemporaryDirectory()
-
-                            repository_name: str = r.get("name")
-
-                            clone_url: str = r.get("clone_url")
-                            clone_command: str = f"git clone {clone_url} {f.name} -q"
-                            logging.info(
-                                "\tCreating a local Clone of the GitHub repository."
-                            )
-                            subprocess.run(clone_command.split(" "), shell=True)
-                            logging.info("\tClone complete.")
-
-                            source_base: str = f.name
-                            for root, dirs, files in os.walk(source_base):
-                                for filename in files:
-                                    file_path: str = os.path.join(root, filename)
-                                    if (
-                                        file_path.find(".terragrunt-cache") == -1
-                                        and file_path.find(".git") == -1
-                                    ):
-                                        if file_path.endswith(".tf"):
-                                            used_providers: TerraformProviders = (
-                                                parse_terraform_file(
-                                                    f.name,
-                                                    repository_name,
-                                                    file_path,
-                                                    used_providers,
-                                                )
-                                            )
-                                        else:
-                                            continue
-                        else:
-                            logging.info(
-                                f"Skipping Terraform provider analysis \
-on the repository {name} because it does not \
-contain HCL code."
-                            )
+        def scan_github_repository(r: dict) -> TerraformProviders:
+            return scan_with_journal(
+                journal,
+                r.get("name"),
+                lambda: scan_repository(repo, r, fetch_mode, clone_cache, parse_cache),
+            )
+
+        try:
+            for result in run_workers(scan_github_repository, candidate_repos, workers):
+                used_providers.extend(result)
+        except GitHubApiError as e:
+            # an empty report would look like an organization without repositories
+            logging.error(f"Listing the repositories failed: {e}")
+            logging.error("The script cannot continue and will now terminate.")
+            sys.exit(5)
+
+        logging.info(f"GitHub API usage: {REQUEST_STATS.as_dict()}")
+
+    if parse_cache is not None:
+        parse_cache.close()
+
+    if journal is not None:
+        journal.close()
+
+    if export_snapshot_file != "":
+        if os.path.isfile(export_snapshot_file):
+            snapshot: RegistrySnapshot = RegistrySnapshot.load(export_snapshot_file)
+        else:
+            snapshot: RegistrySnapshot = RegistrySnapshot()
+        with measure_phase(metrics, "registry_lookup"):
+            snapshot.update(
+                used_providers.get_provider_names(), get_default_registry_client()
+            )
+        snapshot.save(export_snapshot_file)
+        logging.info(f"The registry snapshot was written to {export_snapshot_file}.")
+
+    with measure_phase(metrics, "registry_lookup"):
+        if snapshot_file != "":
+            used_providers.get_latest_versions(RegistrySnapshot.load(snapshot_file))
+        else:
+            used_providers.get_latest_versions()
 
-    used_providers.get_latest_versions()
+    if metrics is not None:
+        metrics.write(metrics_format, metrics_file)
 
     if output_format == "csv":
         out_str: str = (
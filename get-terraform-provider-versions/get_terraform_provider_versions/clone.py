@@ -0,0 +1,231 @@
+import os
+import json
+import shutil
+import logging
+import threading
+import subprocess
+
+FETCH_MODE_FULL = "full"
+FETCH_MODE_SPARSE = "sparse"
+FETCH_MODES: list = [FETCH_MODE_FULL, FETCH_MODE_SPARSE]
+
+# the only paths we need from a repository to find the used providers
+SPARSE_PATTERNS: list = ["*.tf", "*.tf.json"]
+# the refs kept in a cached mirror; pull request refs are often much larger
+MIRROR_REFSPEC = "+refs/heads/*:refs/heads/*"
+
+
+class CloneError(Exception):
+    """
+    Raised when a local copy of a repository could not be created.
+    """
+
+
+def _run_git(arguments: list) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["git"] + arguments, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+
+
+def _empty_directory(path: str) -> None:
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        return
+    for entry in os.listdir(path):
+        entry_path: str = os.path.join(path, entry)
+        if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+            shutil.rmtree(entry_path)
+        else:
+            os.remove(entry_path)
+
+
+def full_clone(clone_url: str, destination: str) -> bool:
+    """
+    Clone the whole history of a repository.
+    """
+    result = _run_git(["clone", "-q", clone_url, destination])
+    if result.returncode != 0:
+        logging.error(f"\tCloning {clone_url} failed: {result.stderr.strip()}")
+        return False
+    return True
+
+
+def sparse_clone(clone_url: str, destination: str) -> bool:
+    """
+    Clone the tip of the default branch without any file contents, and then
+    check out only the Terraform files.  Blobs for all other paths are never
+    transferred when the server supports partial clone.
+    """
+    result = _run_git(
+        [
+            "clone",
+            "-q",
+            "--depth",
+            "1",
+            "--filter=blob:none",
+            "--no-checkout",
+            clone_url,
+            destination,
+        ]
+    )
+    if result.returncode != 0:
+        return False
+    if "filtering not recognized by server" in result.stderr:
+        logging.info(
+            f"\tThe server for {clone_url} does not support partial clone, "
+            "so all blobs of the latest commit have been fetched."
+        )
+    return sparse_checkout(destination)
+
+
+def sparse_checkout(destination: str) -> bool:
+    """
+    Check out only the Terraform files of a clone made with --no-checkout.
+    """
+    # write the patterns directly rather than using 'git sparse-checkout set',
+    # as its pattern syntax defaults differ between git versions
+    result = _run_git(["-C", destination, "config", "core.sparseCheckout", "true"])
+    if result.returncode != 0:
+        return False
+    git_dir: str = os.path.join(destination, ".git")
+    os.makedirs(os.path.join(git_dir, "info"), exist_ok=True)
+    with open(os.path.join(git_dir, "info", "sparse-checkout"), "w") as writer:
+        writer.write("\n".join(SPARSE_PATTERNS) + "\n")
+
+    result = _run_git(["-C", destination, "checkout", "-q"])
+    return result.returncode == 0
+
+
+def clone_repository(
+    clone_url: str, destination: str, fetch_mode: str = FETCH_MODE_FULL
+) -> None:
+    """
+    Create a local copy of a repository that can be parsed for providers.
+    :param clone_url: The URL to clone the repository from.
+    :param destination: An empty folder to clone the repository into.
+    :param fetch_mode: Either 'full' or 'sparse'.  A sparse fetch falls back to
+    a full clone if the server refuses it.
+    :raises CloneError: If the repository could not be cloned.
+    """
+    if fetch_mode == FETCH_MODE_SPARSE:
+        if sparse_clone(clone_url, destination):
+            return
+        logging.info(
+            f"\tSparse clone of {clone_url} failed, falling back to a full clone."
+        )
+        _empty_directory(destination)
+    if not full_clone(clone_url, destination):
+        raise CloneError(f"Cloning {clone_url} failed.")
+
+
+class CloneCache:
+    """
+    This class defines an on-disk cache of bare mirrors of the branches of the
+    repositories.  A mirror is only fetched from the server when the pushed_at
+    timestamp reported by GitHub has changed since it was last fetched.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self._lock: threading.Lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index: dict = {}
+        index_path: str = os.path.join(cache_dir, self.INDEX_FILE)
+        if os.path.isfile(index_path):
+            with open(index_path, "r") as reader:
+                self.index = json.load(reader)
+
+    def _save_index(self) -> None:
+        index_path: str = os.path.join(self.cache_dir, self.INDEX_FILE)
+        temp_path: str = f"{index_path}.tmp"
+        with open(temp_path, "w") as writer:
+            json.dump(self.index, writer, indent=1, sort_keys=True)
+        os.replace(temp_path, index_path)
+
+    def update_mirror(self, name: str, clone_url: str, pushed_at: str = None) -> str:
+        """
+        Make sure the mirror of a repository is up to date.
+        :param name: The repository name, used as the name of the mirror.
+        :param clone_url: The URL to fetch the repository from.
+        :param pushed_at: The time of the last push to the repository.  If it
+        is None the mirror is always fetched.
+        :return: The path to the mirror, or None if it could not be fetched.
+        """
+        mirror_path: str = os.path.join(self.cache_dir, f"{name}.git")
+        with self._lock:
+            cached_pushed_at: str = self.index.get(name)
+
+        if os.path.isdir(mirror_path):
+            if pushed_at is not None and cached_pushed_at == pushed_at:
+                logging.info(f"\tThe cached mirror of {name} is up to date.")
+                return mirror_path
+            logging.info(f"\tFetching changes into the cached mirror of {name}.")
+            # the refspec is given explicitly, so mirrors created with --mirror by
+            # earlier versions stop fetching the pull request refs as well
+            result = _run_git(
+                ["--git-dir", mirror_path, "fetch", "-q", "--prune", "origin"]
+                + [MIRROR_REFSPEC]
+            )
+        else:
+            logging.info(f"\tCreating a cached mirror of {name}.")
+            # unlike --mirror, a bare clone only fetches the branches and tags
+            result = _run_git(["clone", "-q", "--bare", clone_url, mirror_path])
+            if result.returncode == 0:
+                result = _run_git(
+                    ["--git-dir", mirror_path, "config", "remote.origin.fetch"]
+                    + [MIRROR_REFSPEC]
+                )
+
+        if result.returncode != 0:
+            logging.error(
+                f"\tUpdating the mirror of {name} failed: {result.stderr.strip()}"
+            )
+            return None
+
+        with self._lock:
+            if pushed_at is None:
+                self.index.pop(name, None)
+            else:
+                self.index[name] = pushed_at
+            self._save_index()
+        return mirror_path
+
+    def clone_repository(
+        self,
+        name: str,
+        clone_url: str,
+        destination: str,
+        pushed_at: str = None,
+        fetch_mode: str = FETCH_MODE_FULL,
+    ) -> None:
+        """
+        Create a local copy of a repository from its cached mirror, fetching
+        the mirror first if the repository has been pushed to since.
+        :param name: The repository name.
+        :param clone_url: The URL to fetch the repository from.
+        :param destination: An empty folder to clone the repository into.
+        :param pushed_at: The time of the last push to the repository.
+        :param fetch_mode: With 'sparse' only the Terraform files are checked out.
+        A sparse checkout falls back to a full checkout if it fails.
+        :raises CloneError: If the repository could not be cloned.
+        """
+        mirror_path: str = self.update_mirror(name, clone_url, pushed_at)
+        if mirror_path is None:
+            raise CloneError(f"Updating the mirror of {name} failed.")
+        # --shared borrows the objects of the mirror, so nothing is copied
+        arguments: list = ["clone", "-q", "--shared", mirror_path, destination]
+        if fetch_mode == FETCH_MODE_SPARSE:
+            result = _run_git(arguments[:2] + ["--no-checkout"] + arguments[2:])
+            if result.returncode == 0 and sparse_checkout(destination):
+                return
+            logging.info(
+                f"\tSparse checkout of {name} failed, falling back to a full checkout."
+            )
+            _empty_directory(destination)
+        result = _run_git(arguments)
+        if result.returncode != 0:
+            raise CloneError(
+                f"Cloning the mirror of {name} failed: {result.stderr.strip()}"
+            )
@@ -1,9 +1,25 @@
 import re
+import os
 import logging
+import time
+import threading
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-TFREGISTRY_BASEAPI = "https://registry.terraform.io/v1/providers/"
+from requests.adapters import HTTPAdapter
+
+from get_terraform_provider_versions.hcl import (
+    find_required_providers,
+    find_required_providers_json,
+)
+from get_terraform_provider_versions.parse_cache import ParseCache, git_blob_sha
+
+TFREGISTRY_BASEAPI = os.environ.get(
+    "TFREGISTRY_BASEAPI", "https://registry.terraform.io/v1/providers/"
+)
+# increase when a change to the parser alters its results, to invalidate caches
+PARSER_VERSION = 2
 
 
 # define a custom class to hold the providers we locate
@@ -28,6 +44,41 @@ class TerraformProvider:
         self.latest_provider_version = latest_provider_version
         self.comment = comment
 
+    def set_latest_version(self, latest_provider_version: str):
+        """
+        Record the latest available version and comment on how it relates to
+        the version used.
+        """
+        self.latest_provider_version = latest_provider_version
+        if re.search("^>=", self.provider_version) or self.provider_version == "Latest":
+            self.comment = "Latest version will be used."
+        if re.search("^~>", self.provider_version):
+            locked_version = (
+                self.provider_version.replace("~>", "").strip(" ").split(".")
+            )
+            latest_version = self.latest_provider_version.split(".")
+            # a constraint such as "~> 3.0" leaves out the patch version
+            locked_version += ["0"] * (3 - len(locked_version))
+            latest_version += ["0"] * (3 - len(latest_version))
+            if (
+                locked_version[0] == latest_version[0]
+                and locked_version[1] == latest_version[1]
+                and locked_version[2] == latest_version[2]
+            ):
+                self.comment = "Latest version will be used."
+            else:
+                if (
+                    locked_version[0] == latest_version[0]
+                    and locked_version[1] == latest_version[1]
+                    and locked_version[2] != latest_version[2]
+                ):
+                    self.comment = "Patch update only."
+                else:
+                    if locked_version[1] != latest_version[1]:
+                        self.comment = "Minor version update available."
+                    if locked_version[0] != latest_version[0]:
+                        self.comment = "Major version update available."
+
 
 class TerraformProviders:
     """
@@ -36,12 +87,21 @@ class TerraformProviders:
 
     def __init__(self):
         self.terraform_providers: list = []
+        self._lock: threading.Lock = threading.Lock()
 
     def __iter__(self):
         return iter(self.terraform_providers)
 
     def append(self, new_item):
-        self.terraform_providers.append(new_item)
+        with self._lock:
+            self.terraform_providers.append(new_item)
+
+    def extend(self, other):
+        """
+        Merge the elements of another collection into this one, keeping their order.
+        """
+        with self._lock:
+            self.terraform_providers.extend(other)
 
     def count(self):
         return len(self.terraform_providers)
@@ -56,106 +116,238 @@ class TerraformProviders:
         json_string = json_string.strip(",") + "]"
         return json_string
 
-    def get_latest_versions(self):
+    def get_provider_names(self) -> list:
+        """
+        Get the distinct provider names used by the elements in the collection.
+        """
+        return sorted({provider.provider_name for provider in self.terraform_providers})
+
+    def get_latest_versions(self, registry_client: "RegistryClient" = None):
         """
         Retrieve the latest Provider versions for the elements in the collection
-        from the Terraform Registry.
+        from the Terraform Registry.  Each distinct provider name is only looked
+        up once.
+        :param registry_client: The client to look up versions with.  This can also
+        be a RegistrySnapshot to avoid any network calls.
         """
+        if registry_client is None:
+            registry_client = get_default_registry_client()
+        latest_versions: dict = registry_client.get_latest_versions(
+            self.get_provider_names()
+        )
         for provider in self.terraform_providers:
-            query_url: str = f"{TFREGISTRY_BASEAPI}{provider.provider_name}"
-            resp = requests.get(query_url)
-            if resp.status_code != 200:
+            latest_provider_version: str = latest_versions.get(provider.provider_name)
+            if latest_provider_version is not None:
+                provider.set_latest_version(latest_provider_version)
+
+
+class RegistryClient:
+    """
+    This class defines a client for looking up the latest provider versions in
+    the Terraform Registry.  Lookups are made concurrently over a pooled session
+    and the results are kept in a cache for a limited time.
+    """
+
+    def __init__(
+        self,
+        base_url: str = TFREGISTRY_BASEAPI,
+        workers: int = 8,
+        ttl: int = 3600,
+    ):
+        self.base_url = base_url
+        self.workers = workers
+        self.ttl = ttl
+        self._cache: dict = {}
+        self._lock: threading.Lock = threading.Lock()
+        self.session: requests.Session = requests.Session()
+        adapter: HTTPAdapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(workers, 1)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _get_cached_version(self, provider_name: str) -> str:
+        with self._lock:
+            cached: tuple = self._cache.get(provider_name)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        return None
+
+    def get_latest_version(self, provider_name: str) -> str:
+        """
+        Get the latest version of a provider, or None if it could not be found.
+        """
+        latest_provider_version: str = self._get_cached_version(provider_name)
+        if latest_provider_version is not None:
+            return latest_provider_version
+
+        query_url: str = f"{self.base_url}{provider_name}"
+        resp = self.session.get(query_url)
+        if resp.status_code != 200:
+            logging.error(
+                f"RestAPI call to {query_url} returned HTTP status \
+                {resp.status_code}"
+            )
+            return None
+        latest_provider_version = resp.json()["version"].strip()
+        with self._lock:
+            self._cache[provider_name] = (
+                time.monotonic() + self.ttl,
+                latest_provider_version,
+            )
+        return latest_provider_version
+
+    def get_latest_versions(self, provider_names: list) -> dict:
+        """
+        Get the latest version of each distinct provider name.
+        :return: A dictionary of provider names and their latest versions.
+        Providers that could not be found are left out.
+        """
+        distinct_names: list = sorted(set(provider_names))
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            latest_versions: list = list(
+                executor.map(self.get_latest_version, distinct_names)
+            )
+        return {
+            provider_name: latest_version
+            for provider_name, latest_version in zip(distinct_names, latest_versions)
+            if latest_version is not None
+        }
+
+
+class RegistrySnapshot:
+    """
+    This class defines a local snapshot of the latest provider versions from
+    the Terraform Registry.  It can be used in place of a RegistryClient to
+    resolve versions without any network calls.
+    """
+
+    def __init__(self, latest_versions: dict = None):
+        self.latest_versions: dict = dict(latest_versions or {})
+
+    @classmethod
+    def load(cls, path: str) -> "RegistrySnapshot":
+        """
+        Load a snapshot from a JSON file created by save().
+        """
+        with open(path, "r") as reader:
+            data: dict = json.load(reader)
+        return cls(data.get("providers", {}))
+
+    def save(self, path: str):
+        """
+        Write the snapshot to a JSON file.
+        """
+        data: dict = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "providers": dict(sorted(self.latest_versions.items())),
+        }
+        with open(path, "w") as writer:
+            json.dump(data, writer, indent=2)
+            writer.write("\n")
+
+    def update(self, provider_names: list, registry_client: RegistryClient):
+        """
+        Add the latest versions of the given providers from the Terraform Registry.
+        """
+        self.latest_versions.update(registry_client.get_latest_versions(provider_names))
+
+    def get_latest_versions(self, provider_names: list) -> dict:
+        """
+        Get the latest version of each distinct provider name from the snapshot.
+        :return: A dictionary of provider names and their latest versions.
+        Providers that are not in the snapshot are left out.
+        """
+        latest_versions: dict = {}
+        for provider_name in sorted(set(provider_names)):
+            if provider_name in self.latest_versions:
+                latest_versions[provider_name] = self.latest_versions[provider_name]
+            else:
                 logging.error(
-                    f"RestAPI call to {query_url} returned HTTP status \
-                    {resp.status_code}"
+                    f"The provider {provider_name} is not in the registry snapshot."
                 )
-            else:
-                latest_provider_version: str = resp.json()["version"].strip()
-                provider.latest_provider_version = latest_provider_version
-                if (
-                    re.search("^>=", provider.provider_version)
-                    or provider.provider_version == "Latest"
-                ):
-                    provider.comment = "Latest version will be used."
-                if re.search("^~>", provider.provider_version):
-                    locked_version = (
-                        provider.provider_version.replace("~>", "")
-                        .strip(" ")
-                        .split(".")
-                    )
-                    latest_version = provider.latest_provider_version.split(".")
-                    if (
-                        locked_version[0] == latest_version[0]
-                        and locked_version[1] == latest_version[1]
-                        and locked_version[2] == latest_version[2]
-                    ):
-                        provider.comment = "Latest version will be used."
-                    else:
-                        if (
-                            locked_version[0] == latest_version[0]
-                            and locked_version[1] == latest_version[1]
-                            and locked_version[2] != latest_version[2]
-                        ):
-                            provider.comment = "Patch update only."
-                        else:
-                            if locked_version[1] != latest_version[1]:
-                                provider.comment = "Minor version update available."
-                            if locked_version[0] != latest_version[0]:
-                                provider.comment = "Major version update available."
-
-
-# function to parse .tf files for provider versions
+        return latest_versions
+
+
+_default_registry_client: RegistryClient = None
+
+
+def get_default_registry_client() -> RegistryClient:
+    """
+    Get a client that is shared by the whole process, so its cache is reused.
+    """
+    global _default_registry_client
+    if _default_registry_client is None:
+        _default_registry_client = RegistryClient()
+    return _default_registry_client
+
+
+# function to parse .tf and .tf.json files for provider versions
 def parse_terraform_file(
     temp_folder: str,
     repository_name: str,
     file_path: str,
     used_providers: TerraformProviders,
+    parse_cache: ParseCache = None,
 ) -> TerraformProviders:
 
-    logging.info(f"\tParsing the Terraform file {file_path}.")
-
-    provider_matching: bool = False
-    brace_count: int = 0
-    current_provider_name: str = ""
-    current_provider_version: str = ""
-
-    with open(file_path, "r") as reader:
-
-        for line in reader:
-            current_line: str = line.strip()
-            # print(current_line)
-            if provider_matching:
-                if current_line.find("{") > -1:
-                    brace_count = brace_count + (current_line.count("{"))
-                if current_line.find("}") > -1:
-                    brace_count = brace_count - (current_line.count("}"))
-                if brace_count <= 0:
-                    provider_matching = False
-                    break
-                if re.search('^source *= *".*"', current_line.strip()):
-                    current_provider_name = (
-                        current_line.split("=")[1].replace('"', "").strip()
-                    )
-                if re.search('^version *= *".*"', current_line.strip()):
-                    current_provider_version = (
-                        current_line[current_line.find("=") + 1 :]
-                        .replace('"', "")
-                        .strip()
-                    )
-                if re.search("}", current_line):
-                    if current_provider_version == "":
-                        current_provider_version = "Latest"
-                    new_used_provider = TerraformProvider(
+    with open(file_path, "rb") as reader:
+        content: bytes = reader.read()
+
+    found_providers: list = None
+    blob_sha: str = ""
+    if parse_cache is not None:
+        blob_sha = git_blob_sha(content)
+        found_providers = parse_cache.get(blob_sha)
+
+    if found_providers is None:
+        logging.info(f"\tParsing the Terraform file {file_path}.")
+        text: str = content.decode("utf-8", errors="replace")
+        if file_path.endswith(".tf.json"):
+            found_providers = find_required_providers_json(text)
+        else:
+            found_providers = find_required_providers(text)
+        if parse_cache is not None:
+            parse_cache.put(blob_sha, found_providers)
+    else:
+        logging.info(f"\tUsing the cached result for the Terraform file {file_path}.")
+
+    for provider_name, provider_version in found_providers:
+        new_used_provider = TerraformProvider(
+            repository_name,
+            file_path.replace(temp_folder, ""),
+            provider_name,
+            provider_version,
+        )
+        used_providers.append(new_used_provider)
+    return used_providers
+
+
+# function to parse all .tf and .tf.json files found below a folder
+def parse_terraform_directory(
+    source_base: str,
+    repository_name: str,
+    used_providers: TerraformProviders,
+    parse_cache: ParseCache = None,
+) -> TerraformProviders:
+
+    for root, dirs, files in os.walk(source_base):
+        # walk in a stable order so the output does not depend on the file system
+        dirs.sort()
+        for filename in sorted(files):
+            file_path: str = os.path.join(root, filename)
+            if (
+                file_path.find(".terragrunt-cache") == -1
+                and file_path.find(".git") == -1
+            ):
+                if file_path.endswith(".tf") or file_path.endswith(".tf.json"):
+                    used_providers = parse_terraform_file(
+                        source_base,
                         repository_name,
-                        file_path.replace(temp_folder, ""),
-                        current_provider_name,
-                        current_provider_version,
+                        file_path,
+                        used_providers,
+                        parse_cache,
                     )
-                    used_providers.append(new_used_provider)
-            if current_line.startswith("#") is False:
-                if re.search("required_providers", current_line):
-                    provider_matching = True
-                    brace_count = brace_count + (current_line.count("{"))
     return used_providers
 
 
@@ -191,6 +383,68 @@ All parameters are optional
         coding to be applied. If you don \'t want the colour then use this flag
         with a value of True.
 
+     -w <number of workers>
+        The number of repositories to detect, clone and parse concurrently.
+        The default is 1, which processes one repository at a time.  The
+        output order is the same regardless of the number of workers.
+
+     -f <fetch mode>
+        Specify full or sparse.  A full fetch clones the whole history of each
+        repository and is the default.  A sparse fetch clones only the latest
+        commit and only checks out *.tf and *.tf.json files.  If the server
+        does not support partial clone, all files of the latest commit are
+        fetched, but still only the Terraform files are checked out.  If the
+        sparse clone fails, a full clone is made instead.  A repository that
+        cannot be cloned at all is logged as an error and skipped.
+
+     -c <cache directory>
+        Keep bare mirrors of the repositories in this folder between runs.  A
+        mirror is only fetched again when the repository has been pushed to
+        since the previous run.
+
+     -k <parse cache file>
+        Keep the providers found in each Terraform file in this SQLite file,
+        keyed by the git blob SHA of the file.  Files whose content has not
+        changed since a previous run are not parsed again.
+
+     -s <registry snapshot file>
+        Resolve the latest provider versions from a snapshot file created with
+        the -x parameter, instead of querying the Terraform Registry.  No
+        network calls are made to the registry.
+
+     -x <registry snapshot file>
+        Write the latest versions of the providers found to a snapshot file
+        that can later be used with the -s parameter.  Providers already in an
+        existing snapshot file are kept.
+
+     --http-cache <directory>
+        Keep GitHub API responses in this directory between runs.  They are
+        revalidated with their ETag, so unchanged resources are neither
+        downloaded again nor counted against the rate limit.
+
+     --async
+        Look up the repositories given with -r concurrently, instead of one
+        after the other.  Requires the async extra, which installs httpx.
+
+     --journal <journal file>
+        Record each repository in this file as soon as it has been scanned,
+        together with the providers found in it.
+
+     --resume
+        Continue an interrupted run from the file given with --journal.
+        Repositories recorded in it are not scanned again.  Without this
+        parameter an existing journal is started afresh.
+
+     --metrics <metrics format>
+        Specify json or prometheus to report metrics at the end of the run:
+        the calls, latency histogram and bytes transferred per GitHub API
+        endpoint, the rate limit headroom, and the time spent listing,
+        detecting HCL, cloning, parsing and looking up the registry.  Phases
+        running in several workers are all counted.
+
+     --metrics-file <file>
+        Write the metrics to this file instead of to stderr.
+
      -h
         Display this help information."""
     print(out_str)
@@ -0,0 +1,281 @@
+import re
+import json
+
+# Tokens of the HCL native syntax.  Comments and heredocs are matched as whole
+# tokens, so braces inside them are never counted.  Runs of characters that
+# cannot start any other token (identifiers, numbers, operators) are matched as
+# a single 'word' token to keep the number of tokens per line low.
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<space>\s+)
+    | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+    | (?P<heredoc><<-?[ \t]*(?P<tag>[A-Za-z_][\w-]*)[ \t]*\r?\n
+        (?:.*?\n)??[ \t]*(?P=tag)[ \t]*$)
+    | (?P<string>"(?:[^"\\$%\n]|\\.|[$%](?!\{))*")
+    | (?P<template>")
+    | (?P<punctuation>[{}\[\]()=,:])
+    | (?P<word>[^\s{}\[\]()=,:"\#/<]+|[/<])
+    """,
+    re.VERBOSE | re.DOTALL | re.MULTILINE,
+)
+_ESCAPE_PATTERN = re.compile(r"\\(.)")
+
+_OPENING: dict = {"{": "}", "[": "]", "(": ")"}
+
+
+def _skip_template(text: str, position: int) -> int:
+    """
+    Find the end of a quoted template that contains ${...} or %{...}
+    sequences, which may themselves contain quoted strings and braces.
+    :param position: The position just after the opening quote.
+    :return: The position just after the closing quote.
+    """
+    length: int = len(text)
+    while position < length:
+        character: str = text[position]
+        if character == "\\":
+            position += 2
+        elif character == '"':
+            return position + 1
+        elif character in "$%" and text.startswith(character + "{", position + 1):
+            # $${ and %%{ are escapes for a literal ${ and %{
+            position += 3
+        elif character in "$%" and text.startswith("{", position + 1):
+            depth: int = 1
+            position += 2
+            while position < length and depth > 0:
+                character = text[position]
+                if character == '"':
+                    position = _skip_template(text, position + 1)
+                    continue
+                if character == "{":
+                    depth += 1
+                elif character == "}":
+                    depth -= 1
+                position += 1
+        else:
+            position += 1
+    return length
+
+
+def tokenize(text: str) -> list:
+    """
+    Split HCL source into a list of (kind, value) tokens, leaving out
+    whitespace and comments.  Kinds are 'string', 'punctuation', 'word' and
+    'heredoc'.  Quoted templates with interpolations are returned as 'string'
+    tokens holding the raw template.
+    """
+    tokens: list = []
+    append = tokens.append
+    position: int = 0
+    length: int = len(text)
+    match = _TOKEN_PATTERN.match
+    while position < length:
+        # every character can start a token, so this always matches
+        token = match(text, position)
+        kind: str = token.lastgroup
+        if kind == "template":
+            end: int = _skip_template(text, position + 1)
+            append(("string", text[position:end]))
+            position = end
+            continue
+        if kind != "space" and kind != "comment":
+            append((kind, token.group()))
+        position = token.end()
+    return tokens
+
+
+def _string_value(token: tuple) -> str:
+    kind, value = token
+    if kind == "string":
+        return _ESCAPE_PATTERN.sub(r"\1", value[1:-1])
+    return value
+
+
+def _skip_value(tokens: list, index: int) -> int:
+    """
+    Skip a single expression value, including any nested brackets.
+    :return: The index of the first token after the value.
+    """
+    if index >= len(tokens):
+        return index
+    kind, value = tokens[index]
+    if kind != "punctuation" or value not in _OPENING:
+        return index + 1
+    depth: int = 0
+    while index < len(tokens):
+        kind, value = tokens[index]
+        index += 1
+        if kind == "punctuation":
+            if value in _OPENING:
+                depth += 1
+            elif value in "}])":
+                depth -= 1
+                if depth == 0:
+                    break
+    return index
+
+
+def _parse_provider_object(tokens: list, index: int) -> tuple:
+    """
+    Parse an object such as { source = "hashicorp/aws", version = "~> 3.0" }.
+    :param index: The index of the opening brace.
+    :return: A tuple of the source, the version and the index after the object.
+    """
+    source: str = ""
+    version: str = ""
+    index += 1
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if kind == "punctuation" and value == "}":
+            return source, version, index + 1
+        if kind == "punctuation" and value == ",":
+            index += 1
+            continue
+        if (
+            index + 2 < len(tokens)
+            and tokens[index + 1][0] == "punctuation"
+            and tokens[index + 1][1] in "=:"
+        ):
+            key: str = _string_value(tokens[index])
+            value_token: tuple = tokens[index + 2]
+            if value_token[0] == "string":
+                if key == "source":
+                    source = _string_value(value_token)
+                elif key == "version":
+                    version = _string_value(value_token)
+            index = _skip_value(tokens, index + 2)
+        else:
+            index = _skip_value(tokens, index)
+    return source, version, index
+
+
+def _parse_required_providers(tokens: list, index: int, found_providers: list) -> int:
+    """
+    Parse the body of a required_providers block.
+    :param index: The index of the opening brace.
+    :return: The index after the closing brace.
+    """
+    index += 1
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if kind == "punctuation" and value == "}":
+            return index + 1
+        if kind == "punctuation" and value == ",":
+            index += 1
+            continue
+        if (
+            index + 2 < len(tokens)
+            and tokens[index + 1][0] == "punctuation"
+            and tokens[index + 1][1] in "=:"
+        ):
+            local_name: str = _string_value(tokens[index])
+            value_token: tuple = tokens[index + 2]
+            source: str = ""
+            version: str = ""
+            if value_token == ("punctuation", "{"):
+                source, version, index = _parse_provider_object(tokens, index + 2)
+            else:
+                # the pre 0.13 syntax, where the value is only a version constraint
+                if value_token[0] == "string":
+                    version = _string_value(value_token)
+                index = _skip_value(tokens, index + 2)
+            if source == "":
+                # the implied source address when none is given
+                source = f"hashicorp/{local_name}"
+            if version == "":
+                version = "Latest"
+            found_providers.append((source, version))
+        else:
+            index = _skip_value(tokens, index)
+    return index
+
+
+def _parse_terraform_block(tokens: list, index: int, found_providers: list) -> int:
+    """
+    Parse the body of a terraform block, looking for required_providers blocks.
+    :param index: The index of the opening brace.
+    :return: The index after the closing brace.
+    """
+    index += 1
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if kind == "punctuation" and value == "}":
+            return index + 1
+        if (
+            kind == "word"
+            and value == "required_providers"
+            and index + 1 < len(tokens)
+            and tokens[index + 1] == ("punctuation", "{")
+        ):
+            index = _parse_required_providers(tokens, index + 1, found_providers)
+        else:
+            index = _skip_value(tokens, index)
+    return index
+
+
+def find_required_providers(text: str) -> list:
+    """
+    Find the providers declared in the required_providers blocks of all
+    terraform blocks in a file written in the HCL native syntax.
+    :param text: The content of a .tf file.
+    :return: A list of (source, version) tuples, in the order they are declared.
+    """
+    found_providers: list = []
+    # most files do not declare any providers, so avoid tokenizing those
+    if "required_providers" not in text:
+        return found_providers
+    tokens: list = tokenize(text)
+    index: int = 0
+    while index < len(tokens):
+        if (
+            tokens[index] == ("word", "terraform")
+            and index + 1 < len(tokens)
+            and tokens[index + 1] == ("punctuation", "{")
+        ):
+            index = _parse_terraform_block(tokens, index + 1, found_providers)
+        else:
+            index = _skip_value(tokens, index)
+    return found_providers
+
+
+def find_required_providers_json(text: str) -> list:
+    """
+    Find the providers declared in a file written in the JSON syntax.
+    :param text: The content of a .tf.json file.
+    :return: A list of (source, version) tuples, in the order they are declared.
+    """
+    found_providers: list = []
+    if "required_providers" not in text:
+        return found_providers
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return found_providers
+    if not isinstance(data, dict):
+        return found_providers
+
+    # blocks may be given either as an object or as a list of objects
+    def as_list(value) -> list:
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, dict)]
+        if isinstance(value, dict):
+            return [value]
+        return []
+
+    for terraform_block in as_list(data.get("terraform")):
+        for required_providers in as_list(terraform_block.get("required_providers")):
+            for local_name, requirement in required_providers.items():
+                source: str = ""
+                version: str = ""
+                if isinstance(requirement, dict):
+                    source = requirement.get("source", "")
+                    version = requirement.get("version", "")
+                elif isinstance(requirement, str):
+                    version = requirement
+                if source == "":
+                    source = f"hashicorp/{local_name}"
+                if version == "":
+                    version = "Latest"
+                found_providers.append((source, version))
+    return found_providers
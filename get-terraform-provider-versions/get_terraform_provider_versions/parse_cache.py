@@ -0,0 +1,75 @@
+import json
+import hashlib
+import sqlite3
+import threading
+
+
+def git_blob_sha(content: bytes) -> str:
+    """
+    Calculate the SHA that git uses to identify a blob with the given content,
+    i.e. the same value as 'git hash-object' would return.
+    """
+    header: bytes = f"blob {len(content)}\0".encode()
+    return hashlib.sha1(header + content).hexdigest()
+
+
+class ParseCache:
+    """
+    This class defines a persistent cache of the providers found in
+    Terraform files, keyed by the git blob SHA of the file content.
+    """
+
+    # commit after this many new entries, so an interrupted run keeps most of them
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, path: str, parser_version: int = 1):
+        """
+        :param path: The SQLite file to keep the cache in.
+        :param parser_version: Entries stored by another version of the parser
+        are ignored, so a change to the parser invalidates the cache.
+        """
+        self._lock: threading.Lock = threading.Lock()
+        self._pending: int = 0
+        self.parser_version: int = parser_version
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS parsed_files (blob_sha TEXT NOT NULL, "
+            "parser_version INTEGER NOT NULL, providers TEXT NOT NULL, "
+            "PRIMARY KEY (blob_sha, parser_version))"
+        )
+        self.connection.commit()
+
+    def get(self, blob_sha: str) -> list:
+        """
+        Get the providers found in a file, as a list of (name, version) tuples,
+        or None if the file has not been parsed before.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT providers FROM parsed_files "
+                "WHERE blob_sha = ? AND parser_version = ?",
+                (blob_sha, self.parser_version),
+            ).fetchone()
+        if row is None:
+            return None
+        return [tuple(provider) for provider in json.loads(row[0])]
+
+    def put(self, blob_sha: str, providers: list) -> None:
+        """
+        Store the providers found in a file, as a list of (name, version) tuples.
+        """
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO parsed_files "
+                "(blob_sha, parser_version, providers) VALUES (?, ?, ?)",
+                (blob_sha, self.parser_version, json.dumps(providers)),
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self.connection.commit()
+                self._pending = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self.connection.commit()
+            self.connection.close()
@@ -1,5 +1,823 @@
+import asyncio
+import email.utils
+import functools
+import itertools
+import json
+import os
+import re
+import subprocess
+import time
+
+import httpx
+import pytest
+import requests
+
+import get_provider_versions
+from get_provider_versions import (
+    QUEUED_ITEMS_PER_WORKER,
+    main,
+    run_workers,
+    scan_repository,
+    scan_with_journal,
+)
 from get_terraform_provider_versions import __version__
+from get_terraform_provider_versions.clone import (
+    FETCH_MODE_SPARSE,
+    CloneCache,
+    CloneError,
+    clone_repository,
+)
+from get_terraform_provider_versions import get_tf_provider_versions
+from get_terraform_provider_versions.get_tf_provider_versions import (
+    RegistryClient,
+    RegistrySnapshot,
+    TerraformProviders,
+    parse_terraform_directory,
+)
+from get_terraform_provider_versions.hcl import (
+    find_required_providers,
+    find_required_providers_json,
+)
+from get_terraform_provider_versions.journal import Journal
+from get_terraform_provider_versions.parse_cache import ParseCache, git_blob_sha
+import github.repo
+from github.repo import (
+    AsyncHttpUtil,
+    AsyncRepo,
+    GitHubApiError,
+    HttpUtil,
+    Metrics,
+    Repo,
+    ResponseCache,
+)
 
 
 def test_version():
     assert __version__ == "0.1.0"
+
+
+def test_parse_cache_is_keyed_on_blob_sha_and_parser_version(tmp_path):
+    content: bytes = b"terraform {\n}\n"
+    blob_sha: str = git_blob_sha(content)
+    assert blob_sha == "ca88e62b441f9303f3ce89ee51f462391f01937b"
+
+    cache_file: str = str(tmp_path / "parse-cache.db")
+    parse_cache: ParseCache = ParseCache(cache_file, parser_version=1)
+    assert parse_cache.get(blob_sha) is None
+    parse_cache.put(blob_sha, [("hashicorp/aws", "~> 3.0")])
+    parse_cache.close()
+
+    assert ParseCache(cache_file, parser_version=1).get(blob_sha) == [
+        ("hashicorp/aws", "~> 3.0")
+    ]
+    assert ParseCache(cache_file, parser_version=2).get(blob_sha) is None
+
+
+def test_journal_resumes_after_an_incomplete_entry(tmp_path):
+    journal_file: str = str(tmp_path / "journal.jsonl")
+    journal: Journal = Journal(journal_file)
+    journal.record("first", [{"provider_name": "hashicorp/aws"}])
+    journal.close()
+    with open(journal_file, "a") as writer:
+        writer.write('{"name": "second", "da')
+
+    journal = Journal(journal_file, resume=True)
+    assert "first" in journal
+    assert "second" not in journal
+    journal.record("second")
+    journal.close()
+
+    assert Journal(journal_file, resume=True).entries == {
+        "first": [{"provider_name": "hashicorp/aws"}],
+        "second": None,
+    }
+    assert Journal(journal_file).entries == {}
+
+
+def test_find_required_providers():
+    text: str = """
+# terraform { required_providers { commented = {} } }
+locals {
+  doc = <<-EOT
+    terraform {
+      required_providers {
+    EOT
+  name = "${lookup(var.names, "key", "}")}"
+}
+
+terraform {
+  required_version = ">= 0.13"
+  backend "s3" {}
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws" /* } */
+      version = "~> 3.0"
+      configuration_aliases = [aws.east]
+    }
+    kubernetes = { source = "hashicorp/kubernetes", version = ">= 2.0.0" }
+    random = "~> 2.1"
+  }
+}
+
+terraform {
+  required_providers {
+    github = {
+      source = "integrations/github"
+    }
+  }
+}
+"""
+    assert find_required_providers(text) == [
+        ("hashicorp/aws", "~> 3.0"),
+        ("hashicorp/kubernetes", ">= 2.0.0"),
+        ("hashicorp/random", "~> 2.1"),
+        ("integrations/github", "Latest"),
+    ]
+
+
+def test_find_required_providers_json():
+    text: str = (
+        '{"terraform": [{"required_providers": [{"aws": '
+        '{"source": "hashicorp/aws", "version": "3.0.0"}, "random": {}}]}]}'
+    )
+    assert find_required_providers_json(text) == [
+        ("hashicorp/aws", "3.0.0"),
+        ("hashicorp/random", "Latest"),
+    ]
+
+
+def test_main_resolves_versions_from_registry_snapshot(tmp_path, capsys):
+    module_path = tmp_path / "repositories" / "infrastructure" / "modules" / "bucket"
+    module_path.mkdir(parents=True)
+    (module_path / "versions.tf").write_text("""terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "~> 3.74.0"
+    }
+    random = {
+      source  = "hashicorp/random"
+      version = "~> 2.1.0"
+    }
+    github = {
+      source = "integrations/github"
+    }
+  }
+}
+""")
+    snapshot_file: str = str(tmp_path / "snapshot.json")
+    RegistrySnapshot(
+        {
+            "hashicorp/aws": "3.74.1",
+            "hashicorp/random": "3.1.0",
+            "integrations/github": "4.19.2",
+        }
+    ).save(snapshot_file)
+
+    main(["-l", str(tmp_path / "repositories"), "-s", snapshot_file, "-o", "json"])
+
+    providers: list = json.loads(capsys.readouterr().out)
+    assert [
+        (
+            provider["repository_name"],
+            provider["file_path"],
+            provider["provider_name"],
+            provider["latest_provider_version"],
+            provider["comment"],
+        )
+        for provider in providers
+    ] == [
+        (
+            "infrastructure",
+            "/modules/bucket/versions.tf",
+            "hashicorp/aws",
+            "3.74.1",
+            "Patch update only.",
+        ),
+        (
+            "infrastructure",
+            "/modules/bucket/versions.tf",
+            "hashicorp/random",
+            "3.1.0",
+            "Major version update available.",
+        ),
+        (
+            "infrastructure",
+            "/modules/bucket/versions.tf",
+            "integrations/github",
+            "4.19.2",
+            "Latest version will be used.",
+        ),
+    ]
+
+
+class _RateLimitedResponse:
+    def __init__(self, headers: dict):
+        self.status_code = 429
+        self.headers = headers
+        self.text = ""
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert HttpUtil._get_retry_delay(_RateLimitedResponse({"Retry-After": "7"}), 0) == 7
+    retry_at: str = email.utils.formatdate(time.time() + 30, usegmt=True)
+    delay: float = HttpUtil._get_retry_delay(
+        _RateLimitedResponse({"Retry-After": retry_at}), 0
+    )
+    assert 25 <= delay <= 30
+    # an unreadable value falls back to the backoff for secondary rate limits
+    delay = HttpUtil._get_retry_delay(_RateLimitedResponse({"Retry-After": "x"}), 1)
+    assert delay == 120
+
+
+class _FlakyHttpUtil:
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+
+    def get(self, url, params=None):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+def test_repo_metadata_is_only_remembered_when_fetched_successfully():
+    http_utils = _FlakyHttpUtil(
+        [
+            {"message": "Server Error"},
+            {"name": "repo", "default_branch": "main"},
+        ]
+    )
+    repo = Repo(token="", owner="dfds", http_utils=http_utils)
+    assert repo.get_default_branch("repo") is None
+    assert repo.get_default_branch("repo") == "main"
+    assert repo.get_default_branch("repo") == "main"
+    assert len(http_utils.urls) == 2
+
+
+def test_run_workers_only_consumes_the_items_a_bit_ahead():
+    consumed = []
+
+    def items():
+        for i in itertools.count():
+            consumed.append(i)
+            yield i
+
+    results = run_workers(lambda i: i * 2, items(), workers=3)
+    assert list(itertools.islice(results, 10)) == list(range(0, 20, 2))
+    assert len(consumed) <= 10 + 3 * QUEUED_ITEMS_PER_WORKER
+    results.close()
+
+
+class _HclRepo:
+    class http_utils:
+        metrics = None
+
+    def does_repo_contain_hcl(self, name, languages=None):
+        return True
+
+
+def test_a_repository_that_cannot_be_cloned_is_not_journaled(tmp_path, monkeypatch):
+    def fail_to_clone(clone_url, destination, fetch_mode):
+        raise CloneError(f"{clone_url} could not be cloned.")
+
+    monkeypatch.setattr(get_provider_versions, "clone_repository", fail_to_clone)
+    r: dict = {"name": "repo", "clone_url": "https://github.com/dfds/repo.git"}
+    assert scan_repository(_HclRepo(), r) is None
+
+    journal: Journal = Journal(str(tmp_path / "journal.jsonl"))
+    used_providers = scan_with_journal(
+        journal, "repo", lambda: scan_repository(_HclRepo(), r)
+    )
+    assert list(used_providers) == []
+    assert "repo" not in journal
+    journal.close()
+
+
+def _create_git_repository(path) -> str:
+    path.mkdir()
+    (path / "main.tf").write_text('provider "aws" {}\n')
+    (path / "README.md").write_text("# repo\n")
+    for arguments in (
+        ["init", "-q"],
+        ["add", "."],
+        ["-c", "user.name=test", "-c", "user.email=test@example.com"]
+        + ["commit", "-q", "-m", "initial"],
+    ):
+        subprocess.run(["git", "-C", str(path)] + arguments, check=True)
+    return f"file://{path}"
+
+
+def test_sparse_clones_only_check_out_terraform_files(tmp_path):
+    clone_url: str = _create_git_repository(tmp_path / "origin")
+    clone_repository(clone_url, str(tmp_path / "clone"), FETCH_MODE_SPARSE)
+    assert sorted(os.listdir(tmp_path / "clone")) == [".git", "main.tf"]
+
+    cache: CloneCache = CloneCache(str(tmp_path / "cache"))
+    destination: str = str(tmp_path / "cached-clone")
+    cache.clone_repository("origin", clone_url, destination, None, FETCH_MODE_SPARSE)
+    assert sorted(os.listdir(destination)) == [".git", "main.tf"]
+
+
+def test_clone_errors_are_raised(tmp_path):
+    clone_url: str = f"file://{tmp_path / 'missing'}"
+    with pytest.raises(CloneError):
+        clone_repository(clone_url, str(tmp_path / "clone"), FETCH_MODE_SPARSE)
+    cache: CloneCache = CloneCache(str(tmp_path / "cache"))
+    with pytest.raises(CloneError):
+        cache.clone_repository("missing", clone_url, str(tmp_path / "cached-clone"))
+
+
+def _list_refs(git_dir: str) -> list:
+    result = subprocess.run(
+        ["git", "--git-dir", git_dir, "for-each-ref", "--format=%(refname)"],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    return sorted(result.stdout.split())
+
+
+def test_cached_mirrors_only_fetch_branches(tmp_path):
+    origin = tmp_path / "origin"
+    clone_url: str = _create_git_repository(origin)
+    git: list = ["git", "-C", str(origin)]
+    subprocess.run(git + ["update-ref", "refs/pull/1/head", "HEAD"], check=True)
+    branch: str = subprocess.run(
+        git + ["symbolic-ref", "--short", "HEAD"],
+        stdout=subprocess.PIPE,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    cache: CloneCache = CloneCache(str(tmp_path / "cache"))
+    mirror_path: str = cache.update_mirror("origin", clone_url, "2021-01-01T00:00:00Z")
+    assert _list_refs(mirror_path) == [f"refs/heads/{branch}"]
+
+    subprocess.run(git + ["branch", "feature"], check=True)
+    subprocess.run(git + ["update-ref", "refs/pull/2/head", "HEAD"], check=True)
+    cache.update_mirror("origin", clone_url, "2021-01-02T00:00:00Z")
+    assert _list_refs(mirror_path) == ["refs/heads/feature", f"refs/heads/{branch}"]
+
+
+class _RegistryResponse:
+    status_code = 200
+
+    def __init__(self, version):
+        self.version = version
+
+    def json(self):
+        return {"version": self.version}
+
+
+class _RegistrySession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return _RegistryResponse("3.74.1")
+
+
+def test_registry_client_looks_up_each_provider_once(tmp_path, monkeypatch):
+    for i in range(5):
+        (tmp_path / f"main{i}.tf").write_text(
+            "terraform {\n  required_providers {\n    aws = {\n"
+            '      source = "hashicorp/aws"\n      version = "~> 3.74.0"\n'
+            "    }\n  }\n}\n"
+        )
+    used_providers: TerraformProviders = parse_terraform_directory(
+        str(tmp_path), "repo", TerraformProviders()
+    )
+    assert used_providers.count() == 5
+
+    now: list = [1000.0]
+    monkeypatch.setattr(get_tf_provider_versions.time, "monotonic", lambda: now[0])
+    registry_client: RegistryClient = RegistryClient(
+        base_url="https://registry.test/v1/providers/", ttl=60
+    )
+    registry_client.session = _RegistrySession()
+    used_providers.get_latest_versions(registry_client)
+    assert registry_client.session.urls == [
+        "https://registry.test/v1/providers/hashicorp/aws"
+    ]
+    assert [p.latest_provider_version for p in used_providers] == ["3.74.1"] * 5
+
+    # within the TTL the cached version is used, after it the version is fetched
+    now[0] += 59
+    assert registry_client.get_latest_version("hashicorp/aws") == "3.74.1"
+    assert len(registry_client.session.urls) == 1
+    now[0] += 2
+    assert registry_client.get_latest_version("hashicorp/aws") == "3.74.1"
+    assert len(registry_client.session.urls) == 2
+
+
+def _github_response(status_code: int, body, headers: dict = None):
+    response: requests.Response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class _GitHubSession:
+    def __init__(self, responses: list):
+        self.responses: list = responses
+        self.requests: list = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append((method, url, dict(headers or {}), kwargs))
+        return self.responses.pop(0)
+
+
+def test_graphql_nodes_have_the_shape_of_the_rest_api():
+    node: dict = {
+        "name": "infrastructure",
+        "isArchived": False,
+        "isDisabled": True,
+        "pushedAt": "2021-06-01T12:00:00Z",
+        "url": "https://github.com/dfds/infrastructure",
+        "defaultBranchRef": {"name": "main"},
+        "languages": {"nodes": [{"name": "HCL"}, {"name": "Python"}]},
+    }
+    assert Repo._from_graphql_node(node) == {
+        "name": "infrastructure",
+        "archived": False,
+        "disabled": True,
+        "default_branch": "main",
+        "pushed_at": "2021-06-01T12:00:00Z",
+        "clone_url": "https://github.com/dfds/infrastructure.git",
+        "languages": ["HCL", "Python"],
+    }
+    # an empty repository does not have a default branch
+    assert Repo._from_graphql_node({"name": "empty"})["default_branch"] is None
+
+
+def test_graphql_errors_are_raised(monkeypatch):
+    session = _GitHubSession(
+        [
+            _github_response(401, {"message": "Bad credentials"}),
+            _github_response(200, {"data": None, "errors": [{"message": "Boom"}]}),
+        ]
+    )
+    repo: Repo = Repo(token="", owner="dfds", http_utils=HttpUtil("", session=session))
+    with pytest.raises(GitHubApiError, match="401: Bad credentials"):
+        list(repo.iter_all_repos_metadata())
+    with pytest.raises(GitHubApiError, match="Boom"):
+        list(repo.iter_all_repos_metadata())
+
+    # main exits with an error instead of reporting an empty organization
+    session.responses.append(_github_response(401, {"message": "Bad credentials"}))
+    monkeypatch.setattr(github.repo, "_session", session)
+    monkeypatch.setenv("GITHUB_OAUTH2_TOKEN", "token")
+    with pytest.raises(SystemExit) as exit_info:
+        main(["-o", "json"])
+    assert exit_info.value.code == 5
+
+
+def test_graphql_retries_an_exceeded_rate_limit(monkeypatch):
+    monkeypatch.setattr(github.repo.time, "sleep", lambda seconds: None)
+    rate_limited = {"data": None, "errors": [{"type": "RATE_LIMITED"}]}
+    page: dict = {
+        "organization": {
+            "repositories": {
+                "nodes": [{"name": "repo"}],
+                "pageInfo": {"hasNextPage": False, "endCursor": None},
+            }
+        }
+    }
+    session = _GitHubSession(
+        [
+            _github_response(200, rate_limited, {"X-RateLimit-Reset": "0"}),
+            _github_response(200, {"data": page}),
+        ]
+    )
+    repo: Repo = Repo(token="", owner="dfds", http_utils=HttpUtil("", session=session))
+    assert [r["name"] for r in repo.iter_all_repos_metadata()] == ["repo"]
+    assert len(session.requests) == 2
+
+
+def test_unchanged_responses_are_revalidated(tmp_path):
+    url: str = "https://api.github.com/orgs/dfds"
+    cache_dir: str = str(tmp_path / "http-cache")
+    session = _GitHubSession(
+        [
+            _github_response(200, {"public_repos": 1}, {"ETag": '"v1"'}),
+            _github_response(304, None),
+        ]
+    )
+    http_utils = HttpUtil("token", session=session, cache=ResponseCache(cache_dir))
+    assert http_utils.get(url) == {"public_repos": 1}
+    assert "If-None-Match" not in session.requests[0][2]
+    assert http_utils.get(url) == {"public_repos": 1}
+    assert session.requests[1][2]["If-None-Match"] == '"v1"'
+
+    # a later run revalidates the persisted response, and keeps a changed one
+    session = _GitHubSession(
+        [
+            _github_response(200, {"public_repos": 2}, {"ETag": '"v2"'}),
+            _github_response(304, None),
+        ]
+    )
+    http_utils = HttpUtil("token", session=session, cache=ResponseCache(cache_dir))
+    assert http_utils.get(url) == {"public_repos": 2}
+    assert session.requests[0][2]["If-None-Match"] == '"v1"'
+    assert http_utils.get(url) == {"public_repos": 2}
+    assert session.requests[1][2]["If-None-Match"] == '"v2"'
+
+    # another token can see other data, so it does not share the responses
+    session = _GitHubSession([_github_response(200, {"public_repos": 0})])
+    http_utils = HttpUtil("other", session=session, cache=ResponseCache(cache_dir))
+    assert http_utils.get(url) == {"public_repos": 0}
+    assert "If-None-Match" not in session.requests[0][2]
+
+
+def test_only_the_most_recently_used_responses_are_kept_in_memory(tmp_path):
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", '"a"', "A")
+    cache.put("b", '"b"', "B")
+    assert cache.get("a") == ('"a"', "A")
+    cache.put("c", '"c"', "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == ('"a"', "A")
+    assert cache.get("c") == ('"c"', "C")
+
+    cache = ResponseCache(str(tmp_path), max_entries=1)
+    cache.put("a", '"a"', "A")
+    cache.put("b", '"b"', "B")
+    assert len(cache._entries) == 1
+    # the forgotten response is read back from disk
+    assert cache.get("a") == ('"a"', "A")
+    assert list(cache._entries) == ["a"]
+
+
+def _repos_page(names: list, next_page: int = None):
+    headers: dict = {}
+    if next_page is not None:
+        url: str = f"https://api.github.com/organizations/1/repos?page={next_page}"
+        headers["Link"] = f'<{url}>; rel="next", <{url}0>; rel="last"'
+    return _github_response(200, [{"name": name} for name in names], headers)
+
+
+def test_repositories_are_listed_by_following_the_next_links():
+    session = _GitHubSession(
+        [
+            _repos_page(["a", "b"], next_page=2),
+            _repos_page(["c", "d"], next_page=3),
+            _repos_page(["e"]),
+        ]
+    )
+    repo: Repo = Repo(token="", owner="dfds", http_utils=HttpUtil("", session=session))
+    repos = repo.iter_all_repos()
+    # the next page is only fetched once the previous one has been consumed
+    assert next(repos)["name"] == "a"
+    assert len(session.requests) == 1
+    assert [r["name"] for r in repos] == ["b", "c", "d", "e"]
+    urls: list = [(url, kwargs.get("params")) for _, url, _, kwargs in session.requests]
+    assert urls == [
+        (
+            "https://api.github.com/orgs/dfds/repos",
+            {"type": "all", "sort": "full_name", "per_page": 100},
+        ),
+        ("https://api.github.com/organizations/1/repos?page=2", None),
+        ("https://api.github.com/organizations/1/repos?page=3", None),
+    ]
+
+    # a limit stops the listing without fetching further pages
+    session.responses = [_repos_page(["a", "b"], next_page=2)]
+    session.requests = []
+    assert [r["name"] for r in repo.iter_all_repos(limit=2)] == ["a", "b"]
+    assert len(session.requests) == 1
+
+
+def test_workers_only_fetch_the_pages_they_need():
+    session = _GitHubSession(
+        [_repos_page([f"repo-{i}", f"repo-{i}-b"], next_page=i + 1) for i in range(50)]
+    )
+    repo: Repo = Repo(token="", owner="dfds", http_utils=HttpUtil("", session=session))
+    results = run_workers(lambda r: r["name"], repo.iter_all_repos(), workers=3)
+    assert next(results) == "repo-0"
+    # at most the items queued ahead of the workers have been listed
+    assert len(session.requests) <= (1 + 3 * QUEUED_ITEMS_PER_WORKER) // 2 + 1
+    results.close()
+
+
+def _rate_limit(resource: str, remaining: int) -> dict:
+    return {
+        "X-RateLimit-Limit": "5000",
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Resource": resource,
+    }
+
+
+def _measured_metrics(monkeypatch) -> Metrics:
+    """Detect HCL in a repository and list the organization with metrics, where
+    every reading of the clock is an eighth of a second later than the last."""
+    page: dict = {
+        "organization": {
+            "repositories": {"nodes": [{"name": "a"}], "pageInfo": {}},
+        }
+    }
+    repo_data: dict = {"name": "infra", "languages_url": "https://api.github.com/x"}
+    session = _GitHubSession(
+        [
+            _github_response(200, repo_data, _rate_limit("core", 4999)),
+            _github_response(200, {"HCL": 10}, _rate_limit("core", 4998)),
+            _github_response(200, {"data": page}, _rate_limit("graphql", 4990)),
+        ]
+    )
+    metrics = Metrics()
+    repo = Repo("", "dfds", http_utils=HttpUtil("", session=session, metrics=metrics))
+    clock = itertools.count(0, 0.125)
+    monkeypatch.setattr(github.repo.time, "monotonic", lambda: next(clock))
+    assert repo.does_repo_contain_hcl("infra")
+    assert [r["name"] for r in repo.iter_all_repos_metadata()] == ["a"]
+    monkeypatch.undo()
+    return metrics
+
+
+def test_metrics_json_report(monkeypatch, tmp_path):
+    metrics: Metrics = _measured_metrics(monkeypatch)
+    histogram: dict = {
+        "0.05": 0,
+        "0.1": 0,
+        "0.25": 1,
+        "0.5": 1,
+        "1.0": 1,
+        "2.5": 1,
+        "5.0": 1,
+        "10.0": 1,
+    }
+
+    def endpoint(method: str, path: str, bytes_received: int) -> dict:
+        return {
+            "method": method,
+            "endpoint": path,
+            "calls": 1,
+            "status_codes": {"200": 1},
+            "latency_seconds": 0.125,
+            "latency_histogram": histogram,
+            "bytes_sent": 0,
+            "bytes_received": bytes_received,
+        }
+
+    report: dict = metrics.as_dict()
+    assert report["endpoints"] == [
+        endpoint("GET", "/repos/{owner}/{repo}", 62),
+        endpoint("GET", "/x", 11),
+        endpoint("POST", "/graphql", 88),
+    ]
+    assert report["rate_limits"] == {
+        "core": {"limit": 5000, "remaining": 4998, "lowest": 4998},
+        "graphql": {"limit": 5000, "remaining": 4990, "lowest": 4990},
+    }
+    assert report["phases"] == {
+        "hcl_detection": {"calls": 1, "seconds": 0.625},
+        "listing": {"calls": 1, "seconds": 0.375},
+    }
+    metrics.write("json", str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text()) == report
+
+
+def test_metrics_prometheus_report(monkeypatch):
+    text: str = _measured_metrics(monkeypatch).to_prometheus()
+    lines: list = text.splitlines()
+    labels: str = 'method="GET",endpoint="/repos/{owner}/{repo}"'
+    for line in [
+        f'github_requests_total{{{labels},status="200"}} 1',
+        f'github_request_duration_seconds_bucket{{{labels},le="0.1"}} 0',
+        f'github_request_duration_seconds_bucket{{{labels},le="0.25"}} 1',
+        f'github_request_duration_seconds_bucket{{{labels},le="+Inf"}} 1',
+        f"github_request_duration_seconds_sum{{{labels}}} 0.125",
+        f"github_request_duration_seconds_count{{{labels}}} 1",
+        f'github_request_bytes_total{{{labels},direction="received"}} 62',
+        'github_rate_limit_remaining{resource="graphql"} 4990',
+        'github_rate_limit_lowest_remaining{resource="core"} 4998',
+        'run_phase_seconds_total{phase="hcl_detection"} 0.625',
+        'run_phase_calls_total{phase="listing"} 1',
+    ]:
+        assert line in lines
+    # every family is announced before its samples, and every sample is a name,
+    # labels and a number
+    families: list = re.findall(
+        r"^# TYPE (\w+) (?:counter|gauge|histogram)$", text, re.M
+    )
+    assert len(families) == 8
+    for line in lines:
+        if not line.startswith("#"):
+            assert re.match(r'^\w+\{(\w+="[^"]*",)*\w+="[^"]*"\} [0-9.]+$', line)
+            assert any(line.startswith(name) for name in families)
+    assert text.endswith("\n")
+
+
+class _GitHubTransport:
+    """Answers httpx requests with the responses given per path, and records them."""
+
+    def __init__(self, responses: dict):
+        self.responses: dict = responses
+        self.requests: list = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.responses[request.url.path]
+        if isinstance(response, list):
+            response = response.pop(0)
+        return response
+
+
+def _async_repo(transport: _GitHubTransport) -> AsyncRepo:
+    http_utils = AsyncHttpUtil("token", transport=httpx.MockTransport(transport))
+    return AsyncRepo(token="token", owner="dfds", http_utils=http_utils)
+
+
+def test_async_repo_requests_all_pages_and_retries_server_errors(monkeypatch):
+    delays: list = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(github.repo.asyncio, "sleep", sleep)
+    transport = _GitHubTransport(
+        {
+            "/orgs/dfds": [
+                httpx.Response(502, text="Bad Gateway"),
+                httpx.Response(
+                    200, json={"public_repos": 60, "total_private_repos": 0}
+                ),
+            ],
+            "/orgs/dfds/repos": [
+                httpx.Response(200, json=[{"name": f"repo-{i}"} for i in range(50)]),
+                httpx.Response(
+                    200, json=[{"name": f"repo-{i}"} for i in range(50, 60)]
+                ),
+            ],
+        }
+    )
+    repos: list = asyncio.run(_async_repo(transport).get_all_repos())
+    assert [r["name"] for r in repos] == [f"repo-{i}" for i in range(60)]
+    assert delays == [1]
+    pages = sorted(r.url.params["page"] for r in transport.requests[2:])
+    assert pages == ["1", "2"]
+    assert transport.requests[0].headers["Authorization"] == "token token"
+
+
+def test_async_graphql_follows_pages_and_raises_errors():
+    def page(names: list, has_next_page: bool) -> httpx.Response:
+        repositories: dict = {
+            "nodes": [{"name": name} for name in names],
+            "pageInfo": {"hasNextPage": has_next_page, "endCursor": names[-1]},
+        }
+        return httpx.Response(
+            200, json={"data": {"organization": {"repositories": repositories}}}
+        )
+
+    transport = _GitHubTransport(
+        {"/graphql": [page(["a", "b"], True), page(["c"], False)]}
+    )
+    repo: AsyncRepo = _async_repo(transport)
+    repos: list = asyncio.run(repo.get_all_repos_metadata())
+    assert [r["name"] for r in repos] == ["a", "b", "c"]
+    assert json.loads(transport.requests[1].content)["variables"]["after"] == "b"
+
+    transport.responses["/graphql"] = [
+        httpx.Response(401, json={"message": "Bad credentials"})
+    ]
+    with pytest.raises(GitHubApiError, match="401: Bad credentials"):
+        asyncio.run(repo.get_all_repos_metadata())
+
+
+def test_main_looks_up_the_named_repositories_concurrently(monkeypatch, capsys):
+    transport = _GitHubTransport(
+        {
+            "/repos/dfds/a": httpx.Response(
+                200, json={"name": "a", "languages_url": "https://languages/a"}
+            ),
+            "/repos/dfds/b": httpx.Response(
+                200, json={"name": "b", "languages_url": "https://languages/b"}
+            ),
+            "/repos/dfds/missing": httpx.Response(404, json={"message": "Not Found"}),
+        }
+    )
+    monkeypatch.setattr(
+        get_provider_versions,
+        "AsyncHttpUtil",
+        functools.partial(AsyncHttpUtil, transport=httpx.MockTransport(transport)),
+    )
+    session = _GitHubSession([_github_response(200, {"Python": 1})] * 2)
+    monkeypatch.setattr(github.repo, "_session", session)
+    monkeypatch.setenv("GITHUB_OAUTH2_TOKEN", "token")
+
+    main(["-r", "a,b", "--async", "-o", "json"])
+    assert sorted(r.url.path for r in transport.requests) == [
+        "/repos/dfds/a",
+        "/repos/dfds/b",
+    ]
+    # the repositories are not looked up again, only their languages
+    assert [url for _, url, _, _ in session.requests] == [
+        "https://languages/a",
+        "https://languages/b",
+    ]
+    assert json.loads(capsys.readouterr().out) == []
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(["-r", "a,missing", "--async"])
+    assert exit_info.value.code == 4
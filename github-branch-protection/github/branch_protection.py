@@ -1,32 +1,517 @@
+import asyncio
+import collections
+import contextlib
+import datetime
+import email.utils
+import hashlib
+import json
 import logging
+import os
+import re
+import sys
+import threading
+import time
+from urllib.parse import urlparse
 
 import requests
 from requests import Response
+from requests.adapters import HTTPAdapter
 
-API_URL: str = 'https://api.github.com'
+try:
+    import httpx
+except ImportError:  # the async clients are optional
+    httpx = None
+
+# can be overridden for GitHub Enterprise Server, or a local stand-in
+API_URL: str = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+MAX_RETRIES: int = 5
+# GitHub asks clients to wait at least one second between mutating requests
+WRITE_INTERVAL: float = 1.0
+POOL_MAXSIZE: int = 32
+# the number of responses a ResponseCache keeps in memory
+MAX_CACHED_RESPONSES: int = 256
+# the number of repositories a Repo remembers the metadata of
+MAX_REMEMBERED_REPOS: int = 1000
+# the fields of a repository that the accessors of Repo read
+REPO_METADATA_FIELDS: tuple = ('name', 'archived', 'disabled', 'default_branch', 'languages_url', 'languages')
+# upper bounds, in seconds, of the buckets of the request latency histograms
+LATENCY_BUCKETS: tuple = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# replace the names in a url path with placeholders, so requests are counted per endpoint
+ENDPOINT_PATTERNS: list = [(re.compile(r'^(.*?)/repos/[^/]+/[^/]+'), r'\1/repos/{owner}/{repo}'),
+                           (re.compile(r'^(.*?)/orgs/[^/]+'), r'\1/orgs/{org}'),
+                           (re.compile(r'/branches/.+?(/protection)?$'), r'/branches/{branch}\1')]
 PROTECTED_REPOS: list = ['ECR-Repositories',
                          'emcla-sandbox',
                          'raras-sandbox',
                          'rifis-sandbox',
                          'wcarlsen-sandcastle',
                          'dafda']
+# lists the repositories with the protection status of their default branch, 100 repositories per request
+PROTECTION_STATUS_QUERY: str = """
+query($owner: String!, $first: Int!, $after: String) {
+  organization(login: $owner) {
+    repositories(first: $first, after: $after, orderBy: {field: NAME, direction: ASC}) {
+      pageInfo {
+        hasNextPage
+        endCursor
+      }
+      nodes {
+        name
+        isArchived
+        isDisabled
+        defaultBranchRef {
+          name
+          branchProtectionRule {
+            pattern
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class GitHubApiError(Exception):
+    """Raised when the GitHub API returns an error instead of the requested data."""
+
+
+class BranchProtectionError(Exception):
+    """Raised when the branch protection rules of a branch cannot be read or set."""
+
+
+class RequestStats:
+    """A class that counts the HTTP requests made during a run."""
+
+    def __init__(self) -> None:
+        """Class constructor."""
+        self._lock: threading.Lock = threading.Lock()
+        self.requests: int = 0
+        self.retries: int = 0
+        self.not_modified: int = 0
+        self.latency: float = 0.0
+
+    def record(self, latency: float, status_code: int) -> None:
+        """Record a completed HTTP request.
+        :param latency: The time the request took, in seconds.
+        :param status_code: The HTTP status code of the response.
+        :type latency: float
+        :type status_code: int
+        """
+        with self._lock:
+            self.requests += 1
+            self.latency += latency
+            if status_code == 304:
+                self.not_modified += 1
+
+    def record_retry(self) -> None:
+        """Record that a request is about to be retried."""
+        with self._lock:
+            self.retries += 1
+
+    def as_dict(self) -> dict:
+        """Get the counters as a dictionary.
+        :return: dict
+        """
+        with self._lock:
+            return {'requests': self.requests, 'retries': self.retries, 'not_modified': self.not_modified,
+                    'latency_seconds': round(self.latency, 3)}
+
+
+class Metrics:
+    """A class that collects detailed metrics during a run: the calls, latency histogram and bytes transferred per
+    endpoint, the rate limit headroom, and the time spent in each phase of the run."""
+
+    def __init__(self) -> None:
+        """Class constructor."""
+        self._lock: threading.Lock = threading.Lock()
+        self.endpoints: dict = {}
+        self.rate_limits: dict = {}
+        self.phases: dict = {}
+
+    @staticmethod
+    def get_endpoint(url: str) -> str:
+        """Get the endpoint of a url, with the names of the organization, repository and branch replaced by placeholders.
+        :return: str
+        """
+        path: str = urlparse(url).path
+        for pattern, replacement in ENDPOINT_PATTERNS:
+            path = pattern.sub(replacement, path, count=1)
+        return path
+
+    def record_request(self, method: str, url: str, response: Response, latency: float) -> None:
+        """Record a completed HTTP request.
+        :param method: The HTTP method of the request.
+        :param url: The url of the request.
+        :param response: The response to the request.
+        :param latency: The time the request took, in seconds.
+        :type method: str
+        :type url: str
+        :type response: requests.Response
+        :type latency: float
+        """
+        key: tuple = (method, self.get_endpoint(url))
+        body = response.request.body if response.request is not None else None
+        bytes_sent: int = len(body) if body is not None else 0
+        bytes_received: int = len(response.content or b'')
+        headers = response.headers
+        with self._lock:
+            endpoint: dict = self.endpoints.get(key)
+            if endpoint is None:
+                endpoint = {'calls': 0, 'status_codes': {}, 'latency_buckets': [0] * len(LATENCY_BUCKETS),
+                            'latency_seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0}
+                self.endpoints[key] = endpoint
+            endpoint['calls'] += 1
+            status_code: str = str(response.status_code)
+            endpoint['status_codes'][status_code] = endpoint['status_codes'].get(status_code, 0) + 1
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    endpoint['latency_buckets'][index] += 1
+            endpoint['latency_seconds'] += latency
+            endpoint['bytes_sent'] += bytes_sent
+            endpoint['bytes_received'] += bytes_received
+            if 'X-RateLimit-Remaining' in headers:
+                resource: str = headers.get('X-RateLimit-Resource', 'core')
+                remaining: int = int(headers['X-RateLimit-Remaining'])
+                rate_limit: dict = self.rate_limits.setdefault(resource, {'limit': 0, 'remaining': remaining, 'lowest': remaining})
+                rate_limit['limit'] = int(headers.get('X-RateLimit-Limit', 0))
+                rate_limit['remaining'] = remaining
+                rate_limit['lowest'] = min(rate_limit['lowest'], remaining)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """A context manager that adds the time spent in it to a phase of the run.  Phases running concurrently in several
+        threads are all counted, so the total of a phase can exceed the duration of the run.
+        :param name: The name of the phase, e.g. 'audit'.
+        :type name: str
+        """
+        start: float = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed: float = time.monotonic() - start
+            with self._lock:
+                phase: dict = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+                phase['calls'] += 1
+                phase['seconds'] += elapsed
+
+    def as_dict(self) -> dict:
+        """Get the metrics as a dictionary that can be serialized to JSON.
+        :return: dict
+        """
+        with self._lock:
+            endpoints: list = []
+            for (method, path), endpoint in sorted(self.endpoints.items()):
+                endpoints.append({'method': method,
+                                  'endpoint': path,
+                                  'calls': endpoint['calls'],
+                                  'status_codes': dict(endpoint['status_codes']),
+                                  'latency_seconds': round(endpoint['latency_seconds'], 3),
+                                  'latency_histogram': {str(bound): count for bound, count in zip(LATENCY_BUCKETS, endpoint['latency_buckets'])},
+                                  'bytes_sent': endpoint['bytes_sent'],
+                                  'bytes_received': endpoint['bytes_received']})
+            return {'endpoints': endpoints,
+                    'rate_limits': {resource: dict(rate_limit) for resource, rate_limit in sorted(self.rate_limits.items())},
+                    'phases': {name: {'calls': phase['calls'], 'seconds': round(phase['seconds'], 3)} for name, phase in sorted(self.phases.items())}}
+
+    def to_prometheus(self) -> str:
+        """Get the metrics in the Prometheus text exposition format.
+        :return: str
+        """
+        data: dict = self.as_dict()
+        # each family is a tuple of the name, type, help text and its samples, which are tuples of the name suffix, labels
+        # and value
+        families: list = [('github_requests_total', 'counter', 'Requests to the GitHub API.', []),
+                          ('github_request_duration_seconds', 'histogram', 'Request latency.', []),
+                          ('github_request_bytes_total', 'counter', 'Bytes transferred.', []),
+                          ('github_rate_limit_remaining', 'gauge', 'Requests left.', []),
+                          ('github_rate_limit_lowest_remaining', 'gauge', 'Fewest left.', []),
+                          ('github_rate_limit_limit', 'gauge', 'Requests allowed.', []),
+                          ('run_phase_seconds_total', 'counter', 'Time spent in each phase.', []),
+                          ('run_phase_calls_total', 'counter', 'Times each phase was entered.', [])]
+        samples: dict = {family[0]: family[3] for family in families}
+        for endpoint in data['endpoints']:
+            labels: str = f'method="{endpoint["method"]}",endpoint="{endpoint["endpoint"]}"'
+            for status_code, count in sorted(endpoint['status_codes'].items()):
+                samples['github_requests_total'].append(('', f'{labels},status="{status_code}"', count))
+            histogram: list = samples['github_request_duration_seconds']
+            for bound, count in endpoint['latency_histogram'].items():
+                histogram.append(('_bucket', f'{labels},le="{bound}"', count))
+            histogram.append(('_bucket', f'{labels},le="+Inf"', endpoint['calls']))
+            histogram.append(('_sum', labels, endpoint['latency_seconds']))
+            histogram.append(('_count', labels, endpoint['calls']))
+            for direction in ('sent', 'received'):
+                samples['github_request_bytes_total'].append(('', f'{labels},direction="{direction}"', endpoint[f'bytes_{direction}']))
+        for resource, rate_limit in data['rate_limits'].items():
+            labels: str = f'resource="{resource}"'
+            samples['github_rate_limit_remaining'].append(('', labels, rate_limit['remaining']))
+            samples['github_rate_limit_lowest_remaining'].append(('', labels, rate_limit['lowest']))
+            samples['github_rate_limit_limit'].append(('', labels, rate_limit['limit']))
+        for name, phase in data['phases'].items():
+            labels: str = f'phase="{name}"'
+            samples['run_phase_seconds_total'].append(('', labels, phase['seconds']))
+            samples['run_phase_calls_total'].append(('', labels, phase['calls']))
+
+        lines: list = []
+        for name, metric_type, help_text, family_samples in families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for suffix, labels, value in family_samples:
+                lines.append(f'{name}{suffix}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, output_format: str, path: str = None) -> None:
+        """Write the metrics in JSON or Prometheus format.
+        :param output_format: Either 'json' or 'prometheus'.
+        :param path: The file to write to. Default: None, which writes to stderr.
+        :type output_format: str
+        :type path: str
+        """
+        if output_format == 'prometheus':
+            text: str = self.to_prometheus()
+        else:
+            text: str = json.dumps(self.as_dict(), indent=2) + '\n'
+        if path is None:
+            sys.stderr.write(text)
+        else:
+            with open(path, 'w') as writer:
+                writer.write(text)
+
+
+def measure_phase(metrics: Metrics, name: str):
+    """Get a context manager that times a phase of the run, or does nothing if metrics are not collected.
+    :param metrics: The metrics to add the time to, or None.
+    :param name: The name of the phase.
+    :type metrics: Metrics
+    :type name: str
+    """
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.phase(name)
+
+
+# counters and connections shared by every HttpUtil in the process
+REQUEST_STATS: RequestStats = RequestStats()
+_session: requests.Session = None
+_session_lock: threading.Lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Get the HTTP session shared by every HttpUtil, so connections are kept alive and reused between requests.
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter: HTTPAdapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+class WriteLimiter:
+    """A context manager that bounds the number of mutating requests in flight, and spaces them out in time, so that
+    concurrent workers stay clear of the GitHub secondary rate limits."""
+
+    def __init__(self, max_concurrency: int = 1, interval: float = WRITE_INTERVAL) -> None:
+        """Class constructor.
+        :param max_concurrency: The maximum number of writes in flight at the same time. Default: 1
+        :param interval: The minimum number of seconds between the start of two writes. Default: WRITE_INTERVAL
+        :type max_concurrency: int
+        :type interval: float
+        """
+        self._semaphore: threading.BoundedSemaphore = threading.BoundedSemaphore(max(max_concurrency, 1))
+        self._lock: threading.Lock = threading.Lock()
+        self._next_start: float = 0.0
+        self.interval: float = interval
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            now: float = time.monotonic()
+            start: float = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._semaphore.release()
+
+
+class ResponseCache:
+    """A cache of GET responses and their ETags, which can be persisted on disk between runs.  Only the most recently
+    used responses are kept in memory."""
+
+    def __init__(self, cache_dir: str = None, max_entries: int = MAX_CACHED_RESPONSES) -> None:
+        """Class constructor.
+        :param cache_dir: A directory to persist the responses in. Default: None, which only keeps them in memory.
+        :param max_entries: The number of responses to keep in memory. Default: MAX_CACHED_RESPONSES
+        :type cache_dir: str
+        :type max_entries: int
+        """
+        self.cache_dir: str = cache_dir
+        self.max_entries: int = max_entries
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def get_key(token: str, url: str, params: dict = None) -> str:
+        """Get the cache key for a request.  The token is part of the key, because different tokens can see different
+        data.
+        :return: str
+        """
+        token_hash: str = hashlib.sha256(token.encode()).hexdigest()
+        request: str = json.dumps([token_hash, url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def _remember(self, key: str, entry: tuple) -> None:
+        """Private method for keeping a response in memory, forgetting the least
+        recently used ones beyond max_entries.  The lock must be held.
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> tuple:
+        """Get a cached response.
+        :param key: A key from get_key.
+        :type key: str
+        :return: A tuple of the ETag and the response data, or None if the response is not cached.
+        """
+        with self._lock:
+            entry: tuple = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.cache_dir is not None:
+            try:
+                with open(self._get_path(key), 'r') as reader:
+                    stored: dict = json.load(reader)
+                entry = (stored['etag'], stored['data'])
+            except (OSError, ValueError, KeyError):
+                return None
+            with self._lock:
+                self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, etag: str, data) -> None:
+        """Store a response.
+        :param key: A key from get_key.
+        :param etag: The ETag header of the response.
+        :param data: The decoded JSON body of the response.
+        :type key: str
+        :type etag: str
+        """
+        with self._lock:
+            self._remember(key, (etag, data))
+        if self.cache_dir is not None:
+            path: str = self._get_path(key)
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            temp_path: str = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'w') as writer:
+                json.dump({'etag': etag, 'data': data}, writer)
+            os.replace(temp_path, path)
 
 
 class HttpUtil:
     """A utility class for HTTP verbs."""
 
-    def __init__(self, token: str, level: int = logging.INFO) -> None:
+    def __init__(self, token: str, level: int = logging.INFO, session: requests.Session = None,
+                 cache: ResponseCache = None, metrics: Metrics = None) -> None:
         """Class constructor.
         :param token: An OAUTH2 token which can authenticate with GitHub.
         :param level: A valid log level from the logging module. Default: logging.INFO
+        :param session: The HTTP session to use. Default: A session shared by all instances.
+        :param cache: The cache for GET responses. Default: A new in-memory cache.
+        :param metrics: Collects detailed metrics of the requests, and of the phases timed by the Repo and Branch using
+        this HttpUtil. Default: None
         :type token: str
         :type level: int
+        :type session: requests.Session
+        :type cache: ResponseCache
+        :type metrics: Metrics
         """
         logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
         self.token: str = token
+        self.session: requests.Session = session or get_session()
+        self.stats: RequestStats = REQUEST_STATS
+        self.cache: ResponseCache = cache or ResponseCache()
+        self.metrics: Metrics = metrics
+
+    @staticmethod
+    def _parse_retry_after(value: str) -> float:
+        """Private method for reading a Retry-After header, which holds either a number of seconds or an HTTP-date.
+        :param value: The value of the header.
+        :return: The number of seconds to wait, or None if it cannot be read.
+        """
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at is None:
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max((retry_at - now).total_seconds(), 0)
+
+    @staticmethod
+    def _get_retry_delay(response: Response, attempt: int) -> float:
+        """Private method for deciding if and when a request should be retried.
+        :param response: The response to the previous attempt.
+        :param attempt: The number of attempts made so far, starting at 0.
+        :return: The number of seconds to wait, or None if it should not be retried.
+        """
+        headers = response.headers
+        if response.status_code in (403, 429):
+            if 'Retry-After' in headers:
+                retry_after: float = HttpUtil._parse_retry_after(headers['Retry-After'])
+                if retry_after is not None:
+                    return retry_after
+            if headers.get('X-RateLimit-Remaining') == '0':
+                reset: float = float(headers.get('X-RateLimit-Reset', time.time()))
+                return max(reset - time.time(), 0) + 1
+            if response.status_code == 429 or 'rate limit' in response.text.lower():
+                # secondary rate limits should be retried after at least a minute
+                return 60 * 2 ** attempt
+        if response.status_code in (500, 502, 503, 504):
+            return 2 ** attempt
+        return None
+
+    def _request(self, method: str, url: str, headers: dict, **kwargs) -> Response:
+        """Private method for doing an HTTP request, retrying with backoff when GitHub reports a rate limit or a server error.
+        :return: requests.Response
+        """
+        attempt: int = 0
+        while True:
+            start: float = time.monotonic()
+            response: Response = self.session.request(method, url=url, headers=headers, **kwargs)
+            latency: float = time.monotonic() - start
+            self.stats.record(latency, response.status_code)
+            if self.metrics is not None:
+                self.metrics.record_request(method, url, response, latency)
+            delay: float = self._get_retry_delay(response, attempt)
+            if delay is None or attempt >= MAX_RETRIES:
+                return response
+            logging.warning(f'{method} {url} returned HTTP status {response.status_code}, retrying in {delay:.0f} seconds.')
+            self.stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
 
     def get(self, url: str, params: dict = None) -> dict:
-        """Utility method for doing HTTP GET.
+        """Utility method for doing HTTP GET.  Responses are cached and revalidated with their ETag, so an unchanged
+        resource is not downloaded again.  A 304 response does not count against the primary rate limit.
         :param url: The full url to the REST API endpoint.
         :param params: Query parameters to the REST API endpoint. Default: None
         :type url: str
@@ -34,8 +519,60 @@ class HttpUtil:
         :return: dict
         """
         headers: dict = {'Accept': 'application/vnd.github.v3+json', 'Authorization': f'token {self.token}'}
-        response: Response = requests.get(url=url, headers=headers, params=params)
-        return response.json()
+        cache_key: str = self.cache.get_key(self.token, url, params)
+        cached: tuple = self.cache.get(cache_key)
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+        response: Response = self._request('GET', url, headers, params=params)
+        if response.status_code == 304 and cached is not None:
+            return cached[1]
+        data = response.json()
+        etag: str = response.headers.get('ETag')
+        if etag is not None and response.status_code == 200:
+            self.cache.put(cache_key, etag, data)
+        return data
+
+    def get_page(self, url: str, params: dict = None) -> tuple:
+        """Utility method for doing HTTP GET on a paginated REST API endpoint.  Responses are cached and revalidated like
+        in get, together with the url of the next page.
+        :param url: The full url to the REST API endpoint.
+        :param params: Query parameters to the REST API endpoint. Default: None
+        :type url: str
+        :type params: dict
+        :return: A tuple of the decoded JSON body and the url of the next page from the Link header, or None if this is
+        the last page.
+        """
+        headers: dict = {'Accept': 'application/vnd.github.v3+json', 'Authorization': f'token {self.token}'}
+        # a 304 response does not carry the Link header, so the url of the next page is cached with the body under a key
+        # of its own
+        cache_key: str = self.cache.get_key(self.token, f'{url}#page', params)
+        cached: tuple = self.cache.get(cache_key)
+        if cached is not None:
+            headers['If-None-Match'] = cached[0]
+        response: Response = self._request('GET', url, headers, params=params)
+        if response.status_code == 304 and cached is not None:
+            return cached[1][0], cached[1][1]
+        data = response.json()
+        next_url: str = response.links.get('next', {}).get('url')
+        etag: str = response.headers.get('ETag')
+        if etag is not None and response.status_code == 200:
+            self.cache.put(cache_key, etag, [data, next_url])
+        return data, next_url
+
+    def iter_pages(self, url: str, params: dict = None):
+        """Utility method for iterating over the pages of a paginated REST API endpoint, following the rel="next" links.
+        A page is only fetched when the previous one has been consumed.
+        :param url: The full url to the REST API endpoint.
+        :param params: Query parameters for the first page. Default: None
+        :type url: str
+        :type params: dict
+        :return: An iterator over the decoded JSON body of each page.
+        """
+        while url is not None:
+            data, url = self.get_page(url, params)
+            # the next links already carry the query parameters
+            params = None
+            yield data
 
     def post(self, url: str, payload: dict) -> Response:
         """Utility method for doing HTTP POST.
@@ -47,7 +584,7 @@ class HttpUtil:
         """
         headers: dict = {'Accept': 'application/vnd.github.luke-cage-preview+json',
                          'Authorization': f'token {self.token}'}
-        response: Response = requests.post(url=url, headers=headers, json=payload)
+        response: Response = self._request('POST', url, headers, json=payload)
         return response
 
     def put(self, url: str, payload: dict) -> Response:
@@ -60,31 +597,129 @@ class HttpUtil:
         """
         headers: dict = {'Accept': 'application/vnd.github.luke-cage-preview+json',
                          'Authorization': f'token {self.token}'}
-        response: Response = requests.put(url=url, headers=headers, json=payload)
+        response: Response = self._request('PUT', url, headers, json=payload)
         return response
 
+    def graphql(self, query: str, variables: dict = None) -> dict:
+        """Utility method for doing a query against the GraphQL API.
+        :param query: The GraphQL query document.
+        :param variables: Values for the variables used in the query. Default: None
+        :type query: str
+        :type variables: dict
+        :return: dict
+        :raises GitHubApiError: If the query did not return any data, e.g. because the token is invalid or the rate limit
+        is still exceeded after retrying.
+        """
+        payload: dict = {'query': query, 'variables': variables or {}}
+        attempt: int = 0
+        while True:
+            # rate limits and server errors are retried like for any other request
+            response: Response = self.post(url=f'{API_URL}/graphql', payload=payload)
+            try:
+                data: dict = response.json()
+            except ValueError:
+                data: dict = {}
+            errors: list = data.get('errors') or []
+            # the GraphQL API reports an exceeded rate limit with HTTP status 200
+            if attempt >= MAX_RETRIES or not any(error.get('type') == 'RATE_LIMITED' for error in errors):
+                break
+            reset: float = float(response.headers.get('X-RateLimit-Reset', 0))
+            delay: float = max(reset - time.time(), 0) + 1 if reset else 60
+            logging.warning(f'The GraphQL rate limit is exceeded, retrying in {delay:.0f} seconds.')
+            self.stats.record_retry()
+            time.sleep(delay)
+            attempt += 1
+        for error in errors:
+            logging.error(f'GraphQL query failed: {error.get("message")}')
+        if response.status_code != 200 or data.get('data') is None:
+            message: str = data.get('message') or '; '.join(error.get('message', '') for error in errors)
+            raise GitHubApiError(f'GraphQL query failed with HTTP status {response.status_code}: {message}')
+        return data['data']
+
 
 class Repo:
     """A class that represent a GitHub repository."""
 
-    def __init__(self, token: str, owner: str, level: int = logging.INFO) -> None:
+    def __init__(self, token: str, owner: str, level: int = logging.INFO, http_utils: HttpUtil = None) -> None:
         """Class constructor.
         :param token: An OAUTH2 token which can authenticate with GitHub.
         :param owner: The GitHub Enterprise organization name.
         :param level: A valid log level from the logging module. Default: logging.INFO
+        :param http_utils: An HttpUtil to share its response cache. Default: A new HttpUtil.
         :type token: str
         :type owner: str
         :type level: int
+        :type http_utils: HttpUtil
         """
         logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
-        self.http_utils: HttpUtil = HttpUtil(token)
+        self.http_utils: HttpUtil = http_utils or HttpUtil(token)
         self.owner: str = owner
+        # metadata fetched during this run, so each resource is only fetched once
+        self._org_data: dict = None
+        self._repo_data: collections.OrderedDict = collections.OrderedDict()
+        self._metadata_lock: threading.Lock = threading.Lock()
+
+    def _get_org_data(self) -> dict:
+        """Private method for getting the organization, fetching it only until it has been fetched successfully.
+        :return: dict
+        """
+        if self._org_data is not None:
+            return self._org_data
+        data: dict = self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}')
+        # an error is not remembered, so a later call can try again
+        if 'message' not in data:
+            self._org_data = data
+        return data
+
+    @staticmethod
+    def _remember(memo: collections.OrderedDict, name: str, data: dict) -> None:
+        """Private method for remembering metadata of a repository, forgetting the least recently remembered
+        repositories beyond MAX_REMEMBERED_REPOS.  The metadata lock must be held.
+        """
+        memo[name] = data
+        memo.move_to_end(name)
+        while len(memo) > MAX_REMEMBERED_REPOS:
+            memo.popitem(last=False)
+
+    @staticmethod
+    def _project_repo_data(data: dict) -> dict:
+        """Private method for keeping only the fields of a repository that the accessors read.
+        :return: dict
+        """
+        return {field: data[field] for field in REPO_METADATA_FIELDS if field in data}
+
+    def _get_repo_data(self, name: str) -> dict:
+        """Private method for getting a repository, fetching it only if it has not already been fetched successfully or
+        seeded from a listing.
+        :param name: The name of the repository.
+        :type name: str
+        :return: dict
+        """
+        with self._metadata_lock:
+            data: dict = self._repo_data.get(name)
+        if data is None:
+            data = self.http_utils.get(url=f'{API_URL}/repos/{self.owner}/{name}')
+            if 'message' not in data:
+                with self._metadata_lock:
+                    self._remember(self._repo_data, name, self._project_repo_data(data))
+        return data
+
+    def seed_repo_metadata(self, repos: list) -> None:
+        """Remember the metadata of repositories that has already been fetched, e.g. from a listing, so accessors do not
+        have to fetch them again.
+        :param repos: A list of repository dictionaries.
+        :type repos: list
+        """
+        with self._metadata_lock:
+            for r in repos:
+                if isinstance(r, dict) and 'name' in r:
+                    self._remember(self._repo_data, r['name'], self._project_repo_data(r))
 
     def _get_number_of_private_repos(self) -> int:
         """Private method for counting the number of private repositories in the organization.
         :return: int
         """
-        data: dict = self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}')
+        data: dict = self._get_org_data()
         count: int = data.get('total_private_repos')
         return count
 
@@ -92,7 +727,7 @@ class Repo:
         """Private method for counting the number of public repositories in the organization.
         :return: int
         """
-        data: dict = self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}')
+        data: dict = self._get_org_data()
         count: int = data.get('public_repos')
         return count
 
@@ -103,28 +738,106 @@ class Repo:
         count: int = self._get_number_of_public_repos() + self._get_number_of_private_repos()
         return count
 
+    def iter_repo_pages(self, limit: int = None):
+        """Iterate over the repositories in the organization one page at a time, following the Link headers of the REST
+        API.  The next page is only fetched when the previous one has been consumed.
+        :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
+        alphabetically. This is useful during development or diagnostics. Default: None.
+        :return: An iterator over lists of repositories.
+        """
+        page_limit: int = 100
+        if limit is not None:
+            if limit <= 0:
+                return
+            page_limit = min(page_limit, limit)
+        params: dict = {'type': 'all', 'sort': 'full_name', 'per_page': page_limit}
+        number_of_repos_left: int = limit
+        pages = self.http_utils.iter_pages(url=f'{API_URL}/orgs/{self.owner}/repos', params=params)
+        while True:
+            # only the fetching is timed, not the work done by the caller between pages
+            with measure_phase(self.http_utils.metrics, 'listing'):
+                fragment = next(pages, None)
+            if fragment is None:
+                return
+            if not isinstance(fragment, list):
+                logging.error(f'Listing the repositories failed: {fragment.get("message")}')
+                return
+            if number_of_repos_left is not None:
+                fragment = fragment[:number_of_repos_left]
+                number_of_repos_left -= len(fragment)
+            self.seed_repo_metadata(fragment)
+            yield fragment
+            if number_of_repos_left is not None and number_of_repos_left <= 0:
+                return
+
+    def iter_all_repos(self, limit: int = None):
+        """Iterate over the repositories in the organization, yielding each repository as soon as its page has been
+        fetched.
+        :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
+        alphabetically. Default: None.
+        :return: An iterator over repository dictionaries.
+        """
+        for fragment in self.iter_repo_pages(limit):
+            yield from fragment
+
     def get_all_repos(self, limit: int = None) -> list:
         """Get a list of all the repositories in the organization.
         :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
         alphabetically. This is useful during development or diagnostics. Default: None.
         :return: list
         """
-        all_repos: list = []
-        page_counter: int = 0
-        page_limit: int = 50
-        number_of_repos_left: int = self._get_number_of_repos()
-        if limit is not None:
-            number_of_repos_left = limit
-        while number_of_repos_left > 0:
-            page_counter += 1
-            if number_of_repos_left < page_limit:
-                page_limit = number_of_repos_left
-            params: dict = {'type': 'all', 'sort': 'full_name', 'per_page': page_limit, 'page': page_counter}
-            fragment: dict = self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}/repos', params=params)
-            all_repos.append(fragment)
-            if number_of_repos_left >= page_limit:
-                number_of_repos_left -= page_limit
-        return all_repos
+        return list(self.iter_repo_pages(limit))
+
+    def iter_repo_protection_pages(self, limit: int = None):
+        """Iterate over the repositories in the organization one page at a time, using the GraphQL API to fetch 100
+        repositories per request together with the protection status of their default branch.  Each repository is a
+        dictionary with the same keys as in the REST API for name, archived, disabled and default_branch, plus
+        'protected', which tells if the default branch has any branch protection rules.
+        :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
+        alphabetically. This is useful during development or diagnostics. Default: None.
+        :return: An iterator over lists of repositories.
+        """
+        page_limit: int = 100
+        number_of_repos_left: int = limit
+        cursor: str = None
+        while number_of_repos_left is None or number_of_repos_left > 0:
+            if number_of_repos_left is not None:
+                page_limit = min(page_limit, number_of_repos_left)
+            variables: dict = {'owner': self.owner, 'first': page_limit, 'after': cursor}
+            with measure_phase(self.http_utils.metrics, 'listing'):
+                data: dict = self.http_utils.graphql(PROTECTION_STATUS_QUERY, variables)
+            repositories: dict = (data.get('organization') or {}).get('repositories', {})
+            fragment: list = [self._from_graphql_node(node) for node in repositories.get('nodes', [])]
+            self.seed_repo_metadata(fragment)
+            yield fragment
+            if number_of_repos_left is not None:
+                number_of_repos_left -= len(fragment)
+            page_info: dict = repositories.get('pageInfo', {})
+            if not page_info.get('hasNextPage') or len(fragment) == 0:
+                break
+            cursor = page_info.get('endCursor')
+
+    def iter_all_repos_protection(self, limit: int = None):
+        """Iterate over the repositories in the organization like iter_repo_protection_pages, yielding each repository
+        as soon as its page has been fetched.
+        :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
+        alphabetically. Default: None.
+        :return: An iterator over repository dictionaries.
+        """
+        for fragment in self.iter_repo_protection_pages(limit):
+            yield from fragment
+
+    @staticmethod
+    def _from_graphql_node(node: dict) -> dict:
+        """Private method for converting a GraphQL repository node into the shape of the REST API.
+        :return: dict
+        """
+        default_branch_ref: dict = node.get('defaultBranchRef') or {}
+        return {'name': node.get('name'),
+                'archived': node.get('isArchived', False),
+                'disabled': node.get('isDisabled', False),
+                'default_branch': default_branch_ref.get('name'),
+                'protected': default_branch_ref.get('branchProtectionRule') is not None}
 
     @staticmethod
     def get_protected_repos() -> list:
@@ -140,7 +853,7 @@ class Repo:
         :type repo_name: str
         :return: str
         """
-        data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}')
+        data: dict = self._get_repo_data(repo_name)
         return data.get('default_branch')
 
     def is_repo_archived(self, repo_name: str) -> bool:
@@ -150,7 +863,7 @@ class Repo:
         :type repo_name: str
         :return: bool
         """
-        data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}')
+        data: dict = self._get_repo_data(repo_name)
         is_archived: bool = data.get('archived', False)
         return is_archived
 
@@ -161,7 +874,7 @@ class Repo:
         :type repo_name: str
         :return: bool
         """
-        data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}')
+        data: dict = self._get_repo_data(repo_name)
         is_disabled: bool = data.get('disabled', False)
         return is_disabled
 
@@ -169,17 +882,19 @@ class Repo:
 class Branch:
     """A class that represent a Git branch."""
 
-    def __init__(self, token: str, owner: str, level: int = logging.INFO) -> None:
+    def __init__(self, token: str, owner: str, level: int = logging.INFO, http_utils: HttpUtil = None) -> None:
         """Class constructor
         :param token: An OAUTH2 token which can authenticate with GitHub.
         :param owner: The GitHub Enterprise organization name.
         :param level: A valid log level from the logging module. Default: logging.INFO
+        :param http_utils: An HttpUtil to share its response cache. Default: A new HttpUtil.
         :type token: str
         :type owner: str
         :type level: int
+        :type http_utils: HttpUtil
         """
         logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
-        self.http_utils: HttpUtil = HttpUtil(token)
+        self.http_utils: HttpUtil = http_utils or HttpUtil(token)
         self.owner: str = owner
 
     def has_branch_protection_rules(self, repo_name: str, branch: str) -> bool:
@@ -190,7 +905,8 @@ class Branch:
         :type branch: str
         :return: bool
         """
-        data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection')
+        with measure_phase(self.http_utils.metrics, 'audit'):
+            data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection')
         is_protected: bool = False
         message: str = data.get('message', 'Success')
         if message == 'Success':
@@ -213,10 +929,27 @@ class Branch:
         :type branch: str
         :return: dict
         """
-        data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection')
+        with measure_phase(self.http_utils.metrics, 'audit'):
+            data: dict = self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection')
         return data
 
-    def set_branch_protection_rules(self, repo_name: str, branch: str, rules: dict) -> None:
+    def get_current_branch_protection_rules(self, repo_name: str, branch: str) -> dict:
+        """Get the branch protection rules for a repository in the same shape as the payload of
+        set_branch_protection_rules, so they can be compared with the desired rules.
+        :param repo_name: The name of a GitHub repository under the organization.
+        :param branch: The git branch for which you want to get the branch protection rules.
+        :type repo_name: str
+        :type branch: str
+        :return: dict, or None if the branch has no branch protection rules.
+        :raises BranchProtectionError: If the branch protection rules cannot be read.
+        """
+        data: dict = self.get_branch_protection_rules(repo_name, branch)
+        if data.get('message') == 'Not Found':
+            logging.warning(f'The script was not able to determine if {repo_name} has branch protection rules. '
+                            f'This is happening if your token does not have org:admin privileges.')
+        return Rule.normalize_branch_protection_rules(data)
+
+    def set_branch_protection_rules(self, repo_name: str, branch: str, rules: dict) -> bool:
         """Set branch protection rules for a repository.
         :param repo_name: The name of a GitHub repository under the organization.
         :param branch: The git branch for which you want to set the branch protection rules.
@@ -224,9 +957,20 @@ class Branch:
         :type repo_name: str
         :type branch: str
         :type rules: dict
+        :return: bool, True if the rules have been set.
         """
         url: str = f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection'
-        self.http_utils.put(url, payload=rules)
+        with measure_phase(self.http_utils.metrics, 'write'):
+            response: Response = self.http_utils.put(url, payload=rules)
+        if response.status_code != 200:
+            try:
+                message = response.json().get('message')
+            except ValueError:
+                message = response.text
+            logging.error(f'Setting the branch protection rules of {repo_name} failed with HTTP status '
+                          f'{response.status_code}: {message}')
+            return False
+        return True
 
 
 class Rule:
@@ -241,7 +985,8 @@ class Rule:
 
     @staticmethod
     def get_default_branch_protection_rules():
-        """Get some opinionated branch protection rules.
+        """Get some opinionated branch protection rules.  Settings that are None are left as they are on branches that
+        already have branch protection rules, see merge_branch_protection_rules.
         :return: dict
         """
         rules: dict = {'required_status_checks': None,
@@ -254,3 +999,339 @@ class Rule:
                        'allow_force_pushes': True,
                        'allow_deletions': False}
         return rules
+
+    @staticmethod
+    def normalize_branch_protection_rules(data: dict) -> dict:
+        """Convert a response from the branch protection endpoint into the shape of the payload used to set the rules.
+        Settings that are reported as objects with an 'enabled' key become booleans, urls are dropped, and users, teams
+        and apps are reduced to sorted lists of their logins and slugs.
+        :param data: The response from Branch.get_branch_protection_rules.
+        :type data: dict
+        :return: dict, or None if the branch has no branch protection rules.
+        :raises BranchProtectionError: If the response is any other error, e.g. because the token lacks privileges.
+        """
+        if data.get('message') == 'Branch not protected':
+            return None
+        if 'message' in data:
+            raise BranchProtectionError(f"The branch protection rules could not be read: {data['message']}")
+
+        def enabled(setting) -> bool:
+            if isinstance(setting, dict):
+                return setting.get('enabled', False)
+            return bool(setting)
+
+        def actors(setting: dict) -> dict:
+            return {'users': sorted(u.get('login') for u in setting.get('users', [])),
+                    'teams': sorted(t.get('slug') for t in setting.get('teams', [])),
+                    'apps': sorted(a.get('slug') for a in setting.get('apps', []))}
+
+        rules: dict = {'required_status_checks': None,
+                       'enforce_admins': enabled(data.get('enforce_admins')),
+                       'required_pull_request_reviews': None,
+                       'restrictions': None,
+                       'required_linear_history': enabled(data.get('required_linear_history')),
+                       'allow_force_pushes': enabled(data.get('allow_force_pushes')),
+                       'allow_deletions': enabled(data.get('allow_deletions'))}
+        status_checks: dict = data.get('required_status_checks')
+        if status_checks is not None:
+            rules['required_status_checks'] = {'strict': status_checks.get('strict', False),
+                                               'contexts': sorted(status_checks.get('contexts', []))}
+        reviews: dict = data.get('required_pull_request_reviews')
+        if reviews is not None:
+            rules['required_pull_request_reviews'] = {
+                'dismiss_stale_reviews': reviews.get('dismiss_stale_reviews', False),
+                'require_code_owner_reviews': reviews.get('require_code_owner_reviews', False),
+                'required_approving_review_count': reviews.get('required_approving_review_count', 0)}
+            if reviews.get('dismissal_restrictions') is not None:
+                dismissal_restrictions: dict = actors(reviews['dismissal_restrictions'])
+                dismissal_restrictions.pop('apps')
+                rules['required_pull_request_reviews']['dismissal_restrictions'] = dismissal_restrictions
+        restrictions: dict = data.get('restrictions')
+        if restrictions is not None:
+            rules['restrictions'] = actors(restrictions)
+        return rules
+
+    @staticmethod
+    def merge_branch_protection_rules(current: dict, desired: dict) -> dict:
+        """Get the payload that applies the desired rules to a branch, while keeping the current value of every setting
+        the desired rules leave out or set to None, e.g. the required status checks and push restrictions.
+        :param current: The current rules from Rule.normalize_branch_protection_rules, or None if the branch has no
+        branch protection rules.
+        :param desired: The desired rules, e.g. from Rule.get_default_branch_protection_rules.
+        :type current: dict
+        :type desired: dict
+        :return: dict
+        """
+        def merge(current_value, desired_value):
+            if desired_value is None:
+                return current_value
+            if isinstance(desired_value, dict) and isinstance(current_value, dict):
+                merged: dict = dict(current_value)
+                for key, value in desired_value.items():
+                    merged[key] = merge(current_value.get(key), value)
+                return merged
+            return desired_value
+
+        return merge(current or {}, desired)
+
+    @staticmethod
+    def diff_branch_protection_rules(current: dict, desired: dict) -> list:
+        """Compare the current branch protection rules of a branch with the desired rules.  Only the settings present in
+        the desired rules, and not None, are compared, so settings the policy does not care about are never reported as
+        drift.
+        :param current: The current rules from Rule.normalize_branch_protection_rules, or None if the branch has no
+        branch protection rules.
+        :param desired: The desired rules, e.g. from Rule.get_default_branch_protection_rules.
+        :type current: dict
+        :type desired: dict
+        :return: A list of (setting, current value, desired value) tuples, one for each setting that differs.  Nested
+        settings are named with dots, e.g. 'required_pull_request_reviews.dismiss_stale_reviews'.
+        """
+        changes: list = []
+
+        def compare(prefix: str, current_value, desired_value) -> None:
+            if desired_value is None:
+                return
+            if isinstance(desired_value, dict) and isinstance(current_value, dict):
+                for key, value in desired_value.items():
+                    compare(f'{prefix}.{key}' if prefix else key, current_value.get(key), value)
+            else:
+                if isinstance(desired_value, list) and isinstance(current_value, list):
+                    desired_value = sorted(desired_value)
+                if current_value != desired_value:
+                    changes.append((prefix, current_value, desired_value))
+
+        compare('', current or {}, desired)
+        return changes
+
+
+class AsyncHttpUtil:
+    """An asyncio utility class for HTTP verbs, based on httpx."""
+
+    def __init__(self, token: str, level: int = logging.INFO, max_concurrency: int = 20, transport=None) -> None:
+        """Class constructor.
+        :param token: An OAUTH2 token which can authenticate with GitHub.
+        :param level: A valid log level from the logging module. Default: logging.INFO
+        :param max_concurrency: The maximum number of requests in flight. Default: 20
+        :param transport: The httpx transport to send the requests with. Default: None, which connects to GitHub.
+        :type token: str
+        :type level: int
+        :type max_concurrency: int
+        :type transport: httpx.AsyncBaseTransport
+        """
+        if httpx is None:
+            raise ImportError('The async GitHub clients require the httpx package.')
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
+        # httpx logs every request at INFO level
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        self.token: str = token
+        self.max_concurrency: int = max_concurrency
+        self.stats: RequestStats = REQUEST_STATS
+        self._transport = transport
+        self._client = None
+        self._semaphore: asyncio.Semaphore = None
+
+    def _get_client(self):
+        """Private method for creating the connection pool on first use, so it belongs to the running event loop.
+        :return: httpx.AsyncClient
+        """
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(limits=limits, timeout=30.0, transport=self._transport)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self) -> None:
+        """Close the connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def _request(self, method: str, url: str, headers: dict, **kwargs):
+        """Private method for doing an HTTP request, retrying with backoff when GitHub reports a rate limit or a server error.
+        :return: httpx.Response
+        """
+        client = self._get_client()
+        attempt: int = 0
+        while True:
+            async with self._semaphore:
+                start: float = time.monotonic()
+                response = await client.request(method, url, headers=headers, **kwargs)
+                self.stats.record(time.monotonic() - start, response.status_code)
+            # httpx responses expose the same status, headers and text as requests
+            delay: float = HttpUtil._get_retry_delay(response, attempt)
+            if delay is None or attempt >= MAX_RETRIES:
+                return response
+            logging.warning(f'{method} {url} returned HTTP status {response.status_code}, retrying in {delay:.0f} seconds.')
+            self.stats.record_retry()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url: str, params: dict = None) -> dict:
+        """Utility method for doing HTTP GET.
+        :param url: The full url to the REST API endpoint.
+        :param params: Query parameters to the REST API endpoint. Default: None
+        :type url: str
+        :type params: dict
+        :return: dict
+        """
+        headers: dict = {'Accept': 'application/vnd.github.v3+json', 'Authorization': f'token {self.token}'}
+        response = await self._request('GET', url, headers, params=params)
+        return response.json()
+
+    async def post(self, url: str, payload: dict):
+        """Utility method for doing HTTP POST.
+        :param url: The full url to the REST API endpoint.
+        :param payload: A dictionary which can be serialized into a JSON payload.
+        :type url: str
+        :type payload: dict
+        :return: httpx.Response
+        """
+        headers: dict = {'Accept': 'application/vnd.github.luke-cage-preview+json',
+                         'Authorization': f'token {self.token}'}
+        return await self._request('POST', url, headers, json=payload)
+
+    async def put(self, url: str, payload: dict):
+        """Utility method for doing HTTP PUT.
+        :param url: The full url to the REST API endpoint.
+        :param payload: A dictionary which can be serialized into a JSON payload.
+        :type url: str
+        :type payload: dict
+        :return: httpx.Response
+        """
+        headers: dict = {'Accept': 'application/vnd.github.luke-cage-preview+json',
+                         'Authorization': f'token {self.token}'}
+        return await self._request('PUT', url, headers, json=payload)
+
+
+class AsyncRepo:
+    """An asyncio variant of Repo, with the same methods as coroutines.  Calls can be fanned out with asyncio.gather,
+    and are bounded by the concurrency limit of the AsyncHttpUtil."""
+
+    def __init__(self, token: str, owner: str, level: int = logging.INFO, http_utils: AsyncHttpUtil = None) -> None:
+        """Class constructor.
+        :param token: An OAUTH2 token which can authenticate with GitHub.
+        :param owner: The GitHub Enterprise organization name.
+        :param level: A valid log level from the logging module. Default: logging.INFO
+        :param http_utils: An AsyncHttpUtil to share its connection pool. Default: A new AsyncHttpUtil.
+        :type token: str
+        :type owner: str
+        :type level: int
+        :type http_utils: AsyncHttpUtil
+        """
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
+        self.http_utils: AsyncHttpUtil = http_utils or AsyncHttpUtil(token)
+        self.owner: str = owner
+
+    async def _get_number_of_repos(self) -> int:
+        """Private method for counting the total number of repositories in the organization.
+        :return: int
+        """
+        data: dict = await self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}')
+        return data.get('public_repos', 0) + data.get('total_private_repos', 0)
+
+    async def get_all_repos(self, limit: int = None) -> list:
+        """Get a list of all the repositories in the organization.  All pages are requested concurrently once the number
+        of repositories is known.
+        :param limit: Instead of fetching all repositories, you can opt to just fetch the 'n' first repositories sorted
+        alphabetically. This is useful during development or diagnostics. Default: None.
+        :return: list
+        """
+        page_limit: int = 50
+        number_of_repos: int = limit
+        if number_of_repos is None:
+            number_of_repos = await self._get_number_of_repos()
+        number_of_pages: int = -(-number_of_repos // page_limit)
+        pages: list = await asyncio.gather(*(
+            self.http_utils.get(url=f'{API_URL}/orgs/{self.owner}/repos',
+                                params={'type': 'all', 'sort': 'full_name', 'per_page': page_limit, 'page': page_counter})
+            for page_counter in range(1, number_of_pages + 1)))
+        all_repos: list = [r for fragment in pages for r in fragment]
+        return all_repos[:number_of_repos]
+
+    @staticmethod
+    def get_protected_repos() -> list:
+        """
+        Get a list of protected repositories, i.e. repos that should not have set new branch protection rules.
+        :return: list
+        """
+        return PROTECTED_REPOS
+
+    async def get_default_branch(self, repo_name: str) -> str:
+        """Find the default branch for a given repository.
+        :param repo_name: The name of a GitHub repository under the organization.
+        :type repo_name: str
+        :return: str
+        """
+        data: dict = await self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}')
+        return data.get('default_branch')
+
+
+class AsyncBranch:
+    """An asyncio variant of Branch, with the same methods as coroutines.  Calls can be fanned out with asyncio.gather,
+    and are bounded by the concurrency limit of the AsyncHttpUtil."""
+
+    def __init__(self, token: str, owner: str, level: int = logging.INFO, http_utils: AsyncHttpUtil = None) -> None:
+        """Class constructor
+        :param token: An OAUTH2 token which can authenticate with GitHub.
+        :param owner: The GitHub Enterprise organization name.
+        :param level: A valid log level from the logging module. Default: logging.INFO
+        :param http_utils: An AsyncHttpUtil to share its connection pool. Default: A new AsyncHttpUtil.
+        :type token: str
+        :type owner: str
+        :type level: int
+        :type http_utils: AsyncHttpUtil
+        """
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=level)
+        self.http_utils: AsyncHttpUtil = http_utils or AsyncHttpUtil(token)
+        self.owner: str = owner
+
+    async def get_branch_protection_rules(self, repo_name: str, branch: str) -> dict:
+        """Get the branch protection rules for a repository.
+        :param repo_name: The name of a GitHub repository under the organization.
+        :param branch: The git branch for which you want to get the branch protection rules.
+        :type repo_name: str
+        :type branch: str
+        :return: dict
+        """
+        return await self.http_utils.get(f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection')
+
+    async def get_current_branch_protection_rules(self, repo_name: str, branch: str) -> dict:
+        """Get the branch protection rules for a repository in the same shape as the payload of
+        set_branch_protection_rules, so they can be compared with the desired rules.
+        :param repo_name: The name of a GitHub repository under the organization.
+        :param branch: The git branch for which you want to get the branch protection rules.
+        :type repo_name: str
+        :type branch: str
+        :return: dict, or None if the branch has no branch protection rules.
+        :raises BranchProtectionError: If the branch protection rules cannot be read.
+        """
+        data: dict = await self.get_branch_protection_rules(repo_name, branch)
+        if data.get('message') == 'Not Found':
+            logging.warning(f'The script was not able to determine if {repo_name} has branch protection rules. '
+                            f'This is happening if your token does not have org:admin privileges.')
+        return Rule.normalize_branch_protection_rules(data)
+
+    async def set_branch_protection_rules(self, repo_name: str, branch: str, rules: dict) -> bool:
+        """Set branch protection rules for a repository.
+        :param repo_name: The name of a GitHub repository under the organization.
+        :param branch: The git branch for which you want to set the branch protection rules.
+        :param rules: A dictionary with all the branch protection rules to apply.
+        :type repo_name: str
+        :type branch: str
+        :type rules: dict
+        :return: bool, True if the rules have been set.
+        """
+        url: str = f'{API_URL}/repos/{self.owner}/{repo_name}/branches/{branch}/protection'
+        response = await self.http_utils.put(url, payload=rules)
+        if response.status_code != 200:
+            logging.error(f'Setting the branch protection rules of {repo_name} failed with HTTP status '
+                          f'{response.status_code}: {response.text}')
+            return False
+        return True
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+import threading
+
+
+class Journal:
+    """An append-only journal of the repositories that have been completed during a run, so an interrupted run can be
+    resumed without processing them again.  Each line of the file is a JSON object with the name of a repository and the
+    data recorded for it."""
+
+    def __init__(self, path: str, resume: bool = False, read_only: bool = False) -> None:
+        """Class constructor.
+        :param path: The file to keep the journal in.
+        :param resume: Keep the entries of an existing journal, so they can be skipped. Otherwise an existing journal is
+        truncated. Default: False
+        :param read_only: Only read the entries of an existing journal, without creating, truncating or writing to the
+        file, e.g. for a dry run. Default: False
+        :type path: str
+        :type resume: bool
+        :type read_only: bool
+        """
+        self._lock: threading.Lock = threading.Lock()
+        self.path: str = path
+        self.entries: dict = {}
+        if resume and os.path.isfile(path):
+            with open(path, 'r') as reader:
+                for line in reader:
+                    try:
+                        entry: dict = json.loads(line)
+                    except ValueError:
+                        # the last line is incomplete if the run died while writing it
+                        continue
+                    self.entries[entry['name']] = entry.get('data')
+            logging.info(f'Resuming from {path}, where {len(self.entries)} repositories have already been completed.')
+        self._writer = None
+        if read_only:
+            return
+        self._writer = open(path, 'a' if resume else 'w')
+        if self._writer.tell() > 0:
+            with open(path, 'rb') as reader:
+                reader.seek(-1, os.SEEK_END)
+                if reader.read(1) != b'\n':
+                    # start on a new line after an incomplete entry
+                    self._writer.write('\n')
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self.entries
+
+    def get(self, name: str):
+        """Get the data recorded for a repository.
+        :param name: The name of the repository.
+        :type name: str
+        :return: The recorded data, or None if the repository has not been completed.
+        """
+        with self._lock:
+            return self.entries.get(name)
+
+    def record(self, name: str, data=None) -> None:
+        """Record that a repository has been completed.  The entry is flushed to disk before returning, so it survives
+        the process being killed.
+        :param name: The name of the repository.
+        :param data: Any JSON serializable data to keep with the entry. Default: None
+        :type name: str
+        :raises ValueError: If the journal is read-only.
+        """
+        if self._writer is None:
+            raise ValueError(f'The journal {self.path} is read-only.')
+        line: str = json.dumps({'name': name, 'data': data}) + '\n'
+        with self._lock:
+            self.entries[name] = data
+            self._writer.write(line)
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+
+    def close(self) -> None:
+        """Close the journal file."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
@@ -0,0 +1,178 @@
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# the webhook events, and their actions, after which a repository is reconciled
+RECONCILE_EVENTS: dict = {'repository': ['created'],
+                          'branch_protection_rule': ['created', 'edited', 'deleted']}
+# GitHub caps webhook payloads at 25 MB, so anything larger is not a delivery
+MAX_BODY_SIZE: int = 25 * 1024 * 1024
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    """Check the X-Hub-Signature-256 header of a webhook delivery.
+    :param secret: The secret the webhook was configured with.
+    :param body: The raw body of the delivery.
+    :param signature: The value of the X-Hub-Signature-256 header.
+    :type secret: str
+    :type body: bytes
+    :type signature: str
+    :return: bool
+    """
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected: str = 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def is_reconcile_event(event: str, payload: dict) -> bool:
+    """Check if a webhook delivery should reconcile the repository in it.
+    :param event: The value of the X-GitHub-Event header.
+    :param payload: The decoded body of the delivery.
+    :type event: str
+    :type payload: dict
+    :return: bool
+    """
+    if event == 'push':
+        # a repository that is not initialized with any files has no default branch to protect when it is created, so it
+        # is reconciled again when the first push creates that branch
+        repository: dict = payload.get('repository') or {}
+        default_branch_ref: str = f'refs/heads/{repository.get("default_branch")}'
+        return payload.get('created') is True and payload.get('ref') == default_branch_ref
+    return payload.get('action', '') in RECONCILE_EVENTS.get(event, [])
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Handles webhook deliveries from GitHub, and hands the affected repositories to the WebhookServer."""
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f'{self.address_string()} - {format % args}')
+
+    def _reply(self, status_code: int, message: str) -> None:
+        body: bytes = message.encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        # lets a load balancer or an orchestrator check that the daemon is alive
+        self._reply(200, 'OK')
+
+    def do_POST(self) -> None:
+        webhook: WebhookServer = self.server.webhook
+        try:
+            length: int = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            self._reply(400, 'Invalid Content-Length')
+            return
+        if length < 0:
+            self._reply(400, 'Invalid Content-Length')
+            return
+        if length > MAX_BODY_SIZE:
+            logging.warning(f'Rejected a webhook delivery of {length} bytes.')
+            self._reply(413, 'Payload too large')
+            return
+        body: bytes = self.rfile.read(length)
+        if not verify_signature(webhook.secret, body, self.headers.get('X-Hub-Signature-256')):
+            logging.warning('Rejected a webhook delivery with an invalid signature.')
+            self._reply(401, 'Invalid signature')
+            return
+        try:
+            payload: dict = json.loads(body)
+        except ValueError:
+            self._reply(400, 'Invalid payload')
+            return
+
+        event: str = self.headers.get('X-GitHub-Event', '')
+        action: str = payload.get('action', '')
+        repository: dict = payload.get('repository')
+        if isinstance(repository, dict) and is_reconcile_event(event, payload):
+            logging.info(f'Received {event}{"." if action else ""}{action} for repository {repository.get("name")}.')
+            webhook.submit(repository)
+            self._reply(202, 'Accepted')
+        else:
+            self._reply(200, 'Ignored')
+
+
+class WebhookServer:
+    """A server for GitHub organization webhooks.  Every repository named in a relevant event is reconciled by a pool of
+    worker threads, so deliveries are acknowledged right away."""
+
+    def __init__(self, reconcile, secret: str, host: str = '', port: int = 8080, workers: int = 1) -> None:
+        """Class constructor.
+        :param reconcile: A function that is called with the repository dictionary from an event.
+        :param secret: The secret the webhook was configured with, used to verify the deliveries.
+        :param host: The address to listen on. Default: All addresses.
+        :param port: The port to listen on. Default: 8080
+        :param workers: The number of repositories to reconcile concurrently. Default: 1
+        :type secret: str
+        :type host: str
+        :type port: int
+        :type workers: int
+        """
+        self.reconcile = reconcile
+        self.secret: str = secret
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: dict = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._workers: list = [threading.Thread(target=self._work, daemon=True) for _ in range(max(workers, 1))]
+        self.httpd: ThreadingHTTPServer = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+        self.httpd.webhook = self
+
+    @property
+    def port(self) -> int:
+        """The port the server listens on, which is useful when it was created with port 0.
+        :return: int
+        """
+        return self.httpd.server_address[1]
+
+    def submit(self, repository: dict) -> None:
+        """Queue a repository to be reconciled.  A repository that is already waiting is only reconciled once, with the
+        data from the latest event.
+        :param repository: The repository dictionary from an event.
+        :type repository: dict
+        """
+        name: str = repository.get('name')
+        with self._lock:
+            is_queued: bool = name in self._pending
+            self._pending[name] = repository
+        if not is_queued:
+            self._queue.put(name)
+
+    def _work(self) -> None:
+        while True:
+            name: str = self._queue.get()
+            if name is None:
+                return
+            with self._lock:
+                repository: dict = self._pending.pop(name)
+            try:
+                self.reconcile(repository)
+            except Exception:
+                logging.exception(f'Reconciling repository {name} failed.')
+            finally:
+                self._queue.task_done()
+
+    def serve_forever(self) -> None:
+        """Handle deliveries until shutdown is called."""
+        for worker in self._workers:
+            worker.start()
+        logging.info(f'Listening for webhook deliveries on port {self.port}.')
+        self.httpd.serve_forever()
+
+    def join(self) -> None:
+        """Wait until every queued repository has been reconciled."""
+        self._queue.join()
+
+    def shutdown(self) -> None:
+        """Stop handling deliveries, and stop the workers once the queued repositories have been reconciled."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for _ in self._workers:
+            self._queue.put(None)
@@ -1,43 +1,400 @@
 #!/usr/bin/env python3
+import asyncio
+import getopt
+import itertools
 import logging
 import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-from github.branch_protection import Repo, Branch, Rule
+from github.branch_protection import (REQUEST_STATS, AsyncBranch, AsyncHttpUtil, BranchProtectionError, GitHubApiError, HttpUtil,
+                                      Metrics, Repo, Branch, ResponseCache, Rule, WriteLimiter)
+from github.journal import Journal
+from github.webhook import WebhookServer
 
 GITHUB_ORGANIZATION = 'dfds'
+# the number of items per worker that are submitted ahead of the results
+QUEUED_ITEMS_PER_WORKER = 2
+# the number of repositories whose branch protection rules are fetched concurrently with --async
+ASYNC_BATCH_SIZE = 20
 
 
-def main():
+def show_usage():
+    out_str: str = """manage_branch_protection_rules.py
+
+Sets opinionated branch protection rules on the default branch of all repositories in the organization that do not
+have any branch protection rules yet.
+
+All parameters are optional
+
+     --enforce
+        Also update the rules of repositories that already have branch protection rules, when they differ from the
+        opinionated rules.  Only the settings the opinionated rules define are compared, and repositories that match
+        them are not written to.  Settings they leave out, such as required status checks and push restrictions,
+        keep their current value.
+
+     --dry-run
+        Print the changes that would be made, without making them.
+
+     --graphql
+        List the repositories with the GraphQL API, which also tells which default branches have branch protection
+        rules, 100 repositories per request.  Without --enforce no further requests are needed for protected
+        repositories, nor to check the unprotected ones.
+
+     --async
+        Fetch the branch protection rules of 20 repositories at a time concurrently, ahead of the audit, on one
+        connection pool.  Requires the httpx package.
+
+     --journal <file>
+        Record each repository in this file as soon as it has been reconciled.  A repository whose rules could not be
+        read or set is not recorded.  With --dry-run the file is not written to.
+
+     --resume
+        Continue an interrupted run from the file given with --journal.  Repositories recorded in it are skipped.
+        Without this parameter an existing journal is started afresh.
+
+     --daemon
+        Instead of going through all repositories once, keep running and listen for organization webhook deliveries.
+        Only the repository named in a repository created or branch_protection_rule event, or in the push that creates
+        the default branch of a repository, is reconciled.  The webhook secret is read from the GITHUB_WEBHOOK_SECRET
+        environment variable.
+
+     --port <number>
+        The port to listen on for webhook deliveries with --daemon.  Default: 8080
+
+     -w <number>, --workers <number>
+        The number of repositories to audit concurrently.  Default: 1
+
+     --write-workers <number>
+        The maximum number of branch protection rules to set concurrently.  Writes are also spaced at least one second
+        apart, as GitHub asks for mutating requests.  Default: 1
+
+     --http-cache <directory>
+        Keep GitHub API responses in this directory between runs.  They are revalidated with their ETag, so unchanged
+        resources are neither downloaded again nor counted against the rate limit.
+
+     --metrics <json|prometheus>
+        Report metrics at the end of the run: the calls, latency histogram and bytes transferred per GitHub API endpoint,
+        the rate limit headroom, and the time spent listing, auditing and writing.  Phases running in several workers are
+        all counted.
+
+     --metrics-file <file>
+        Write the metrics to this file instead of to stderr.
+
+     -h
+        Display this help information.
+
+The script exits with status 6 when the branch protection rules of any repository could not be read or set."""
+    print(out_str)
+
+
+def run_workers(function, items, workers: int = 1):
+    """Apply a function to every item, using a bounded pool of worker threads.
+    :param function: The function to call for each item.
+    :param items: The items to process.  An iterator is consumed at most QUEUED_ITEMS_PER_WORKER items per worker ahead
+    of the results, so a long iterator is not held in memory.
+    :param workers: The maximum number of items to process concurrently.
+    :return: An iterator over the results, in the same order as the items.
+    """
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: deque = deque()
+        for item in items:
+            if len(pending) >= workers * QUEUED_ITEMS_PER_WORKER:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+def select_candidate_repos(repos, protected_repos: list):
+    """Filter out the repositories that should not be updated, using only the data from the listing, so no API calls
+    are spent on them.
+    :param repos: An iterable of repositories as returned by the GitHub API.
+    :param protected_repos: The names of the repositories that must not be updated.
+    :return: An iterator over the repositories to audit.
+    """
+    for r in repos:
+        name: str = r.get('name')
+        if r.get('archived', False):
+            logging.info(f'Skipping repository {name}, because this repo has been archived.')
+        elif r.get('disabled', False):
+            logging.info(f'Skipping repository {name}, because this repo has been disabled.')
+        elif name in protected_repos:
+            logging.info(f'Repository {name} will not be updated, because it is on the protected repo list.')
+        else:
+            yield r
+
+
+def prefetch_protection(repos, branch: AsyncBranch, batch_size: int = ASYNC_BATCH_SIZE, enforce: bool = False):
+    """Fetch the branch protection rules of the repositories with the asyncio clients, a batch at a time, so the audit
+    does not wait for them one by one.
+    :param repos: An iterable of repositories, e.g. from select_candidate_repos.
+    :param branch: The AsyncBranch used to query GitHub.  Its connection pool is closed when the iterator is exhausted.
+    :param batch_size: The number of repositories to fetch concurrently. Default: ASYNC_BATCH_SIZE
+    :param enforce: Also fetch the rules of the repositories the listing reports as protected. Default: False
+    :return: An iterator over the repositories, in the same order.  The rules are added under the 'protection' key, as
+    returned by Branch.get_current_branch_protection_rules, unless they could not be read.
+    """
+    def needs_rules(r: dict) -> bool:
+        if r.get('default_branch') is None or r.get('protected') is False:
+            return False
+        return enforce or 'protected' not in r
+
+    async def fetch(r: dict) -> None:
+        try:
+            r['protection'] = await branch.get_current_branch_protection_rules(r.get('name'), r.get('default_branch'))
+        except BranchProtectionError:
+            # reconcile_repository reads the rules again, and reports the error
+            pass
+
+    async def fetch_all(batch: list) -> None:
+        await asyncio.gather(*(fetch(r) for r in batch if needs_rules(r)))
+
+    repos = iter(repos)
+    loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+    try:
+        while True:
+            batch: list = list(itertools.islice(repos, batch_size))
+            if len(batch) == 0:
+                return
+            loop.run_until_complete(fetch_all(batch))
+            yield from batch
+    finally:
+        loop.run_until_complete(branch.http_utils.aclose())
+        loop.close()
+
+
+def reconcile_repository(branch: Branch, r: dict, desired_rules: dict, enforce: bool = False, dry_run: bool = False,
+                         write_limiter: WriteLimiter = None) -> dict:
+    """Compare the branch protection rules of the default branch of a repository with the desired rules, and set them
+    if the repository has drifted.  Settings the desired rules do not care about keep their current value.
+    :param branch: The Branch instance used to query GitHub.
+    :param r: The repository data as returned by the GitHub API.  If it has the 'protected' key from
+    Repo.iter_all_repos_protection, the protection status is not fetched again, and neither are the rules under the
+    'protection' key from prefetch_protection.
+    :param desired_rules: The branch protection rules the default branch should have.
+    :param enforce: Also update branches that already have branch protection rules. Default: False
+    :param dry_run: Only work out the changes, without making them. Default: False
+    :param write_limiter: Bounds the concurrent writes. Default: None
+    :return: The planned change, as a dictionary with the repository, branch, action ('create' or 'update') and a list
+    of the changed settings, or None if the repository is left as it is.
+    :raises BranchProtectionError: If the current rules cannot be read, or the desired rules cannot be set.
+    """
+    name: str = r.get('name')
+    default_branch: str = r.get('default_branch')
+    if default_branch is None:
+        logging.info(f'Skipping repository {name}, because it does not have a default branch.')
+        return None
+
+    if r.get('protected') is True and not enforce:
+        logging.info(f'Skipping repository {name}, because it already has some branch protection rules set.')
+        return None
+    if r.get('protected') is False:
+        # the listing already tells that there are no rules, so there is nothing to fetch
+        current_rules: dict = None
+    elif 'protection' in r:
+        current_rules: dict = r['protection']
+    else:
+        current_rules: dict = branch.get_current_branch_protection_rules(name, default_branch)
+    if current_rules is not None and not enforce:
+        logging.info(f'Skipping repository {name}, because it already has some branch protection rules set.')
+        return None
+    changes: list = Rule.diff_branch_protection_rules(current_rules, desired_rules)
+    if current_rules is not None and len(changes) == 0:
+        logging.info(f'Skipping repository {name}, because its branch protection rules are up to date.')
+        return None
+
+    plan: dict = {'repository': name, 'branch': default_branch, 'action': 'create' if current_rules is None else 'update',
+                  'changes': changes}
+    if not dry_run:
+        with write_limiter or WriteLimiter():
+            logging.info(f'Set branch protection rules for repository {name}')
+            rules: dict = Rule.merge_branch_protection_rules(current_rules, desired_rules)
+            if not branch.set_branch_protection_rules(name, default_branch, rules):
+                raise BranchProtectionError(f'The branch protection rules of {name} could not be set.')
+    return plan
+
+
+def format_plan(plans: list) -> str:
+    """Format planned changes for display.
+    :param plans: Planned changes as returned by reconcile_repository.
+    :return: str
+    """
+    lines: list = []
+    for plan in plans:
+        lines.append(f"{plan['action']} {plan['repository']} ({plan['branch']})")
+        for setting, current_value, desired_value in plan['changes']:
+            lines.append(f'    {setting}: {current_value!r} -> {desired_value!r}')
+    lines.append(f'{len(plans)} repositories to change.')
+    return '\n'.join(lines)
+
+
+def main(argv):
+    http_cache_dir: str = None
+    workers: int = 1
+    write_workers: int = 1
+    enforce: bool = False
+    dry_run: bool = False
+    daemon: bool = False
+    use_graphql: bool = False
+    use_async: bool = False
+    journal_file: str = None
+    resume: bool = False
+    metrics_format: str = None
+    metrics_file: str = None
+    port: int = 8080
+
+    try:
+        opts, args = getopt.getopt(argv, 'hw:', ['workers=', 'write-workers=', 'http-cache=', 'enforce', 'dry-run', 'daemon',
+                                                 'port=', 'graphql', 'async', 'journal=', 'resume', 'metrics=', 'metrics-file='])
+    except getopt.GetoptError:
+        show_usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == '-h':
+            show_usage()
+            sys.exit()
+        elif opt in ('-w', '--workers'):
+            try:
+                workers = int(arg)
+            except ValueError:
+                show_usage()
+                sys.exit(2)
+        elif opt == '--write-workers':
+            try:
+                write_workers = int(arg)
+            except ValueError:
+                show_usage()
+                sys.exit(2)
+        elif opt == '--http-cache':
+            http_cache_dir = arg
+        elif opt == '--enforce':
+            enforce = True
+        elif opt == '--dry-run':
+            dry_run = True
+        elif opt == '--journal':
+            journal_file = arg
+        elif opt == '--resume':
+            resume = True
+        elif opt == '--metrics':
+            if arg not in ('json', 'prometheus'):
+                show_usage()
+                sys.exit(2)
+            metrics_format = arg
+        elif opt == '--metrics-file':
+            metrics_file = arg
+        elif opt == '--graphql':
+            use_graphql = True
+        elif opt == '--async':
+            use_async = True
+        elif opt == '--daemon':
+            daemon = True
+        elif opt == '--port':
+            try:
+                port = int(arg)
+            except ValueError:
+                show_usage()
+                sys.exit(2)
+
     token: str = os.environ.get('GITHUB_OAUTH2_TOKEN')
-    repo: Repo = Repo(token=token, owner=GITHUB_ORGANIZATION)
-    repo_list: list = repo.get_all_repos()
+    metrics: Metrics = Metrics() if metrics_format is not None else None
+    http_utils: HttpUtil = HttpUtil(token, cache=ResponseCache(http_cache_dir), metrics=metrics)
+    repo: Repo = Repo(token=token, owner=GITHUB_ORGANIZATION, http_utils=http_utils)
 
-    branch: Branch = Branch(token=token, owner=GITHUB_ORGANIZATION)
+    branch: Branch = Branch(token=token, owner=GITHUB_ORGANIZATION, http_utils=http_utils)
     rule: Rule = Rule()
+    desired_rules: dict = rule.get_default_branch_protection_rules()
+    write_limiter: WriteLimiter = WriteLimiter(write_workers)
+
+    # the repositories whose rules could not be read or set
+    failed_repos: list = []
+
+    journal: Journal = None
+    if journal_file is not None and not daemon:
+        # a dry run does not complete any repository, so it only skips the ones an earlier run has completed
+        journal = Journal(journal_file, resume, read_only=dry_run)
+
+    def process_repository(r: dict) -> dict:
+        name: str = r.get('name')
+        if journal is not None and name in journal:
+            logging.info(f'Skipping repository {name}, because it was completed by an earlier run.')
+            return None
+        try:
+            plan: dict = reconcile_repository(branch, r, desired_rules, enforce, dry_run, write_limiter)
+        except BranchProtectionError as e:
+            logging.error(f'Skipping repository {name}: {e}')
+            failed_repos.append(name)
+            return None
+        if journal is not None and not dry_run:
+            journal.record(name, plan)
+        return plan
+
+    if daemon:
+        secret: str = os.environ.get('GITHUB_WEBHOOK_SECRET')
+        if not secret:
+            logging.error('A webhook secret has not been defined in the GITHUB_WEBHOOK_SECRET environment variable.')
+            logging.error('The script cannot continue and will now terminate.')
+            sys.exit(3)
+
+        def reconcile_event_repository(r: dict) -> None:
+            # the repository in the event is fresher than any cached metadata, so it is used as it is
+            for candidate in select_candidate_repos([r], repo.get_protected_repos()):
+                plan: dict = reconcile_repository(branch, candidate, desired_rules, enforce, dry_run, write_limiter)
+                if plan is not None and dry_run:
+                    print(format_plan([plan]), flush=True)
+
+        server: WebhookServer = WebhookServer(reconcile_event_repository, secret, port=port, workers=workers)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        if metrics is not None:
+            metrics.write(metrics_format, metrics_file)
+        return
+
+    # repositories are listed lazily, so work starts as soon as the first page arrives
+    if use_graphql:
+        repo_iter = repo.iter_all_repos_protection()
+    else:
+        repo_iter = repo.iter_all_repos()
+    candidate_repos = select_candidate_repos(repo_iter, repo.get_protected_repos())
+    if use_async:
+        try:
+            async_http_utils: AsyncHttpUtil = AsyncHttpUtil(token, max_concurrency=ASYNC_BATCH_SIZE)
+        except ImportError as e:
+            logging.error(f'{e} Install it, or run the script without --async.')
+            sys.exit(4)
+        async_branch: AsyncBranch = AsyncBranch(token=token, owner=GITHUB_ORGANIZATION, http_utils=async_http_utils)
+        candidate_repos = prefetch_protection(candidate_repos, async_branch, ASYNC_BATCH_SIZE, enforce)
+    try:
+        plans: list = [plan for plan in run_workers(process_repository, candidate_repos, workers) if plan is not None]
+    except GitHubApiError as e:
+        # no plans would look like an organization where every repository is already protected
+        logging.error(f'Listing the repositories failed: {e}')
+        logging.error('The script cannot continue and will now terminate.')
+        sys.exit(5)
+
+    if journal is not None:
+        journal.close()
 
-    for repos in repo_list:
-        for r in repos:
-            name: str = r.get('name')
-            default_branch: str = r.get('default_branch')
-            is_archived: bool = r.get('archived', False)
-            is_disabled: bool = r.get('disabled', False)
-
-            has_rules: bool = branch.has_branch_protection_rules(name, default_branch)
-            if is_archived:
-                logging.info(f'Skipping repository {name}, because this repo has been archived.')
-            elif is_disabled:
-                logging.info(f'Skipping repository {name}, because this repo has been disabled.')
-            elif has_rules:
-                logging.info(f'Skipping repository {name}, because it already has some branch protection rules set.')
-            else:
-                if name not in repo.get_protected_repos():
-                    logging.info(f'Set branch protection rules for repository {name}')
-                    branch.set_branch_protection_rules(name,
-                                                       default_branch,
-                                                       rule.get_default_branch_protection_rules())
-                else:
-                    logging.info(f'Repository {name} will not be updated, because it is on the protected repo list.')
+    if dry_run:
+        print(format_plan(plans))
+    else:
+        logging.info(f'Branch protection rules were set for {len(plans)} repositories.')
+    if len(failed_repos) > 0:
+        logging.error(f'The branch protection rules of {len(failed_repos)} repositories could not be reconciled: '
+                      f'{", ".join(sorted(failed_repos))}')
+    logging.info(f'GitHub API usage: {REQUEST_STATS.as_dict()}')
+    if metrics is not None:
+        metrics.write(metrics_format, metrics_file)
+    if len(failed_repos) > 0:
+        sys.exit(6)
 
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
@@ -0,0 +1,367 @@
+import asyncio
+import itertools
+import json
+import os
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import httpx
+import requests
+
+import github.branch_protection
+import manage_branch_protection_rules
+from github.branch_protection import (AsyncBranch, AsyncHttpUtil, AsyncRepo, Branch, BranchProtectionError, GitHubApiError, HttpUtil,
+                                      Metrics, Repo, ResponseCache, Rule)
+
+# a response of the branch protection endpoint, for a branch that matches the default rules but also has required status
+# checks, push restrictions and dismissal restrictions
+PROTECTION_URL: str = 'https://api.github.com/repos/dfds/repo/branches/main/protection'
+PROTECTION_RESPONSE: dict = {
+    'url': PROTECTION_URL,
+    'required_status_checks': {'url': f'{PROTECTION_URL}/required_status_checks', 'strict': True,
+                               'contexts': ['ci/test', 'ci/build'],
+                               'checks': [{'context': 'ci/test', 'app_id': None}, {'context': 'ci/build', 'app_id': None}]},
+    'required_pull_request_reviews': {'url': f'{PROTECTION_URL}/required_pull_request_reviews',
+                                      'dismiss_stale_reviews': True,
+                                      'require_code_owner_reviews': False,
+                                      'required_approving_review_count': 1,
+                                      'dismissal_restrictions': {'users': [{'login': 'octocat'}], 'teams': [{'slug': 'platform'}],
+                                                                 'apps': []}},
+    'restrictions': {'url': f'{PROTECTION_URL}/restrictions', 'users': [],
+                     'teams': [{'slug': 'platform'}, {'slug': 'admins'}], 'apps': [{'slug': 'deploy-bot'}]},
+    'enforce_admins': {'url': f'{PROTECTION_URL}/enforce_admins', 'enabled': True},
+    'required_linear_history': {'enabled': False},
+    'allow_force_pushes': {'enabled': True},
+    'allow_deletions': {'enabled': False}}
+PROTECTION_RULES: dict = {
+    'required_status_checks': {'strict': True, 'contexts': ['ci/build', 'ci/test']},
+    'enforce_admins': True,
+    'required_pull_request_reviews': {'dismiss_stale_reviews': True,
+                                      'require_code_owner_reviews': False,
+                                      'required_approving_review_count': 1,
+                                      'dismissal_restrictions': {'users': ['octocat'], 'teams': ['platform']}},
+    'restrictions': {'users': [], 'teams': ['admins', 'platform'], 'apps': ['deploy-bot']},
+    'required_linear_history': False,
+    'allow_force_pushes': True,
+    'allow_deletions': False}
+
+
+def github_response(status_code: int, body, headers: dict = None) -> requests.Response:
+    response: requests.Response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeSession:
+    """Returns the given responses in order, and records the requests."""
+
+    def __init__(self, responses: list) -> None:
+        self.responses: list = responses
+        self.requests: list = []
+
+    def request(self, method: str, url: str, headers: dict = None, **kwargs) -> requests.Response:
+        self.requests.append((method, url, dict(headers or {}), kwargs))
+        return self.responses.pop(0)
+
+
+class TestRule(unittest.TestCase):
+
+    def test_responses_are_normalized_to_the_payload_shape(self):
+        self.assertEqual(Rule.normalize_branch_protection_rules(PROTECTION_RESPONSE), PROTECTION_RULES)
+        self.assertEqual(Rule.normalize_branch_protection_rules({'enforce_admins': {'enabled': False}}),
+                         {'required_status_checks': None, 'enforce_admins': False, 'required_pull_request_reviews': None,
+                          'restrictions': None, 'required_linear_history': False, 'allow_force_pushes': False,
+                          'allow_deletions': False})
+        self.assertIsNone(Rule.normalize_branch_protection_rules({'message': 'Branch not protected'}))
+        with self.assertRaisesRegex(BranchProtectionError, 'Not Found'):
+            Rule.normalize_branch_protection_rules({'message': 'Not Found'})
+
+    def test_settings_the_policy_does_not_care_about_are_not_drift(self):
+        desired_rules: dict = Rule.get_default_branch_protection_rules()
+        self.assertEqual(Rule.diff_branch_protection_rules(PROTECTION_RULES, desired_rules), [])
+
+        drifted: dict = dict(PROTECTION_RULES, enforce_admins=False, allow_force_pushes=False)
+        drifted['required_pull_request_reviews'] = dict(PROTECTION_RULES['required_pull_request_reviews'],
+                                                        required_approving_review_count=2)
+        self.assertEqual(Rule.diff_branch_protection_rules(drifted, desired_rules),
+                         [('enforce_admins', False, True),
+                          ('required_pull_request_reviews.required_approving_review_count', 2, 1),
+                          ('allow_force_pushes', False, True)])
+
+        # a branch without rules differs in every setting the policy cares about
+        changes: list = Rule.diff_branch_protection_rules(None, desired_rules)
+        self.assertEqual([setting for setting, _, _ in changes],
+                         ['enforce_admins', 'required_pull_request_reviews', 'required_linear_history', 'allow_force_pushes',
+                          'allow_deletions'])
+
+    def test_settings_the_policy_does_not_care_about_keep_their_value(self):
+        desired_rules: dict = Rule.get_default_branch_protection_rules()
+        drifted: dict = dict(PROTECTION_RULES, enforce_admins=False)
+        drifted['required_pull_request_reviews'] = dict(PROTECTION_RULES['required_pull_request_reviews'],
+                                                        dismiss_stale_reviews=False)
+        self.assertEqual(Rule.merge_branch_protection_rules(drifted, desired_rules), PROTECTION_RULES)
+        self.assertEqual(Rule.merge_branch_protection_rules(None, desired_rules), desired_rules)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_unchanged_responses_are_revalidated(self):
+        url: str = 'https://api.github.com/orgs/dfds'
+        with tempfile.TemporaryDirectory() as cache_dir:
+            session: FakeSession = FakeSession([github_response(200, {'public_repos': 1}, {'ETag': '"v1"'}),
+                                                github_response(304, None)])
+            http_utils: HttpUtil = HttpUtil('token', session=session, cache=ResponseCache(cache_dir))
+            self.assertEqual(http_utils.get(url), {'public_repos': 1})
+            self.assertNotIn('If-None-Match', session.requests[0][2])
+            self.assertEqual(http_utils.get(url), {'public_repos': 1})
+            self.assertEqual(session.requests[1][2]['If-None-Match'], '"v1"')
+
+            # a later run revalidates the response persisted by this one, and keeps a changed response instead
+            session = FakeSession([github_response(200, {'public_repos': 2}, {'ETag': '"v2"'}), github_response(304, None)])
+            http_utils = HttpUtil('token', session=session, cache=ResponseCache(cache_dir))
+            self.assertEqual(http_utils.get(url), {'public_repos': 2})
+            self.assertEqual(session.requests[0][2]['If-None-Match'], '"v1"')
+            self.assertEqual(http_utils.get(url), {'public_repos': 2})
+            self.assertEqual(session.requests[1][2]['If-None-Match'], '"v2"')
+
+            # another token can see other data, so it does not share the responses
+            session = FakeSession([github_response(200, {'public_repos': 0})])
+            self.assertEqual(HttpUtil('other token', session=session, cache=ResponseCache(cache_dir)).get(url), {'public_repos': 0})
+            self.assertNotIn('If-None-Match', session.requests[0][2])
+
+    def test_only_the_most_recently_used_responses_are_kept_in_memory(self):
+        cache: ResponseCache = ResponseCache(max_entries=2)
+        cache.put('a', '"a"', 'A')
+        cache.put('b', '"b"', 'B')
+        self.assertEqual(cache.get('a'), ('"a"', 'A'))
+        cache.put('c', '"c"', 'C')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), ('"a"', 'A'))
+        self.assertEqual(cache.get('c'), ('"c"', 'C'))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ResponseCache(cache_dir, max_entries=1)
+            cache.put('a', '"a"', 'A')
+            cache.put('b', '"b"', 'B')
+            self.assertEqual(len(cache._entries), 1)
+            # the forgotten response is read back from disk
+            self.assertEqual(cache.get('a'), ('"a"', 'A'))
+            self.assertEqual(list(cache._entries), ['a'])
+
+
+def repos_page(names: list, next_page: int = None) -> requests.Response:
+    headers: dict = {}
+    if next_page is not None:
+        headers['Link'] = f'<https://api.github.com/organizations/1/repos?page={next_page}>; rel="next"'
+    return github_response(200, [{'name': name} for name in names], headers)
+
+
+class TestListing(unittest.TestCase):
+
+    def test_next_links_are_followed(self):
+        session: FakeSession = FakeSession([repos_page(['a', 'b'], 2), repos_page(['c', 'd'], 3), repos_page(['e'])])
+        repo: Repo = Repo(token='', owner='dfds', http_utils=HttpUtil('', session=session))
+        repos = repo.iter_all_repos()
+        # the next page is only fetched once the previous one has been consumed
+        self.assertEqual(next(repos)['name'], 'a')
+        self.assertEqual(len(session.requests), 1)
+        self.assertEqual([r['name'] for r in repos], ['b', 'c', 'd', 'e'])
+        self.assertEqual([(url, kwargs.get('params')) for _, url, _, kwargs in session.requests],
+                         [('https://api.github.com/orgs/dfds/repos', {'type': 'all', 'sort': 'full_name', 'per_page': 100}),
+                          ('https://api.github.com/organizations/1/repos?page=2', None),
+                          ('https://api.github.com/organizations/1/repos?page=3', None)])
+
+        # a limit stops the listing without fetching further pages
+        session.responses, session.requests = [repos_page(['a', 'b'], 2)], []
+        self.assertEqual([r['name'] for r in repo.iter_all_repos(limit=2)], ['a', 'b'])
+        self.assertEqual(len(session.requests), 1)
+
+    def test_workers_only_consume_the_items_a_bit_ahead(self):
+        consumed: list = []
+
+        def items():
+            for i in itertools.count():
+                consumed.append(i)
+                yield i
+
+        results = manage_branch_protection_rules.run_workers(lambda i: i * 2, items(), workers=3)
+        self.assertEqual(list(itertools.islice(results, 10)), list(range(0, 20, 2)))
+        self.assertLessEqual(len(consumed), 10 + 3 * manage_branch_protection_rules.QUEUED_ITEMS_PER_WORKER)
+        results.close()
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        def rate_limit(remaining: int) -> dict:
+            return {'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Resource': 'core'}
+
+        self.responses: list = [github_response(404, {'message': 'Branch not protected'}, rate_limit(4999)),
+                                github_response(200, PROTECTION_RESPONSE, rate_limit(4998)),
+                                github_response(200, {}, rate_limit(4997))]
+        # a real session sets the request that was sent on the response, which is what the bytes sent are counted from
+        self.responses[2].request = requests.Request('PUT', PROTECTION_URL, json={'enforce_admins': True}).prepare()
+        self.metrics: Metrics = Metrics()
+        http_utils: HttpUtil = HttpUtil('', session=FakeSession(list(self.responses)), metrics=self.metrics)
+        branch: Branch = Branch(token='', owner='dfds', http_utils=http_utils)
+        # every reading of the clock is an eighth of a second later, so each request takes exactly that long
+        with mock.patch('github.branch_protection.time.monotonic', side_effect=itertools.count(0, 0.125).__next__):
+            branch.get_branch_protection_rules('repo-a', 'main')
+            branch.get_branch_protection_rules('repo-b', 'main')
+            branch.set_branch_protection_rules('repo-a', 'main', {'enforce_admins': True})
+
+    def test_json_report(self):
+        endpoint: str = '/repos/{owner}/{repo}/branches/{branch}/protection'
+        histogram: dict = {'0.05': 0, '0.1': 0, '0.25': 1, '0.5': 1, '1.0': 1, '2.5': 1, '5.0': 1, '10.0': 1}
+        self.assertEqual(self.metrics.as_dict(), {
+            'endpoints': [{'method': 'GET', 'endpoint': endpoint, 'calls': 2, 'status_codes': {'404': 1, '200': 1},
+                           'latency_seconds': 0.25, 'latency_histogram': {bound: count * 2 for bound, count in histogram.items()},
+                           'bytes_sent': 0, 'bytes_received': len(self.responses[0].content) + len(self.responses[1].content)},
+                          {'method': 'PUT', 'endpoint': endpoint, 'calls': 1, 'status_codes': {'200': 1},
+                           'latency_seconds': 0.125, 'latency_histogram': histogram,
+                           'bytes_sent': len(b'{"enforce_admins": true}'), 'bytes_received': 2}],
+            'rate_limits': {'core': {'limit': 5000, 'remaining': 4997, 'lowest': 4997}},
+            'phases': {'audit': {'calls': 2, 'seconds': 0.75}, 'write': {'calls': 1, 'seconds': 0.375}}})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path: str = os.path.join(temp_dir, 'metrics.json')
+            self.metrics.write('json', path)
+            with open(path) as reader:
+                self.assertEqual(json.load(reader), self.metrics.as_dict())
+
+    def test_prometheus_report(self):
+        text: str = self.metrics.to_prometheus()
+        labels: str = 'method="GET",endpoint="/repos/{owner}/{repo}/branches/{branch}/protection"'
+        lines: list = text.splitlines()
+        for line in [f'github_requests_total{{{labels},status="404"}} 1',
+                     f'github_requests_total{{{labels},status="200"}} 1',
+                     f'github_request_duration_seconds_bucket{{{labels},le="0.1"}} 0',
+                     f'github_request_duration_seconds_bucket{{{labels},le="0.25"}} 2',
+                     f'github_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+                     f'github_request_duration_seconds_sum{{{labels}}} 0.25',
+                     f'github_request_duration_seconds_count{{{labels}}} 2',
+                     f'github_request_bytes_total{{{labels.replace("GET", "PUT")},direction="sent"}} 24',
+                     'github_rate_limit_remaining{resource="core"} 4997',
+                     'github_rate_limit_limit{resource="core"} 5000',
+                     'run_phase_calls_total{phase="audit"} 2',
+                     'run_phase_seconds_total{phase="write"} 0.375']:
+            self.assertIn(line, lines)
+        # every family is announced before its samples, and every sample is a name, labels and a number
+        families: list = re.findall(r'^# TYPE (\w+) (counter|gauge|histogram)$', text, re.MULTILINE)
+        self.assertEqual(len(families), 8)
+        for line in lines:
+            if not line.startswith('#'):
+                self.assertRegex(line, r'^\w+\{(\w+="[^"]*",)*\w+="[^"]*"\} [0-9.]+$')
+                self.assertTrue(any(line.startswith(name) for name, _ in families), line)
+        self.assertTrue(text.endswith('\n'))
+
+
+class TestGraphQL(unittest.TestCase):
+
+    def test_protection_status_is_mapped_to_the_rest_shape(self):
+        protected: dict = {'name': 'protected-repo', 'isArchived': False, 'isDisabled': False,
+                           'defaultBranchRef': {'name': 'main', 'branchProtectionRule': {'id': 'BPR_1'}}}
+        unprotected: dict = {'name': 'unprotected-repo', 'isArchived': True, 'isDisabled': False,
+                             'defaultBranchRef': {'name': 'master', 'branchProtectionRule': None}}
+        self.assertEqual(Repo._from_graphql_node(protected),
+                         {'name': 'protected-repo', 'archived': False, 'disabled': False, 'default_branch': 'main', 'protected': True})
+        self.assertEqual(Repo._from_graphql_node(unprotected),
+                         {'name': 'unprotected-repo', 'archived': True, 'disabled': False, 'default_branch': 'master',
+                          'protected': False})
+        # an empty repository does not have a default branch
+        self.assertEqual(Repo._from_graphql_node({'name': 'empty', 'defaultBranchRef': None}),
+                         {'name': 'empty', 'archived': False, 'disabled': False, 'default_branch': None, 'protected': False})
+
+    def test_pages_are_followed(self):
+        def page(names: list, has_next_page: bool) -> requests.Response:
+            nodes: list = [{'name': name, 'defaultBranchRef': {'name': 'main', 'branchProtectionRule': None}} for name in names]
+            return github_response(200, {'data': {'organization': {'repositories': {
+                'nodes': nodes, 'pageInfo': {'hasNextPage': has_next_page, 'endCursor': names[-1]}}}}})
+
+        session: FakeSession = FakeSession([page(['a', 'b'], True), page(['c'], False)])
+        repo: Repo = Repo(token='', owner='dfds', http_utils=HttpUtil('', session=session))
+        self.assertEqual([r['name'] for r in repo.iter_all_repos_protection()], ['a', 'b', 'c'])
+        self.assertEqual(session.requests[1][3]['json']['variables']['after'], 'b')
+
+    def test_errors_are_raised(self):
+        session: FakeSession = FakeSession([github_response(401, {'message': 'Bad credentials'}),
+                                            github_response(200, {'data': None, 'errors': [{'message': 'Boom'}]})])
+        repo: Repo = Repo(token='', owner='dfds', http_utils=HttpUtil('', session=session))
+        with self.assertRaisesRegex(GitHubApiError, '401: Bad credentials'):
+            list(repo.iter_all_repos_protection())
+        with self.assertRaisesRegex(GitHubApiError, 'Boom'):
+            list(repo.iter_all_repos_protection())
+
+    def test_main_exits_when_the_repositories_cannot_be_listed(self):
+        session: FakeSession = FakeSession([github_response(401, {'message': 'Bad credentials'})])
+        with mock.patch.object(github.branch_protection, '_session', session), \
+                mock.patch.dict(os.environ, {'GITHUB_OAUTH2_TOKEN': 'token'}):
+            with self.assertRaises(SystemExit) as exit_info:
+                manage_branch_protection_rules.main(['--graphql'])
+        self.assertEqual(exit_info.exception.code, 5)
+
+
+class TestAsyncClients(unittest.TestCase):
+
+    def setUp(self):
+        self.requests: list = []
+        self.responses: dict = {}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.responses[request.url.path]
+        if isinstance(response, list):
+            response = response.pop(0)
+        return response
+
+    def http_utils(self) -> AsyncHttpUtil:
+        return AsyncHttpUtil('token', transport=httpx.MockTransport(self.handle))
+
+    def test_all_pages_are_requested(self):
+        self.responses['/orgs/dfds'] = httpx.Response(200, json={'public_repos': 60, 'total_private_repos': 40})
+        self.responses['/orgs/dfds/repos'] = [httpx.Response(200, json=[{'name': f'repo-{i}'} for i in range(50)]),
+                                              httpx.Response(200, json=[{'name': f'repo-{i}'} for i in range(50, 100)])]
+        repo: AsyncRepo = AsyncRepo(token='token', owner='dfds', http_utils=self.http_utils())
+        repos: list = asyncio.run(repo.get_all_repos())
+        self.assertEqual([r['name'] for r in repos], [f'repo-{i}' for i in range(100)])
+        self.assertEqual(sorted(r.url.params['page'] for r in self.requests[1:]), ['1', '2'])
+        self.assertEqual(self.requests[0].headers['Authorization'], 'token token')
+
+    def test_server_errors_are_retried(self):
+        url: str = '/repos/dfds/repo/branches/main/protection'
+        self.responses[url] = [httpx.Response(502, text='Bad Gateway'),
+                               httpx.Response(200, json={'enforce_admins': {'enabled': True}})]
+        branch: AsyncBranch = AsyncBranch(token='token', owner='dfds', http_utils=self.http_utils())
+        with mock.patch('github.branch_protection.asyncio.sleep', mock.AsyncMock()) as sleep:
+            rules: dict = asyncio.run(branch.get_current_branch_protection_rules('repo', 'main'))
+        self.assertTrue(rules['enforce_admins'])
+        self.assertEqual(len(self.requests), 2)
+        sleep.assert_awaited_once_with(1)
+
+    def test_prefetched_rules_are_not_fetched_again(self):
+        self.responses['/repos/dfds/protected-repo/branches/main/protection'] = httpx.Response(
+            200, json={'enforce_admins': {'enabled': True}, 'allow_force_pushes': {'enabled': True},
+                       'required_pull_request_reviews': {'dismiss_stale_reviews': True, 'required_approving_review_count': 1}})
+        self.responses['/repos/dfds/new-repo/branches/main/protection'] = httpx.Response(
+            404, json={'message': 'Branch not protected'})
+        branch: AsyncBranch = AsyncBranch(token='token', owner='dfds', http_utils=self.http_utils())
+        repos: list = [{'name': 'protected-repo', 'default_branch': 'main'}, {'name': 'new-repo', 'default_branch': 'main'},
+                       {'name': 'empty-repo', 'default_branch': None}]
+        prefetched: list = list(manage_branch_protection_rules.prefetch_protection(repos, branch, batch_size=2))
+        self.assertEqual([r['name'] for r in prefetched], ['protected-repo', 'new-repo', 'empty-repo'])
+        self.assertEqual(prefetched[1]['protection'], None)
+        self.assertNotIn('protection', prefetched[2])
+
+        sync_branch: mock.Mock = mock.Mock()
+        desired_rules: dict = manage_branch_protection_rules.Rule.get_default_branch_protection_rules()
+        plans: list = [manage_branch_protection_rules.reconcile_repository(sync_branch, r, desired_rules, dry_run=True)
+                       for r in prefetched]
+        self.assertEqual([plan and plan['action'] for plan in plans], [None, 'create', None])
+        sync_branch.get_current_branch_protection_rules.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import hashlib
+import hmac
+import http.client
+import json
+import threading
+import unittest
+
+from github.webhook import MAX_BODY_SIZE, WebhookServer, verify_signature
+
+SECRET: str = 'It is a secret to everybody.'
+
+
+def sign(body: bytes, secret: str = SECRET) -> str:
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class TestVerifySignature(unittest.TestCase):
+
+    def test_valid_signature(self):
+        body: bytes = b'{"zen": "Keep it logically awesome."}'
+        self.assertTrue(verify_signature(SECRET, body, sign(body)))
+
+    def test_invalid_signature(self):
+        body: bytes = b'{"zen": "Keep it logically awesome."}'
+        self.assertFalse(verify_signature(SECRET, body, sign(body, 'another secret')))
+        self.assertFalse(verify_signature(SECRET, body + b' ', sign(body)))
+        self.assertFalse(verify_signature(SECRET, body, sign(body)[len('sha256='):]))
+
+    def test_missing_signature(self):
+        self.assertFalse(verify_signature(SECRET, b'{}', None))
+        self.assertFalse(verify_signature(SECRET, b'{}', ''))
+
+
+class TestWebhookServer(unittest.TestCase):
+
+    def setUp(self):
+        self.reconciled: list = []
+        # lets a test hold the workers back, so deliveries pile up in the queue
+        self.release: threading.Event = threading.Event()
+        self.release.set()
+        self.server: WebhookServer = WebhookServer(self.reconcile, SECRET, host='127.0.0.1', port=0)
+        self.thread: threading.Thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.release.set()
+        self.server.shutdown()
+        self.thread.join()
+
+    def reconcile(self, repository: dict) -> None:
+        self.release.wait()
+        self.reconciled.append(repository)
+
+    def post(self, event: str, payload: dict = None, body: bytes = None, headers: dict = None) -> tuple:
+        if body is None:
+            body = json.dumps(payload).encode()
+        all_headers: dict = {'Content-Type': 'application/json', 'X-GitHub-Event': event, 'X-Hub-Signature-256': sign(body)}
+        all_headers.update(headers or {})
+        connection: http.client.HTTPConnection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+        try:
+            connection.request('POST', '/', body=body, headers=all_headers)
+            response: http.client.HTTPResponse = connection.getresponse()
+            return response.status, response.read().decode()
+        finally:
+            connection.close()
+
+    def test_repository_created_reconciles_the_repository(self):
+        status, _ = self.post('repository', {'action': 'created', 'repository': {'name': 'new-repo'}})
+        self.assertEqual(status, 202)
+        self.server.join()
+        self.assertEqual(self.reconciled, [{'name': 'new-repo'}])
+
+    def test_branch_protection_rule_reconciles_the_repository(self):
+        status, _ = self.post('branch_protection_rule', {'action': 'deleted', 'rule': {'name': 'main'},
+                                                         'repository': {'name': 'protected-repo'}})
+        self.assertEqual(status, 202)
+        self.server.join()
+        self.assertEqual(self.reconciled, [{'name': 'protected-repo'}])
+
+    def test_the_first_push_to_the_default_branch_reconciles_the_repository(self):
+        repository: dict = {'name': 'new-repo', 'default_branch': 'main'}
+        status, _ = self.post('push', {'ref': 'refs/heads/main', 'created': True, 'repository': repository})
+        self.assertEqual(status, 202)
+        # later pushes, and the first push to another branch, do not change the protection of the default branch
+        status, body = self.post('push', {'ref': 'refs/heads/main', 'created': False, 'repository': repository})
+        self.assertEqual((status, body), (200, 'Ignored'))
+        status, body = self.post('push', {'ref': 'refs/heads/feature', 'created': True, 'repository': repository})
+        self.assertEqual((status, body), (200, 'Ignored'))
+        self.server.join()
+        self.assertEqual(self.reconciled, [repository])
+
+    def test_duplicate_events_are_reconciled_once(self):
+        self.release.clear()
+        self.post('repository', {'action': 'created', 'repository': {'name': 'busy-repo'}})
+        # the worker is now held back with busy-repo, so these wait in the queue
+        self.post('branch_protection_rule', {'action': 'created', 'repository': {'name': 'repo', 'default_branch': 'master'}})
+        self.post('branch_protection_rule', {'action': 'edited', 'repository': {'name': 'repo', 'default_branch': 'main'}})
+        self.release.set()
+        self.server.join()
+        self.assertEqual(self.reconciled, [{'name': 'busy-repo'}, {'name': 'repo', 'default_branch': 'main'}])
+
+    def test_invalid_signature_is_rejected(self):
+        status, _ = self.post('repository', {'action': 'created', 'repository': {'name': 'new-repo'}},
+                              headers={'X-Hub-Signature-256': sign(b'{}')})
+        self.assertEqual(status, 401)
+        status, _ = self.post('repository', {'action': 'created', 'repository': {'name': 'new-repo'}},
+                              headers={'X-Hub-Signature-256': ''})
+        self.assertEqual(status, 401)
+        self.server.join()
+        self.assertEqual(self.reconciled, [])
+
+    def test_unknown_event_is_ignored(self):
+        status, body = self.post('push', {'ref': 'refs/heads/main', 'repository': {'name': 'repo'}})
+        self.assertEqual((status, body), (200, 'Ignored'))
+        status, body = self.post('repository', {'action': 'archived', 'repository': {'name': 'repo'}})
+        self.assertEqual((status, body), (200, 'Ignored'))
+        self.server.join()
+        self.assertEqual(self.reconciled, [])
+
+    def test_invalid_payload_is_rejected(self):
+        status, _ = self.post('repository', body=b'not json')
+        self.assertEqual(status, 400)
+
+    def test_invalid_content_length_is_rejected(self):
+        connection: http.client.HTTPConnection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+        try:
+            connection.putrequest('POST', '/')
+            connection.putheader('Content-Length', 'many')
+            connection.endheaders()
+            self.assertEqual(connection.getresponse().status, 400)
+        finally:
+            connection.close()
+
+    def test_too_large_body_is_rejected_before_it_is_read(self):
+        connection: http.client.HTTPConnection = http.client.HTTPConnection('127.0.0.1', self.server.port)
+        try:
+            connection.putrequest('POST', '/')
+            connection.putheader('Content-Length', str(MAX_BODY_SIZE + 1))
+            connection.endheaders()
+            # no body is sent, so this would hang if the server tried to read it
+            self.assertEqual(connection.getresponse().status, 413)
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+import github.branch_protection
+from github.branch_protection import Rule, WriteLimiter
+from github.journal import Journal
+from manage_branch_protection_rules import main, reconcile_repository, run_workers
+from tests.github.test_branch_protection import PROTECTION_RULES, FakeSession, github_response
+
+
+class FakeBranch:
+    """A stand-in for Branch, which records the rules that are set."""
+
+    def __init__(self, current_rules: dict = None, write_succeeds: bool = True, write_duration: float = 0.0) -> None:
+        self.current_rules: dict = current_rules
+        self.write_succeeds: bool = write_succeeds
+        self.write_duration: float = write_duration
+        self.written: list = []
+        self.writes_in_flight: int = 0
+        self.most_writes_in_flight: int = 0
+        self.write_starts: list = []
+        self._lock: threading.Lock = threading.Lock()
+
+    def get_current_branch_protection_rules(self, repo_name: str, branch: str) -> dict:
+        return self.current_rules
+
+    def set_branch_protection_rules(self, repo_name: str, branch: str, rules: dict) -> bool:
+        with self._lock:
+            self.write_starts.append(time.monotonic())
+            self.writes_in_flight += 1
+            self.most_writes_in_flight = max(self.most_writes_in_flight, self.writes_in_flight)
+        time.sleep(self.write_duration)
+        with self._lock:
+            self.writes_in_flight -= 1
+            self.written.append((repo_name, branch, rules))
+        return self.write_succeeds
+
+
+class TestReconcileRepository(unittest.TestCase):
+
+    def setUp(self):
+        self.desired_rules: dict = Rule.get_default_branch_protection_rules()
+        self.repository: dict = {'name': 'repo', 'default_branch': 'main'}
+
+    def test_a_branch_with_status_checks_and_the_desired_rules_is_left_alone(self):
+        branch: FakeBranch = FakeBranch(current_rules=PROTECTION_RULES)
+        self.assertIsNone(reconcile_repository(branch, self.repository, self.desired_rules, enforce=True))
+        self.assertEqual(branch.written, [])
+
+    def test_a_drifted_branch_keeps_the_settings_the_policy_does_not_care_about(self):
+        current_rules: dict = dict(PROTECTION_RULES, enforce_admins=False)
+        branch: FakeBranch = FakeBranch(current_rules=current_rules)
+        plan: dict = reconcile_repository(branch, self.repository, self.desired_rules, enforce=True)
+        self.assertEqual(plan, {'repository': 'repo', 'branch': 'main', 'action': 'update',
+                                'changes': [('enforce_admins', False, True)]})
+        # the status checks, push restrictions and dismissal restrictions are written back as they were
+        self.assertEqual(branch.written, [('repo', 'main', PROTECTION_RULES)])
+
+    def test_protected_branches_are_only_updated_with_enforce(self):
+        branch: FakeBranch = FakeBranch(current_rules=dict(PROTECTION_RULES, enforce_admins=False))
+        self.assertIsNone(reconcile_repository(branch, self.repository, self.desired_rules))
+        self.assertIsNone(reconcile_repository(branch, dict(self.repository, protected=True), self.desired_rules))
+        self.assertEqual(branch.written, [])
+
+    def test_an_unprotected_branch_gets_the_desired_rules(self):
+        branch: FakeBranch = FakeBranch()
+        plan: dict = reconcile_repository(branch, self.repository, self.desired_rules, dry_run=True)
+        self.assertEqual(plan['action'], 'create')
+        self.assertEqual(branch.written, [])
+        reconcile_repository(branch, self.repository, self.desired_rules)
+        self.assertEqual(branch.written, [('repo', 'main', self.desired_rules)])
+
+    def test_a_repository_without_a_default_branch_is_skipped(self):
+        branch: FakeBranch = FakeBranch()
+        self.assertIsNone(reconcile_repository(branch, {'name': 'empty', 'default_branch': None}, self.desired_rules))
+        self.assertEqual(branch.written, [])
+
+
+class TestParallelReconcile(unittest.TestCase):
+
+    def test_concurrent_writes_are_capped(self):
+        branch: FakeBranch = FakeBranch(write_duration=0.05)
+        write_limiter: WriteLimiter = WriteLimiter(2, interval=0)
+        desired_rules: dict = Rule.get_default_branch_protection_rules()
+        repos: list = [{'name': f'repo-{i}', 'default_branch': 'main'} for i in range(12)]
+
+        def reconcile(r: dict) -> dict:
+            return reconcile_repository(branch, r, desired_rules, write_limiter=write_limiter)
+
+        plans: list = list(run_workers(reconcile, repos, workers=8))
+        self.assertEqual([plan['repository'] for plan in plans], [r['name'] for r in repos])
+        self.assertEqual(len(branch.written), 12)
+        self.assertEqual(branch.most_writes_in_flight, 2)
+
+    def test_writes_are_spaced_out(self):
+        branch: FakeBranch = FakeBranch()
+        write_limiter: WriteLimiter = WriteLimiter(4, interval=0.05)
+        desired_rules: dict = Rule.get_default_branch_protection_rules()
+        repos: list = [{'name': f'repo-{i}', 'default_branch': 'main'} for i in range(4)]
+        list(run_workers(lambda r: reconcile_repository(branch, r, desired_rules, write_limiter=write_limiter), repos,
+                         workers=4))
+        starts: list = sorted(branch.write_starts)
+        self.assertTrue(all(later - earlier >= 0.04 for earlier, later in zip(starts, starts[1:])))
+
+    def test_a_failed_write_is_an_error(self):
+        branch: FakeBranch = FakeBranch(write_succeeds=False)
+        with self.assertRaises(github.branch_protection.BranchProtectionError):
+            reconcile_repository(branch, {'name': 'repo', 'default_branch': 'main'}, Rule.get_default_branch_protection_rules())
+
+    def test_main_does_not_report_a_failed_write_as_set(self):
+        listing: list = [{'name': 'failing-repo', 'default_branch': 'main'}, {'name': 'working-repo', 'default_branch': 'main'}]
+        session: FakeSession = FakeSession([github_response(200, listing),
+                                            github_response(404, {'message': 'Branch not protected'}),
+                                            github_response(403, {'message': 'Resource not accessible by integration'}),
+                                            github_response(404, {'message': 'Branch not protected'}),
+                                            github_response(200, {})])
+        with mock.patch.object(github.branch_protection, '_session', session), \
+                mock.patch.dict(os.environ, {'GITHUB_OAUTH2_TOKEN': 'token'}), \
+                mock.patch('github.branch_protection.time.sleep'), \
+                self.assertLogs(level='INFO') as logs:
+            with self.assertRaises(SystemExit) as exit_info:
+                main([])
+        self.assertEqual(exit_info.exception.code, 6)
+        self.assertEqual([method for method, *_ in session.requests], ['GET', 'GET', 'PUT', 'GET', 'PUT'])
+        output: str = '\n'.join(logs.output)
+        self.assertIn('Branch protection rules were set for 1 repositories.', output)
+        self.assertIn('could not be reconciled: failing-repo', output)
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.path: str = os.path.join(temp_dir.name, 'journal.jsonl')
+        journal: Journal = Journal(self.path)
+        journal.record('done-repo')
+        journal.close()
+        with open(self.path) as reader:
+            self.journal_content: str = reader.read()
+        self.listing: list = [{'name': 'done-repo', 'default_branch': 'main'}, {'name': 'new-repo', 'default_branch': 'main'}]
+
+    def run_main(self, argv: list, responses: list) -> FakeSession:
+        session: FakeSession = FakeSession(responses)
+        with mock.patch.object(github.branch_protection, '_session', session), \
+                mock.patch.dict(os.environ, {'GITHUB_OAUTH2_TOKEN': 'token'}), \
+                mock.patch('github.branch_protection.time.sleep'), \
+                contextlib.redirect_stdout(io.StringIO()):
+            main(argv)
+        return session
+
+    def test_a_dry_run_does_not_write_the_journal(self):
+        not_protected: requests.Response = github_response(404, {'message': 'Branch not protected'})
+        # the repository completed by the earlier run is skipped
+        session: FakeSession = self.run_main(['--dry-run', '--journal', self.path, '--resume'],
+                                             [github_response(200, self.listing), not_protected])
+        self.assertEqual([url for _, url, _, _ in session.requests][1:],
+                         ['https://api.github.com/repos/dfds/new-repo/branches/main/protection'])
+        # and without --resume the journal of the earlier run is not truncated either
+        self.run_main(['--dry-run', '--journal', self.path],
+                      [github_response(200, self.listing), not_protected, github_response(404, {'message': 'Branch not protected'})])
+        with open(self.path) as reader:
+            self.assertEqual(reader.read(), self.journal_content)
+
+    def test_only_reconciled_repositories_are_journaled(self):
+        listing: list = self.listing + [{'name': 'failing-repo', 'default_branch': 'main'}]
+        with self.assertRaises(SystemExit):
+            self.run_main(['--journal', self.path, '--resume'],
+                          [github_response(200, listing),
+                           github_response(404, {'message': 'Branch not protected'}), github_response(200, {}),
+                           github_response(404, {'message': 'Branch not protected'}), github_response(403, {'message': 'Forbidden'})])
+        self.assertEqual(list(Journal(self.path, resume=True, read_only=True).entries), ['done-repo', 'new-repo'])
+
+
+if __name__ == '__main__':
+    unittest.main()
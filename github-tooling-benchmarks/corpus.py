@@ -0,0 +1,183 @@
+import os
+import random
+import shutil
+import subprocess
+
+# the providers the synthetic Terraform files require, with the version
+# constraint they use and the latest version the fake registry reports
+PROVIDERS: list = [
+    ("hashicorp/aws", "~> 4.0", "5.31.0"),
+    ("hashicorp/azurerm", ">= 3.10", "3.85.0"),
+    ("hashicorp/kubernetes", "2.23.0", "2.24.0"),
+    ("hashicorp/random", "~> 3.5", "3.6.0"),
+    ("integrations/github", "~> 5.0", "5.42.0"),
+    ("datadog/datadog", "3.30.0", "3.34.0"),
+]
+
+_VERSIONS_TEMPLATE: str = """terraform {{
+  required_version = ">= 1.0"
+
+  required_providers {{
+{providers}
+  }}
+}}
+"""
+
+_FILLER_TEMPLATE: str = """# resources of module {index}
+resource "aws_s3_bucket" "bucket_{index}" {{
+  bucket = "${{var.prefix}}-bucket-{index}"
+
+  tags = {{
+    Name        = "bucket-{index}"
+    Environment = var.environment
+  }}
+}}
+
+variable "prefix_{index}" {{
+  type    = string
+  default = "benchmark"
+}}
+
+output "bucket_{index}_arn" {{
+  value = aws_s3_bucket.bucket_{index}.arn
+}}
+"""
+
+
+def _run_git(arguments: list, cwd: str) -> None:
+    subprocess.run(
+        ["git"] + arguments,
+        cwd=cwd,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def _write_files(path: str, files: dict) -> None:
+    for relative_path, content in files.items():
+        file_path: str = os.path.join(path, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as writer:
+            writer.write(content)
+
+
+def _repository_files(name: str, tf_files: int, providers: list) -> dict:
+    files: dict = {"README.md": f"# {name}\n\nA synthetic repository.\n"}
+    if len(providers) == 0:
+        files["src/main.py"] = "print('Hello')\n"
+        return files
+    provider_lines: list = [
+        f'    {source.split("/")[1]} = {{\n'
+        f'      source  = "{source}"\n'
+        f'      version = "{version}"\n'
+        "    }"
+        for source, version, _ in providers
+    ]
+    files["versions.tf"] = _VERSIONS_TEMPLATE.format(
+        providers="\n".join(provider_lines)
+    )
+    for index in range(1, tf_files):
+        files[f"modules/module_{index}/main.tf"] = _FILLER_TEMPLATE.format(index=index)
+    return files
+
+
+def generate_corpus(
+    path: str,
+    repos: int = 100,
+    tf_files: int = 5,
+    hcl_fraction: float = 0.5,
+    protected_fraction: float = 0.3,
+    git: bool = True,
+    seed: int = 42,
+    owner: str = "dfds",
+) -> dict:
+    """
+    Generate a synthetic organization of repositories.  Every repository is
+    written as a plain directory below <path>/src, and, when git is True, also
+    as a git repository below <path>/git that can be cloned with a file:// URL.
+    The same arguments always produce the same corpus.
+    :param path: The directory to write the corpus to.  It is emptied first.
+    :param repos: The number of repositories.
+    :param tf_files: The number of .tf files in each repository with HCL.
+    :param hcl_fraction: The fraction of the repositories that contain HCL.
+    :param protected_fraction: The fraction of the repositories whose default
+    branch already has branch protection rules.
+    :param git: Also create git repositories to clone.
+    :param seed: The seed for choosing the contents of the repositories.
+    :param owner: The name of the organization.
+    :return: A dictionary with the owner, the repositories and the latest
+    version of each provider, for the fake services.
+    """
+    random_generator: random.Random = random.Random(seed)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    source_path: str = os.path.join(path, "src")
+    git_path: str = os.path.join(path, "git")
+    os.makedirs(source_path)
+    os.makedirs(git_path)
+
+    corpus_repos: list = []
+    for index in range(repos):
+        name: str = f"repo-{index:05d}"
+        has_hcl: bool = random_generator.random() < hcl_fraction
+        providers: list = []
+        if has_hcl:
+            providers = random_generator.sample(
+                PROVIDERS, random_generator.randint(1, 3)
+            )
+        files: dict = _repository_files(name, max(tf_files, 1), providers)
+        _write_files(os.path.join(source_path, name), files)
+
+        repository_path: str = os.path.join(git_path, f"{name}.git")
+        if git:
+            shutil.copytree(os.path.join(source_path, name), repository_path)
+            _run_git(["init", "-q", "-b", "main"], repository_path)
+            _run_git(["add", "-A"], repository_path)
+            _run_git(
+                [
+                    "-c",
+                    "user.name=benchmark",
+                    "-c",
+                    "user.email=benchmark@example.com",
+                    "commit",
+                    "-q",
+                    "-m",
+                    "Initial commit",
+                ],
+                repository_path,
+            )
+
+        protection: dict = None
+        if random_generator.random() < protected_fraction:
+            protection = {
+                "required_status_checks": None,
+                "enforce_admins": False,
+                "required_pull_request_reviews": {
+                    "dismiss_stale_reviews": False,
+                    "require_code_owner_reviews": False,
+                    "required_approving_review_count": 1,
+                },
+                "restrictions": None,
+            }
+        corpus_repos.append(
+            {
+                "name": name,
+                "private": index % 3 == 0,
+                "archived": index % 17 == 16,
+                "disabled": False,
+                "default_branch": "main",
+                "pushed_at": "2021-06-01T12:00:00Z",
+                "clone_url": f"file://{os.path.abspath(repository_path)}",
+                "languages": ["HCL"] if has_hcl else ["Python"],
+                "protection": protection,
+            }
+        )
+
+    return {
+        "owner": owner,
+        "path": os.path.abspath(path),
+        "source_path": os.path.abspath(source_path),
+        "repos": corpus_repos,
+        "latest_versions": {source: latest for source, _, latest in PROVIDERS},
+    }
@@ -0,0 +1,381 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class ServiceLimits:
+    """
+    This class defines the latency and rate limits a fake service imposes on
+    its clients, and counts what happened to their requests.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit: int = None,
+        rate_limit_window: float = 3600.0,
+        max_concurrency: int = None,
+    ):
+        """
+        :param latency: The number of seconds to wait before each response.
+        :param rate_limit: The number of requests allowed per window, or None
+        for no primary rate limit.  Like on GitHub, a 304 response is free.
+        :param rate_limit_window: The length of a rate limit window in seconds.
+        :param max_concurrency: The number of requests that may be in flight at
+        the same time before the secondary rate limit answers with a 429, or
+        None for no secondary rate limit.
+        """
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.max_concurrency = max_concurrency
+        self._lock: threading.Lock = threading.Lock()
+        self._window_start: float = time.time()
+        self._used: int = 0
+        self._in_flight: int = 0
+        self.counters: dict = {
+            "requests": 0,
+            "not_modified": 0,
+            "rate_limited": 0,
+            "secondary_rate_limited": 0,
+        }
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def enter(self) -> dict:
+        """
+        Admit a request.
+        :return: None if the request may proceed, or the status code and headers
+        of the response that refuses it.
+        """
+        with self._lock:
+            self.counters["requests"] += 1
+            if (
+                self.max_concurrency is not None
+                and self._in_flight >= self.max_concurrency
+            ):
+                self.counters["secondary_rate_limited"] += 1
+                return {"status": 429, "headers": {"Retry-After": "1"}}
+            self._in_flight += 1
+        return None
+
+    def leave(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def use(self, free: bool = False) -> dict:
+        """
+        Take a request from the primary rate limit.
+        :param free: Only report the headroom, without using it.
+        :return: The rate limit headers, with 'status' set to 403 if the limit
+        has been exceeded.
+        """
+        if self.rate_limit is None:
+            return {}
+        with self._lock:
+            now: float = time.time()
+            if now - self._window_start >= self.rate_limit_window:
+                self._window_start = now
+                self._used = 0
+            reset: int = int(self._window_start + self.rate_limit_window)
+            if not free:
+                if self._used >= self.rate_limit:
+                    self.counters["rate_limited"] += 1
+                    return {
+                        "status": 403,
+                        "X-RateLimit-Limit": str(self.rate_limit),
+                        "X-RateLimit-Remaining": "0",
+                        "X-RateLimit-Reset": str(reset),
+                    }
+                self._used += 1
+            return {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.rate_limit - self._used),
+                "X-RateLimit-Reset": str(reset),
+            }
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _send(self, status: int, body, headers: dict = None) -> None:
+        data: bytes = b"" if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _handle(self, method: str) -> None:
+        service = self.server.service
+        limits: ServiceLimits = service.limits
+        refusal: dict = limits.enter()
+        if refusal is not None:
+            self._read_body()
+            self._send(refusal["status"], {"message": "rate limit"}, refusal["headers"])
+            return
+        try:
+            if limits.latency > 0:
+                time.sleep(limits.latency)
+            body: bytes = self._read_body()
+            status, data, headers = service.respond(
+                method, self.path, body, self.headers
+            )
+            etag: str = None
+            if method == "GET" and status == 200:
+                etag = '"' + hashlib.sha1(json.dumps(data).encode()).hexdigest() + '"'
+                headers["ETag"] = etag
+            if etag is not None and self.headers.get("If-None-Match") == etag:
+                limits.count("not_modified")
+                headers.update(limits.use(free=True))
+                self._send(304, None, headers)
+                return
+            rate_limit: dict = limits.use()
+            if rate_limit.pop("status", None) == 403:
+                self._send(403, {"message": "API rate limit exceeded"}, rate_limit)
+                return
+            headers.update(rate_limit)
+            self._send(status, data, headers)
+        finally:
+            limits.leave()
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+
+class FakeService:
+    """
+    This class defines the common parts of the fake services: a threaded HTTP
+    server on a free local port, and the limits it imposes.
+    """
+
+    def __init__(self, limits: ServiceLimits = None):
+        self.limits: ServiceLimits = limits or ServiceLimits()
+        self.httpd: ThreadingHTTPServer = ThreadingHTTPServer(
+            ("127.0.0.1", 0), _FakeRequestHandler
+        )
+        self.httpd.daemon_threads = True
+        self.httpd.service = self
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self) -> "FakeService":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def respond(self, method: str, path: str, body: bytes, headers) -> tuple:
+        """
+        Answer a request that has passed the limits.
+        :return: A tuple of the status code, the JSON body and the headers.
+        """
+        raise NotImplementedError
+
+
+class FakeGitHub(FakeService):
+    """
+    This class defines a stand-in for the parts of the GitHub REST and GraphQL
+    APIs that the GitHub tooling uses: listing the repositories of an
+    organization, the repository, language and branch protection endpoints,
+    and the repository listings over GraphQL.
+    """
+
+    PAGE_SIZE_LIMIT = 100
+
+    def __init__(self, corpus: dict, limits: ServiceLimits = None):
+        """
+        :param corpus: A corpus from corpus.generate_corpus.
+        :param limits: The latency and rate limits to impose.
+        """
+        super().__init__(limits)
+        self.owner: str = corpus["owner"]
+        self.repos: list = sorted(corpus["repos"], key=lambda r: r["name"])
+        self.repos_by_name: dict = {r["name"]: r for r in self.repos}
+        self._lock: threading.Lock = threading.Lock()
+        self.protection: dict = {
+            r["name"]: r["protection"]
+            for r in self.repos
+            if r.get("protection") is not None
+        }
+
+    def _rest_repo(self, r: dict) -> dict:
+        return {
+            "name": r["name"],
+            "full_name": f"{self.owner}/{r['name']}",
+            "archived": r["archived"],
+            "disabled": r["disabled"],
+            "default_branch": r["default_branch"],
+            "pushed_at": r["pushed_at"],
+            "clone_url": r["clone_url"],
+            "languages_url": f"{self.url}/repos/{self.owner}/{r['name']}/languages",
+        }
+
+    def _list_repos(self, query: dict) -> tuple:
+        per_page: int = min(int(query.get("per_page", ["30"])[0]), self.PAGE_SIZE_LIMIT)
+        page: int = int(query.get("page", ["1"])[0])
+        start: int = (page - 1) * per_page
+        items: list = [self._rest_repo(r) for r in self.repos[start : start + per_page]]
+        headers: dict = {}
+        if start + per_page < len(self.repos):
+            next_url: str = (
+                f"{self.url}/orgs/{self.owner}/repos?type=all&sort=full_name"
+                f"&per_page={per_page}&page={page + 1}"
+            )
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return 200, items, headers
+
+    def _graphql(self, body: bytes) -> tuple:
+        request: dict = json.loads(body)
+        variables: dict = request.get("variables", {})
+        first: int = min(int(variables.get("first", 100)), self.PAGE_SIZE_LIMIT)
+        start: int = int(variables.get("after") or 0)
+        nodes: list = []
+        for r in self.repos[start : start + first]:
+            with self._lock:
+                is_protected: bool = r["name"] in self.protection
+            nodes.append(
+                {
+                    "name": r["name"],
+                    "isArchived": r["archived"],
+                    "isDisabled": r["disabled"],
+                    "pushedAt": r["pushed_at"],
+                    "url": r["clone_url"][: -len(".git")],
+                    "defaultBranchRef": {
+                        "name": r["default_branch"],
+                        "branchProtectionRule": (
+                            {"pattern": r["default_branch"]} if is_protected else None
+                        ),
+                    },
+                    "languages": {
+                        "nodes": [{"name": language} for language in r["languages"]]
+                    },
+                }
+            )
+        end: int = start + len(nodes)
+        data: dict = {
+            "organization": {
+                "repositories": {
+                    "pageInfo": {
+                        "hasNextPage": end < len(self.repos),
+                        "endCursor": str(end),
+                    },
+                    "nodes": nodes,
+                }
+            }
+        }
+        return 200, {"data": data}, {}
+
+    def _protection_response(self, name: str) -> dict:
+        rules: dict = self.protection[name]
+        reviews: dict = rules.get("required_pull_request_reviews")
+        return {
+            "url": f"{self.url}/repos/{self.owner}/{name}/branches/main/protection",
+            "required_status_checks": rules.get("required_status_checks"),
+            "enforce_admins": {"enabled": rules.get("enforce_admins", False)},
+            "required_pull_request_reviews": (
+                None if reviews is None else dict(reviews)
+            ),
+            "restrictions": rules.get("restrictions"),
+            "required_linear_history": {
+                "enabled": rules.get("required_linear_history", False)
+            },
+            "allow_force_pushes": {"enabled": rules.get("allow_force_pushes", False)},
+            "allow_deletions": {"enabled": rules.get("allow_deletions", False)},
+        }
+
+    def respond(self, method: str, path: str, body: bytes, headers) -> tuple:
+        parsed = urlparse(path)
+        query: dict = parse_qs(parsed.query)
+        segments: list = parsed.path.strip("/").split("/")
+
+        if method == "POST" and parsed.path == "/graphql":
+            return self._graphql(body)
+        if segments[:1] == ["orgs"] and len(segments) >= 2:
+            if segments[1] != self.owner:
+                return 404, {"message": "Not Found"}, {}
+            if len(segments) == 2:
+                private: int = sum(1 for r in self.repos if r["private"])
+                return (
+                    200,
+                    {
+                        "login": self.owner,
+                        "public_repos": len(self.repos) - private,
+                        "total_private_repos": private,
+                    },
+                    {},
+                )
+            if segments[2:] == ["repos"]:
+                return self._list_repos(query)
+        if segments[:1] == ["repos"] and len(segments) >= 3:
+            r: dict = self.repos_by_name.get(segments[2])
+            if segments[1] != self.owner or r is None:
+                return 404, {"message": "Not Found"}, {}
+            if len(segments) == 3:
+                return 200, self._rest_repo(r), {}
+            if segments[3:] == ["languages"]:
+                return 200, {language: 1000 for language in r["languages"]}, {}
+            match = re.fullmatch(r"branches/(.+)/protection", "/".join(segments[3:]))
+            if match is not None:
+                if method == "PUT":
+                    with self._lock:
+                        self.protection[r["name"]] = json.loads(body)
+                    return 200, self._protection_response(r["name"]), {}
+                with self._lock:
+                    if r["name"] not in self.protection:
+                        return 404, {"message": "Branch not protected"}, {}
+                    return 200, self._protection_response(r["name"]), {}
+        return 404, {"message": "Not Found"}, {}
+
+
+class FakeRegistry(FakeService):
+    """
+    This class defines a stand-in for the provider endpoint of the Terraform
+    Registry, which reports the latest version of each provider.
+    """
+
+    def __init__(self, latest_versions: dict, limits: ServiceLimits = None):
+        """
+        :param latest_versions: The latest version of each provider name.
+        :param limits: The latency and rate limits to impose.
+        """
+        super().__init__(limits)
+        self.latest_versions: dict = latest_versions
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/v1/providers/"
+
+    def respond(self, method: str, path: str, body: bytes, headers) -> tuple:
+        provider_name: str = urlparse(path).path[len("/v1/providers/") :]
+        if method != "GET" or provider_name not in self.latest_versions:
+            return 404, {"errors": ["Not Found"]}, {}
+        return 200, {"version": self.latest_versions[provider_name]}, {}
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import getopt
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from corpus import generate_corpus
+from fake_services import FakeGitHub, FakeRegistry, ServiceLimits
+
+ROOT_PATH: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS: dict = {
+    "local": "get-terraform-provider-versions",
+    "github": "get-terraform-provider-versions",
+    "branch-protection": "github-branch-protection",
+}
+
+
+def show_usage():
+    out_str: str = """run_benchmarks.py
+
+Runs the GitHub tooling against a synthetic organization served by local
+stand-ins for the GitHub and Terraform Registry APIs, and reports the wall
+time, throughput and API usage of each scenario.  Nothing is sent to GitHub
+or to the Terraform Registry.
+
+All parameters are optional
+
+     -n <number>, --repos <number>
+        The number of repositories in the synthetic organization.  Default: 200
+
+     -t <number>, --tf-files <number>
+        The number of .tf files in each repository with HCL.  Default: 5
+
+     --hcl-fraction <fraction>
+        The fraction of the repositories that contain HCL.  Default: 0.5
+
+     --latency <milliseconds>
+        The time the fake services take to answer each request.  Default: 20
+
+     --rate-limit <number>
+        The number of requests the fake GitHub allows per window, after which
+        it answers with 403 until the window resets.  Default: No limit
+
+     --rate-limit-window <seconds>
+        The length of a rate limit window.  Default: 10
+
+     --max-concurrency <number>
+        The number of requests the fake GitHub handles at the same time before
+        it answers with 429 and a Retry-After header.  Default: No limit
+
+     -s <list>, --scenarios <list>
+        A comma separated list of the scenarios to run, out of local, github
+        and branch-protection.  Default: All scenarios
+
+     -w <number>, --workers <number>
+        The number of workers the tooling is run with.  Default: 8
+
+     --args <arguments>
+        Extra arguments to run the tooling with, e.g. '--fetch sparse'.
+
+     -o <file>, --output <file>
+        Write the results as JSON to this file, so they can be used as a
+        baseline later.
+
+     -b <file>, --baseline <file>
+        Compare the wall time of each scenario with the results in this file,
+        and exit with status 1 if any scenario is slower than the tolerance.
+
+     --tolerance <fraction>
+        How much slower than the baseline a scenario may be.  Default: 0.2
+
+     -k <directory>, --corpus-dir <directory>
+        Generate the corpus in this directory and keep it.  Default: A
+        temporary directory
+
+     -h
+        Display this help information."""
+    print(out_str)
+
+
+def get_scenario_command(scenario: str, corpus: dict, workers: int) -> list:
+    """
+    Get the command that runs a scenario.
+    :param scenario: The name of the scenario.
+    :param corpus: The corpus from generate_corpus.
+    :param workers: The number of workers to run the tooling with.
+    :return: The command, relative to the directory of the tool.
+    """
+    if scenario == "local":
+        return [
+            sys.executable,
+            "get_provider_versions.py",
+            "-l",
+            corpus["source_path"],
+            "-o",
+            "json",
+            "-w",
+            str(workers),
+        ]
+    if scenario == "github":
+        return [
+            sys.executable,
+            "get_provider_versions.py",
+            "-o",
+            "json",
+            "-w",
+            str(workers),
+        ]
+    # a dry run, as the one second between writes would dominate the timing
+    return [
+        sys.executable,
+        "manage_branch_protection_rules.py",
+        "--graphql",
+        "--enforce",
+        "--dry-run",
+        "-w",
+        str(workers),
+    ]
+
+
+def run_scenario(
+    scenario: str,
+    corpus: dict,
+    latency: float,
+    rate_limit: int,
+    rate_limit_window: float,
+    max_concurrency: int,
+    workers: int,
+    extra_args: list,
+) -> dict:
+    """
+    Run a single scenario against fresh fake services.
+    :return: A dictionary with the results of the scenario.
+    """
+    github: FakeGitHub = FakeGitHub(
+        corpus,
+        ServiceLimits(latency, rate_limit, rate_limit_window, max_concurrency),
+    ).start()
+    registry: FakeRegistry = FakeRegistry(
+        corpus["latest_versions"], ServiceLimits(latency)
+    ).start()
+    try:
+        with tempfile.TemporaryDirectory() as temp_folder:
+            metrics_file: str = os.path.join(temp_folder, "metrics.json")
+            command: list = get_scenario_command(scenario, corpus, workers)
+            command += extra_args + ["--metrics", "json", "--metrics-file"]
+            command.append(metrics_file)
+            environment: dict = dict(os.environ)
+            environment.update(
+                {
+                    "GITHUB_API_URL": github.url,
+                    "GITHUB_OAUTH2_TOKEN": "benchmark",
+                    "TFREGISTRY_BASEAPI": registry.base_url,
+                }
+            )
+            logging.info(f"Running the {scenario} scenario: {' '.join(command)}")
+            start: float = time.monotonic()
+            result = subprocess.run(
+                command,
+                cwd=os.path.join(ROOT_PATH, SCENARIOS[scenario]),
+                env=environment,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            wall_seconds: float = time.monotonic() - start
+            if result.returncode != 0:
+                logging.error(result.stderr)
+                raise RuntimeError(
+                    f"The {scenario} scenario exited with status {result.returncode}."
+                )
+            phases: dict = {}
+            if os.path.isfile(metrics_file):
+                with open(metrics_file, "r") as reader:
+                    phases = json.load(reader).get("phases", {})
+    finally:
+        github.stop()
+        registry.stop()
+
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "repos_per_second": round(len(corpus["repos"]) / wall_seconds, 1),
+        "github": dict(github.limits.counters),
+        "registry_requests": registry.limits.counters["requests"],
+        "phases": phases,
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Find the scenarios that have become slower than the baseline allows.
+    :return: A list of messages, one for each regression.
+    """
+    regressions: list = []
+    for scenario, result in results.items():
+        expected: dict = baseline.get("scenarios", {}).get(scenario)
+        if expected is None:
+            continue
+        limit: float = expected["wall_seconds"] * (1 + tolerance)
+        if result["wall_seconds"] > limit:
+            regressions.append(
+                f"The {scenario} scenario took {result['wall_seconds']}s, "
+                f"which is more than the {limit:.3f}s the baseline allows."
+            )
+    return regressions
+
+
+def main(argv):
+    repos: int = 200
+    tf_files: int = 5
+    hcl_fraction: float = 0.5
+    latency: float = 0.02
+    rate_limit: int = None
+    rate_limit_window: float = 10.0
+    max_concurrency: int = None
+    scenarios: list = list(SCENARIOS)
+    workers: int = 8
+    extra_args: list = []
+    output_file: str = ""
+    baseline_file: str = ""
+    tolerance: float = 0.2
+    corpus_dir: str = ""
+
+    try:
+        opts, args = getopt.getopt(
+            argv,
+            "hn:t:s:w:o:b:k:",
+            [
+                "repos=",
+                "tf-files=",
+                "hcl-fraction=",
+                "latency=",
+                "rate-limit=",
+                "rate-limit-window=",
+                "max-concurrency=",
+                "scenarios=",
+                "workers=",
+                "args=",
+                "output=",
+                "baseline=",
+                "tolerance=",
+                "corpus-dir=",
+            ],
+        )
+    except getopt.GetoptError:
+        show_usage()
+        sys.exit(2)
+
+    try:
+        for opt, arg in opts:
+            if opt == "-h":
+                show_usage()
+                sys.exit()
+            elif opt in ("-n", "--repos"):
+                repos = int(arg)
+            elif opt in ("-t", "--tf-files"):
+                tf_files = int(arg)
+            elif opt == "--hcl-fraction":
+                hcl_fraction = float(arg)
+            elif opt == "--latency":
+                latency = float(arg) / 1000
+            elif opt == "--rate-limit":
+                rate_limit = int(arg)
+            elif opt == "--rate-limit-window":
+                rate_limit_window = float(arg)
+            elif opt == "--max-concurrency":
+                max_concurrency = int(arg)
+            elif opt in ("-s", "--scenarios"):
+                scenarios = [scenario.strip() for scenario in arg.split(",")]
+            elif opt in ("-w", "--workers"):
+                workers = int(arg)
+            elif opt == "--args":
+                extra_args = arg.split()
+            elif opt in ("-o", "--output"):
+                output_file = arg
+            elif opt in ("-b", "--baseline"):
+                baseline_file = arg
+            elif opt == "--tolerance":
+                tolerance = float(arg)
+            elif opt in ("-k", "--corpus-dir"):
+                corpus_dir = arg
+    except ValueError:
+        show_usage()
+        sys.exit(2)
+    if any(scenario not in SCENARIOS for scenario in scenarios):
+        show_usage()
+        sys.exit(2)
+
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+    with tempfile.TemporaryDirectory() as temp_folder:
+        corpus_path: str = corpus_dir or os.path.join(temp_folder, "corpus")
+        logging.info(f"Generating a corpus of {repos} repositories in {corpus_path}.")
+        corpus: dict = generate_corpus(
+            corpus_path,
+            repos,
+            tf_files,
+            hcl_fraction,
+            git="github" in scenarios,
+        )
+        results: dict = {}
+        for scenario in scenarios:
+            results[scenario] = run_scenario(
+                scenario,
+                corpus,
+                latency,
+                rate_limit,
+                rate_limit_window,
+                max_concurrency,
+                workers,
+                extra_args if scenario != "branch-protection" else [],
+            )
+            logging.info(f"{scenario}: {results[scenario]}")
+
+    report: dict = {
+        "parameters": {
+            "repos": repos,
+            "tf_files": tf_files,
+            "hcl_fraction": hcl_fraction,
+            "latency_ms": latency * 1000,
+            "rate_limit": rate_limit,
+            "max_concurrency": max_concurrency,
+            "workers": workers,
+        },
+        "scenarios": results,
+    }
+    print(json.dumps(report, indent=2))
+    if output_file != "":
+        with open(output_file, "w") as writer:
+            json.dump(report, writer, indent=2)
+
+    if baseline_file != "":
+        with open(baseline_file, "r") as reader:
+            baseline: dict = json.load(reader)
+        regressions: list = compare_with_baseline(results, baseline, tolerance)
+        for regression in regressions:
+            logging.error(regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,10 +1,9 @@
-import json
-import os
-import subprocess
-from typing import TextIO
-
+from kubernetes import client, config
 from tabulate import tabulate
 
+from manage_unused_replicasets.listing import iter_projected_items
+from manage_unused_replicasets.records import DeploymentRecord, intern_string
+
 
 class Deployment:
     """
@@ -15,53 +14,54 @@ class Deployment:
         """
         Class constructor.
         """
+        config.load_kube_config()
+
+    @staticmethod
+    def _project(item: dict) -> DeploymentRecord:
+        """
+        Keep only the fields of a deployment that are needed for the reports.
+
+        :param item: The specification of a deployment.
+        :type item: dict
+
+        :return: DeploymentRecord
+        """
+        metadata: dict = item.get("metadata") or {}
+        spec: dict = item.get("spec") or {}
+        return DeploymentRecord(
+            namespace=intern_string(metadata.get("namespace")),
+            name=metadata.get("name"),
+            uid=intern_string(metadata.get("uid")),
+            api_version=intern_string(item.get("apiVersion")),
+            # Setting to 10 if not specified.
+            revision_history_limit=spec.get("revisionHistoryLimit", 10),
+        )
 
     @staticmethod
-    def _get_all_deployments_spec() -> list:
+    def _iter_all_deployment_records():
         """
-        Get all deployments in all namespaces and return a list with all the
-        specifications in JSON format.
+        Iterate over all deployments in all namespaces as they are received,
+        keeping only the fields of a DeploymentRecord.
 
-        :return: list
+        :return: An iterator over DeploymentRecord.
         """
-        os.environ.get("KUBECONFIG")
-        command: str = "kubectl get deployments -A -o json"
-        command_list: list = command.split(" ")
-        out_file: TextIO = open("deployments.json.tmp", "w")
-        subprocess.run(command_list, stdout=out_file)
-        with open("deployments.json.tmp") as json_file:
-            data: dict = json.load(json_file)
-            items: list = data.get("items")
-        return items
+        apps_v1: client.AppsV1Api = client.AppsV1Api()
+        return iter_projected_items(
+            apps_v1.list_deployment_for_all_namespaces, Deployment._project
+        )
 
     def get_deployments_with_high_revision_history_limit(self) -> list:
         """
         Get deployments with a high value for revisionHistoryLimit.
         In this case 'high' means higher than 10, which is the default.
 
-        :return: list
+        :return: A list of DeploymentRecord.
         """
-        deployments_spec = self._get_all_deployments_spec()
-        deployments: list = []
-        for item in deployments_spec:
-            item_with_type_hints: dict = item
-            metadata: dict = item_with_type_hints.get("metadata")
-            namespace: str = metadata.get("namespace")
-            name: str = metadata.get("name")
-            api_version: str = item_with_type_hints.get("apiVersion")
-            spec: dict = item_with_type_hints.get("spec")
-            revision_history_limit: int = spec.get(
-                "revisionHistoryLimit", 10
-            )  # Setting to 10 if not specified.
-            if revision_history_limit > 10:
-                problematic_deployment: dict = {
-                    "namespace": namespace,
-                    "name": name,
-                    "api_version": api_version,
-                    "revision_history_limit": revision_history_limit,
-                }
-                deployments.append(problematic_deployment)
-        return deployments
+        return [
+            deployment
+            for deployment in self._iter_all_deployment_records()
+            if deployment.revision_history_limit > 10
+        ]
 
     def print_deployments_with_high_revision_history_limit(self) -> None:
         """
@@ -69,9 +69,7 @@ class Deployment:
         In this case 'high' means higher than 10, which is the default.
         """
         deployments: list = self.get_deployments_with_high_revision_history_limit()
-        header = deployments[0].keys()
-        rows = [deployment.values() for deployment in deployments]
-        print(tabulate(rows, header))
+        print(tabulate(deployments, DeploymentRecord._fields))
 
     def create_script_to_patch_deployments(self, deployments: list = None) -> None:
         """
@@ -79,9 +77,8 @@ class Deployment:
         revisionHistoryLimit in deployments with a revisionHistoryLimit higher than
         the default value of 10.
 
-        :param deployments: A list of dictionary objects that contains the namespace,
-                            deployment name, api version and revisionHistoryLimit value
-                            for deployments that have a high revisionHistoryLimit.
+        :param deployments: A list of DeploymentRecord for deployments that have a high
+                            revisionHistoryLimit.
                             If not supplied, it will create the list of its own.
         :type deployments: list
         """
@@ -95,8 +92,8 @@ class Deployment:
             writer.write("#!/bin/bash\n")
             patch: str = '\'[{"op": "replace", "path": "/spec/revisionHistoryLimit", "value": 10}]\''
             for deployment in dp:
-                namespace: str = deployment.get("namespace")
-                name: str = deployment.get("name")
+                namespace: str = deployment.namespace
+                name: str = deployment.name
                 writer.write(
                     f"kubectl patch deployment -n {namespace} {name} --type=json -p={patch}\n"
                 )
@@ -0,0 +1,275 @@
+import logging
+import threading
+from typing import TextIO
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+
+from manage_unused_replicasets.deployment import Deployment
+from manage_unused_replicasets.listing import iter_projected_items
+from manage_unused_replicasets.records import DeploymentRecord, ReplicaSetRecord
+from manage_unused_replicasets.replicaset import ReplicaSet
+
+# the number of seconds a watch request is kept open before it is renewed
+WATCH_TIMEOUT: int = 300
+# the number of seconds to wait before retrying after an error
+RETRY_INTERVAL: int = 5
+# the status code of a watch or list whose resourceVersion is too old
+HTTP_STATUS_GONE: int = 410
+
+
+class Inventory:
+    """
+    An in-memory index of the deployments and replicasets in a cluster, which
+    is kept up to date from watch events.  The unused replicasets of each
+    deployment and the deployments with a high revisionHistoryLimit are
+    maintained as the events arrive, so a report does not need to look at
+    every replicaset.
+    """
+
+    def __init__(self) -> None:
+        """
+        Class constructor.
+        """
+        self._lock: threading.Lock = threading.Lock()
+        # all records are keyed by their namespace and name
+        self._deployments: dict = {}
+        self._high_revision_history_limit: dict = {}
+        self._replicasets: dict = {}
+        # the names of the unused replicasets per owner UID
+        self._unused_replicasets: dict = {}
+        self._synced: set = set()
+
+    def is_synced(self) -> bool:
+        """
+        Check if both deployments and replicasets have been listed.
+
+        :return: bool
+        """
+        with self._lock:
+            return self._synced == {DeploymentRecord, ReplicaSetRecord}
+
+    def _add(self, record) -> None:
+        key: tuple = (record.namespace, record.name)
+        if isinstance(record, DeploymentRecord):
+            self._deployments[key] = record
+            if record.revision_history_limit > 10:
+                self._high_revision_history_limit[key] = record
+        else:
+            self._replicasets[key] = record
+            if record.owner_kind == "Deployment" and record.is_unused:
+                self._unused_replicasets.setdefault(record.owner_uid, set()).add(
+                    record.name
+                )
+
+    def _remove(self, record) -> None:
+        key: tuple = (record.namespace, record.name)
+        if isinstance(record, DeploymentRecord):
+            self._deployments.pop(key, None)
+            self._high_revision_history_limit.pop(key, None)
+            return
+        previous: ReplicaSetRecord = self._replicasets.pop(key, None)
+        if previous is not None and previous.owner_uid in self._unused_replicasets:
+            names: set = self._unused_replicasets[previous.owner_uid]
+            names.discard(previous.name)
+            if len(names) == 0:
+                del self._unused_replicasets[previous.owner_uid]
+
+    def put(self, record) -> None:
+        """
+        Add or update a deployment or a replicaset.
+
+        :param record: A DeploymentRecord or a ReplicaSetRecord.
+        """
+        with self._lock:
+            self._remove(record)
+            self._add(record)
+
+    def delete(self, record) -> None:
+        """
+        Remove a deployment or a replicaset.
+
+        :param record: A DeploymentRecord or a ReplicaSetRecord.
+        """
+        with self._lock:
+            self._remove(record)
+
+    def replace(self, record_type: type, records: list) -> None:
+        """
+        Replace all deployments or all replicasets, e.g. after a relist.
+
+        :param record_type: DeploymentRecord or ReplicaSetRecord.
+        :param records: The records of that type that now exist.
+        :type record_type: type
+        :type records: list
+        """
+        with self._lock:
+            if record_type is DeploymentRecord:
+                self._deployments = {}
+                self._high_revision_history_limit = {}
+            else:
+                self._replicasets = {}
+                self._unused_replicasets = {}
+            for record in records:
+                self._add(record)
+            self._synced.add(record_type)
+
+    def _get_deployments_with_high_revision_history_limit(self) -> list:
+        return [
+            self._high_revision_history_limit[key]
+            for key in sorted(self._high_revision_history_limit)
+        ]
+
+    def get_deployments_with_high_revision_history_limit(self) -> list:
+        """
+        Get deployments with a revisionHistoryLimit higher than 10.
+
+        :return: A list of DeploymentRecord, sorted by namespace and name.
+        """
+        with self._lock:
+            return self._get_deployments_with_high_revision_history_limit()
+
+    def write_cvs_report(self, csvfile: TextIO) -> None:
+        """
+        Write the same report as ReplicaSet.create_cvs_report_with_unused_replicasets.
+
+        :param csvfile: The file to write to.
+        """
+        with self._lock:
+            ReplicaSet.write_cvs_report(
+                csvfile,
+                self._get_deployments_with_high_revision_history_limit(),
+                self._unused_replicasets,
+            )
+
+
+class ResourceWatcher(threading.Thread):
+    """
+    A thread that lists all objects of a kind once, and then follows a watch
+    stream from the resourceVersion of the list, applying every event to an
+    Inventory.  Bookmarks keep the resourceVersion current when there are no
+    changes, so a renewed watch does not fall too far behind.  When the
+    resourceVersion has expired anyway, the objects are listed again.
+    """
+
+    def __init__(
+        self, inventory: Inventory, list_function, project, record_type: type
+    ) -> None:
+        """
+        Class constructor.
+
+        :param inventory: The inventory to keep up to date.
+        :param list_function: A list function of the client for all namespaces.
+        :param project: A function that turns an object into a record.
+        :param record_type: DeploymentRecord or ReplicaSetRecord.
+        :type inventory: Inventory
+        :type record_type: type
+        """
+        super().__init__(daemon=True)
+        self.inventory: Inventory = inventory
+        self.list_function = list_function
+        self.project = project
+        self.record_type: type = record_type
+        self._watch: watch.Watch = watch.Watch()
+        self._stopped: threading.Event = threading.Event()
+
+    def _relist(self) -> str:
+        """
+        List all objects and replace the ones in the inventory.
+
+        :return: The resourceVersion of the list.
+        """
+        list_metadata: dict = {}
+        records: list = list(
+            iter_projected_items(
+                self.list_function, self.project, list_metadata=list_metadata
+            )
+        )
+        self.inventory.replace(self.record_type, records)
+        logging.info(f"Listed {len(records)} {self.record_type.__name__} objects.")
+        return list_metadata.get("resourceVersion")
+
+    def _follow(self, resource_version: str) -> str:
+        """
+        Apply the events of a single watch request to the inventory.
+
+        :param resource_version: The resourceVersion to start from.
+        :type resource_version: str
+
+        :return: The resourceVersion of the last event.
+        """
+        for event in self._watch.stream(
+            self.list_function,
+            resource_version=resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=WATCH_TIMEOUT,
+        ):
+            raw_object: dict = event["raw_object"]
+            if event["type"] == "ERROR":
+                raise ApiException(
+                    status=raw_object.get("code"), reason=raw_object.get("message")
+                )
+            resource_version = raw_object["metadata"]["resourceVersion"]
+            if event["type"] == "DELETED":
+                self.inventory.delete(self.project(raw_object))
+            elif event["type"] in ("ADDED", "MODIFIED"):
+                self.inventory.put(self.project(raw_object))
+        return resource_version
+
+    def run(self) -> None:
+        resource_version: str = None
+        while not self._stopped.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self._relist()
+                resource_version = self._follow(resource_version)
+            except ApiException as e:
+                if e.status == HTTP_STATUS_GONE:
+                    logging.info(
+                        f"The resourceVersion of the {self.record_type.__name__} "
+                        "watch has expired, so the objects are listed again."
+                    )
+                    resource_version = None
+                else:
+                    logging.exception(f"Watching {self.record_type.__name__} failed.")
+                    self._stopped.wait(RETRY_INTERVAL)
+            except Exception:
+                logging.exception(f"Watching {self.record_type.__name__} failed.")
+                self._stopped.wait(RETRY_INTERVAL)
+
+    def stop(self) -> None:
+        """
+        Stop watching once the current watch request ends.
+        """
+        self._stopped.set()
+        self._watch.stop()
+
+
+def start_watchers(inventory: Inventory) -> list:
+    """
+    Start keeping an inventory up to date with the deployments and replicasets
+    in all namespaces.
+
+    :param inventory: The inventory to keep up to date.
+    :type inventory: Inventory
+
+    :return: A list of the started ResourceWatcher threads.
+    """
+    apps_v1: client.AppsV1Api = client.AppsV1Api()
+    watchers: list = [
+        ResourceWatcher(
+            inventory,
+            apps_v1.list_deployment_for_all_namespaces,
+            Deployment._project,
+            DeploymentRecord,
+        ),
+        ResourceWatcher(
+            inventory,
+            apps_v1.list_replica_set_for_all_namespaces,
+            ReplicaSet._project,
+            ReplicaSetRecord,
+        ),
+    ]
+    for watcher in watchers:
+        watcher.start()
+    return watchers
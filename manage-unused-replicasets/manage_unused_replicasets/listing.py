@@ -0,0 +1,87 @@
+from kubernetes import client
+
+from manage_unused_replicasets.stream import CHUNK_SIZE, JsonListStream
+
+# the number of objects to fetch per list call, which is also what kubectl uses
+PAGE_LIMIT: int = 500
+
+
+def list_all_items(list_function, limit: int = PAGE_LIMIT, **kwargs) -> list:
+    """
+    Call a list function of the Kubernetes API client until all objects have
+    been fetched, following the continue token of each page.  The objects are
+    returned as dictionaries in the same shape as 'kubectl get -o json'.
+
+    :param list_function: A list function of the client, e.g.
+                          client.AppsV1Api().list_deployment_for_all_namespaces.
+    :param limit: The maximum number of objects to fetch per call.
+    :param kwargs: Any other parameters for the list function, e.g. namespace.
+    :type limit: int
+
+    :return: list
+    """
+    api_client: client.ApiClient = client.ApiClient()
+    items: list = []
+    continue_token: str = None
+    while True:
+        response = list_function(limit=limit, _continue=continue_token, **kwargs)
+        # the objects in a list do not carry their own apiVersion and kind
+        kind: str = (response.kind or "").replace("List", "")
+        for item in response.items:
+            data: dict = api_client.sanitize_for_serialization(item)
+            data.setdefault("apiVersion", response.api_version)
+            data.setdefault("kind", kind)
+            items.append(data)
+        continue_token = response.metadata._continue
+        if not continue_token:
+            return items
+
+
+def iter_projected_items(
+    list_function,
+    project,
+    limit: int = PAGE_LIMIT,
+    list_metadata: dict = None,
+    **kwargs,
+):
+    """
+    Call a list function of the Kubernetes API client until all objects have
+    been fetched, like list_all_items, but parse each response while it is
+    read and only keep what a projection function returns for each object.
+    This keeps the memory use low for lists with many or large objects.
+
+    :param list_function: A list function of the client, e.g.
+                          client.AppsV1Api().list_replica_set_for_all_namespaces.
+    :param project: A function that is called with each object as a dictionary
+                    in the shape of 'kubectl get -o json'.
+    :param limit: The maximum number of objects to fetch per call.
+    :param list_metadata: A dictionary that is updated with the metadata of each
+                          page, e.g. to get the resourceVersion of the list.
+    :param kwargs: Any other parameters for the list function, e.g. namespace.
+    :type limit: int
+    :type list_metadata: dict
+
+    :return: An iterator over the values returned by the projection function.
+    """
+    continue_token: str = None
+    while True:
+        response = list_function(
+            limit=limit, _continue=continue_token, _preload_content=False, **kwargs
+        )
+        try:
+            items: JsonListStream = JsonListStream(response.stream(CHUNK_SIZE))
+            for item in items:
+                # the list comes before its items, and they lack its apiVersion and kind
+                item.setdefault("apiVersion", items.fields.get("apiVersion"))
+                item.setdefault(
+                    "kind", (items.fields.get("kind") or "").replace("List", "")
+                )
+                yield project(item)
+        finally:
+            response.release_conn()
+        metadata: dict = items.fields.get("metadata") or {}
+        if list_metadata is not None:
+            list_metadata.update(metadata)
+        continue_token = metadata.get("continue")
+        if not continue_token:
+            return
@@ -0,0 +1,60 @@
+import sys
+from typing import NamedTuple
+
+
+def intern_string(value: str) -> str:
+    """
+    Intern a string, so every record with the same value shares one copy.
+    Namespaces, owners and API versions repeat across many records.
+
+    :param value: The string to intern, or None.
+    :type value: str
+
+    :return: str
+    """
+    if value is None:
+        return None
+    return sys.intern(value)
+
+
+class ReplicaSetRecord(NamedTuple):
+    """
+    The fields of a replicaset that are needed to find the unused ones.
+    """
+
+    name: str
+    namespace: str
+    owner_kind: str
+    owner_name: str
+    owner_uid: str
+    desired_replicas: int
+    replicas: int
+    available_replicas: int
+    ready_replicas: int
+    creation_timestamp: str
+
+    @property
+    def is_unused(self) -> bool:
+        """
+        A replicaset is unused when it does not have any replicas.
+
+        :return: bool
+        """
+        return (
+            self.replicas == 0
+            and self.available_replicas == 0
+            and self.ready_replicas == 0
+        )
+
+
+class DeploymentRecord(NamedTuple):
+    """
+    The fields of a deployment that are needed to report on its
+    revisionHistoryLimit.
+    """
+
+    namespace: str
+    name: str
+    uid: str
+    api_version: str
+    revision_history_limit: int
@@ -1,10 +1,11 @@
 import csv
-import json
-import os
-import subprocess
-
 from typing import TextIO
 
+from kubernetes import client, config
+
+from manage_unused_replicasets.listing import iter_projected_items, list_all_items
+from manage_unused_replicasets.records import ReplicaSetRecord, intern_string
+
 
 class ReplicaSet:
     """
@@ -15,6 +16,7 @@ class ReplicaSet:
         """
         Class constructor.
         """
+        config.load_kube_config()
 
     @staticmethod
     def _get_replicasets_spec(namespace: str) -> list:
@@ -27,15 +29,86 @@ class ReplicaSet:
 
         :return: list
         """
-        os.environ.get("KUBECONFIG")
-        command: str = f"kubectl get rs -n {namespace} -o json"
-        command_list: list = command.split(" ")
-        out_file: TextIO = open("replicasets.json.tmp", "w")
-        subprocess.run(command_list, stdout=out_file)
-        with open("replicasets.json.tmp") as json_file:
-            data: dict = json.load(json_file)
-            items: list = data.get("items")
-        return items
+        apps_v1: client.AppsV1Api = client.AppsV1Api()
+        return list_all_items(apps_v1.list_namespaced_replica_set, namespace=namespace)
+
+    @staticmethod
+    def _project(item: dict) -> ReplicaSetRecord:
+        """
+        Keep only the fields of a replicaset that are needed to find the unused
+        ones: its name, namespace, owner, replica counts and creation time.
+
+        :param item: The specification of a replicaset.
+        :type item: dict
+
+        :return: ReplicaSetRecord
+        """
+        metadata: dict = item.get("metadata") or {}
+        spec: dict = item.get("spec") or {}
+        status: dict = item.get("status") or {}
+        owner_references: list = metadata.get("ownerReferences") or [{}]
+        owner: dict = next(
+            (o for o in owner_references if o.get("kind") == "Deployment"),
+            owner_references[0],
+        )
+        return ReplicaSetRecord(
+            name=metadata.get("name"),
+            namespace=intern_string(metadata.get("namespace")),
+            owner_kind=intern_string(owner.get("kind")),
+            owner_name=intern_string(owner.get("name")),
+            owner_uid=intern_string(owner.get("uid")),
+            desired_replicas=spec.get("replicas", 0),
+            # These will only have a value if there are any such replicas
+            replicas=status.get("replicas", 0),
+            available_replicas=status.get("availableReplicas", 0),
+            ready_replicas=status.get("readyReplicas", 0),
+            creation_timestamp=metadata.get("creationTimestamp"),
+        )
+
+    @staticmethod
+    def _iter_all_replicaset_records():
+        """
+        Iterate over all replicasets in all namespaces as they are received,
+        keeping only the fields of a ReplicaSetRecord.  The list responses are
+        parsed while they are read, so the full specifications of the whole
+        cluster are never held in memory.
+
+        :return: An iterator over ReplicaSetRecord.
+        """
+        apps_v1: client.AppsV1Api = client.AppsV1Api()
+        return iter_projected_items(
+            apps_v1.list_replica_set_for_all_namespaces, ReplicaSet._project
+        )
+
+    @staticmethod
+    def classify_replicasets(records) -> dict:
+        """
+        Group the unused replicasets by the UID of the deployment that owns them,
+        in a single pass over the records.
+
+        :param records: An iterable of ReplicaSetRecord.
+
+        :return: dict
+        """
+        replicasets: dict = {}
+        for record in records:
+            if record.owner_kind == "Deployment" and record.is_unused:
+                owner_replicasets: list = replicasets.get(record.owner_uid)
+                if owner_replicasets is None:
+                    replicasets[record.owner_uid] = [record.name]
+                else:
+                    owner_replicasets.append(record.name)
+        return replicasets
+
+    def get_unused_replicasets_by_owner(self) -> dict:
+        """
+        Get all unused replicasets in the cluster, grouped by the UID of the
+        deployment that owns them.  The replicasets are fetched with a single
+        streamed scan of all namespaces.
+
+        :return: dict
+        """
+        return self.classify_replicasets(self._iter_all_replicaset_records())
 
     def get_replicasets(self, namespace: str) -> list:
         """
@@ -70,23 +143,13 @@ class ReplicaSet:
         replicasets_spec = self._get_replicasets_spec(namespace)
         replicasets: list = []
         for item in replicasets_spec:
-            item_with_type_hints: dict = item
-            metadata: dict = item_with_type_hints.get("metadata")
-            status: dict = item_with_type_hints.get("status")
-            # This will only have a value if there are available replicas
-            available_replicas: int = status.get("availableReplicas", 0)
-            # This will only have a value if there are ready replicas
-            ready_replicas: int = status.get("readyReplicas", 0)
-            replicas: int = status.get("replicas")  # This will always have a value
-            if available_replicas == 0 and ready_replicas == 0 and replicas == 0:
-                try:
-                    owner_references: list = metadata.get("ownerReferences")
-                    application: str = owner_references[0]["name"]
-                    if application == deployment_name:
-                        name: str = metadata.get("name")
-                        replicasets.append(name)
-                except TypeError:
+            record: ReplicaSetRecord = self._project(item)
+            if record.is_unused:
+                application: str = record.owner_name
+                if application is None:
                     print("The ownerReferences field is empty. Skipping.")
+                elif application == deployment_name:
+                    replicasets.append(record.name)
         return replicasets
 
     def get_number_of_unused_replicasets_per_deployment(
@@ -114,43 +177,60 @@ class ReplicaSet:
         else:
             return num - limit
 
+    @classmethod
+    def write_cvs_report(
+        cls, csvfile: TextIO, deployments: list, unused_replicasets: dict
+    ) -> None:
+        """
+        Write comma separated information about unused repliacasets that belongs to
+        deployments with a high revisionHistoryLimit.
+
+        :param csvfile: The file to write to.
+        :param deployments: A list of DeploymentRecord for deployments that have a high
+                            revisionHistoryLimit.
+        :param unused_replicasets: The names of the unused replicasets per owner UID,
+                                   as returned by get_unused_replicasets_by_owner.
+        :type deployments: list
+        :type unused_replicasets: dict
+        """
+        dp_writer = csv.writer(csvfile, delimiter=",")
+        dp_writer.writerow(
+            [
+                "Namespace",
+                "Deployment name",
+                "API version",
+                "Limit",
+                "Replicasets#",
+                "Over quota#",
+            ]
+        )
+        for deployment in deployments:
+            namespace: str = deployment.namespace
+            name: str = deployment.name
+            api_version: str = deployment.api_version
+            revision_history_limit: int = deployment.revision_history_limit
+            count: int = len(unused_replicasets.get(deployment.uid, []))
+            dp_writer.writerow(
+                [
+                    namespace,
+                    name,
+                    api_version,
+                    revision_history_limit,
+                    count,
+                    cls.get_num_of_delete_candidates(count),
+                ]
+            )
+
     def create_cvs_report_with_unused_replicasets(self, deployments: list) -> None:
         """
         Create a comma separated file with information about unused repliacasets that
         belongs to deployments with a high revisionHistoryLimit.
 
-        :param deployments: A list of dictionary objects that contains the namespace,
-                            deployment name, api version and revisionHistoryLimit value
-                            for deployments that have a high revisionHistoryLimit.
+        :param deployments: A list of DeploymentRecord for deployments that have a high
+                            revisionHistoryLimit.
         :type deployments: list
         """
+        # fetched once for the whole cluster, rather than once per deployment
+        unused_replicasets: dict = self.get_unused_replicasets_by_owner()
         with open("problematic-deployments.csv.tmp", "w", newline="") as csvfile:
-            dp_writer = csv.writer(csvfile, delimiter=",")
-            dp_writer.writerow(
-                [
-                    "Namespace",
-                    "Deployment name",
-                    "API version",
-                    "Limit",
-                    "Replicasets#",
-                    "Over quota#",
-                ]
-            )
-            for deployment in deployments:
-                namespace: str = deployment.get("namespace")
-                name: str = deployment.get("name")
-                api_version: str = deployment.get("api_version")
-                revision_history_limit: str = deployment.get("revision_history_limit")
-                count: int = self.get_number_of_unused_replicasets_per_deployment(
-                    namespace, name
-                )
-                dp_writer.writerow(
-                    [
-                        namespace,
-                        name,
-                        api_version,
-                        revision_history_limit,
-                        count,
-                        self.get_num_of_delete_candidates(count),
-                    ]
-                )
+            self.write_cvs_report(csvfile, deployments, unused_replicasets)
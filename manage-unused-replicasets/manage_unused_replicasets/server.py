@@ -0,0 +1,101 @@
+import csv
+import io
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from manage_unused_replicasets.inventory import Inventory
+from manage_unused_replicasets.records import DeploymentRecord
+
+
+class InventoryRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the reports of the Inventory of an InventoryServer.
+    """
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+    def _reply(self, status_code: int, body: str, content_type: str) -> None:
+        data: bytes = body.encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        inventory: Inventory = self.server.inventory
+        path: str = self.path.split("?")[0]
+        if path == "/healthz":
+            if inventory.is_synced():
+                self._reply(200, "OK", "text/plain")
+            else:
+                self._reply(503, "Not synced", "text/plain")
+        elif path not in ("/unused-replicasets", "/deployments"):
+            self._reply(404, "Not found", "text/plain")
+        elif not inventory.is_synced():
+            # a partial inventory would report too few unused replicasets
+            self._reply(503, "The cluster has not been listed yet.", "text/plain")
+        elif path == "/unused-replicasets":
+            report: io.StringIO = io.StringIO(newline="")
+            inventory.write_cvs_report(report)
+            self._reply(200, report.getvalue(), "text/csv")
+        else:
+            report: io.StringIO = io.StringIO(newline="")
+            dp_writer = csv.writer(report, delimiter=",")
+            dp_writer.writerow(DeploymentRecord._fields)
+            dp_writer.writerows(
+                inventory.get_deployments_with_high_revision_history_limit()
+            )
+            self._reply(200, report.getvalue(), "text/csv")
+
+
+class InventoryServer:
+    """
+    A server for the reports of an Inventory.  GET /unused-replicasets returns
+    the same comma separated report as
+    ReplicaSet.create_cvs_report_with_unused_replicasets, GET /deployments the
+    deployments with a high revisionHistoryLimit, and GET /healthz whether the
+    inventory has been synced.
+    """
+
+    def __init__(self, inventory: Inventory, host: str = "", port: int = 8080) -> None:
+        """
+        Class constructor.
+
+        :param inventory: The inventory to report on.
+        :param host: The address to listen on. Default: All addresses.
+        :param port: The port to listen on. Default: 8080
+        :type inventory: Inventory
+        :type host: str
+        :type port: int
+        """
+        self.httpd: ThreadingHTTPServer = ThreadingHTTPServer(
+            (host, port), InventoryRequestHandler
+        )
+        self.httpd.daemon_threads = True
+        self.httpd.inventory = inventory
+
+    @property
+    def port(self) -> int:
+        """
+        The port the server listens on, which is useful when it was created with
+        port 0.
+
+        :return: int
+        """
+        return self.httpd.server_address[1]
+
+    def serve_forever(self) -> None:
+        """
+        Handle requests until shutdown is called.
+        """
+        logging.info(f"Serving the reports on port {self.port}.")
+        self.httpd.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        Stop handling requests.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,120 @@
+import codecs
+import json
+import re
+
+# the number of bytes to read at a time from a response
+CHUNK_SIZE: int = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonListStream:
+    """
+    A parser for a Kubernetes list, such as the output of 'kubectl get -o json'
+    or the body of a list call, that yields the objects in 'items' one at a
+    time while the input is read.  Only the object being parsed is held in
+    memory, rather than the whole list.  The other top level fields, e.g. the
+    metadata with the continue token, are kept in 'fields'.
+    """
+
+    def __init__(self, chunks) -> None:
+        """
+        Class constructor.
+
+        :param chunks: An iterable of bytes or str, e.g. response.stream().
+        """
+        self._chunks = iter(chunks)
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder: json.JSONDecoder = json.JSONDecoder()
+        self._buffer: str = ""
+        self._position: int = 0
+        self._exhausted: bool = False
+        self.fields: dict = {}
+
+    def _read(self) -> bool:
+        """
+        Append the next chunk to the buffer, dropping the part already parsed.
+
+        :return: bool
+        """
+        if self._exhausted:
+            return False
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self._exhausted = True
+            chunk = self._text_decoder.decode(b"", final=True)
+        else:
+            if isinstance(chunk, bytes):
+                chunk = self._text_decoder.decode(chunk)
+        self._buffer = self._buffer[self._position :] + chunk
+        self._position = 0
+        return True
+
+    def _peek(self) -> str:
+        """
+        Skip any whitespace and get the next character without consuming it.
+
+        :return: str, which is empty at the end of the input
+        """
+        while True:
+            self._position = _WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._read():
+                return ""
+
+    def _expect(self, characters: str) -> str:
+        """
+        Consume the next character, which must be one of the given characters.
+
+        :return: str
+        """
+        character: str = self._peek()
+        if character == "" or character not in characters:
+            raise ValueError(
+                f"Expected one of {characters!r} but found {character!r} in the list."
+            )
+        self._position += 1
+        return character
+
+    def _decode_value(self):
+        """
+        Decode the next JSON value, reading more chunks until it is complete.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._read():
+                continue
+            self._position = end
+            return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self._position += 1
+            return
+        while True:
+            key: str = self._decode_value()
+            self._expect(":")
+            if key == "items" and self._peek() == "[":
+                self._position += 1
+                if self._peek() == "]":
+                    self._position += 1
+                else:
+                    while True:
+                        yield self._decode_value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self.fields[key] = self._decode_value()
+            if self._expect(",}") == "}":
+                return
+
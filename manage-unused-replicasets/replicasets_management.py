@@ -1,12 +1,88 @@
 #!/usr/bin/env python3
+import getopt
+import logging
+import sys
+
+from kubernetes import config
+
 from manage_unused_replicasets.deployment import Deployment
-from manage_unused_replicasets.namespace import Namespace
+from manage_unused_replicasets.inventory import Inventory, start_watchers
 from manage_unused_replicasets.replicaset import ReplicaSet
+from manage_unused_replicasets.server import InventoryServer
 
 
-if __name__ == "__main__":
-    ns: Namespace = Namespace()
-    # namespaces: list = ns.get_namespaces()
+def show_usage():
+    out_str: str = """replicasets_management.py
+
+Creates problematic-deployments.sh.tmp with commands to reduce the
+revisionHistoryLimit of deployments to 10, and problematic-deployments.csv.tmp
+with the number of unused replicasets of those deployments.
+
+All parameters are optional
+
+     --watch
+        Instead of creating the files once, keep running and serve the reports
+        over HTTP.  The deployments and replicasets are listed once, and then
+        kept up to date from watch streams, so a report does not list the
+        whole cluster again.
+
+        GET /unused-replicasets   The report in problematic-deployments.csv.tmp
+        GET /deployments          The deployments with a high revisionHistoryLimit
+        GET /healthz              200 once the cluster has been listed, else 503
+
+     --host <address>
+        The address to listen on with --watch.  Default: All addresses
+
+     --port <number>
+        The port to listen on with --watch.  Default: 8080
+
+     -h
+        Display this help information."""
+    print(out_str)
+
+
+def main(argv):
+    watch_mode: bool = False
+    host: str = ""
+    port: int = 8080
+
+    try:
+        opts, args = getopt.getopt(argv, "h", ["watch", "host=", "port="])
+    except getopt.GetoptError:
+        show_usage()
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt == "-h":
+            show_usage()
+            sys.exit()
+        elif opt == "--watch":
+            watch_mode = True
+        elif opt == "--host":
+            host = arg
+        elif opt == "--port":
+            try:
+                port = int(arg)
+            except ValueError:
+                show_usage()
+                sys.exit(2)
+
+    if watch_mode:
+        config.load_kube_config()
+        logging.basicConfig(
+            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            level=logging.INFO,
+        )
+        inventory: Inventory = Inventory()
+        watchers: list = start_watchers(inventory)
+        server: InventoryServer = InventoryServer(inventory, host, port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+        for watcher in watchers:
+            watcher.stop()
+        return
 
     dp: Deployment = Deployment()
     # dp.print_deployments_with_high_revision_history_limit()
@@ -15,3 +91,7 @@ if __name__ == "__main__":
 
     rs: ReplicaSet = ReplicaSet()
     rs.create_cvs_report_with_unused_replicasets(deployments)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
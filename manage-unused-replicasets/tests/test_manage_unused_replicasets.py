@@ -1,5 +1,212 @@
+import io
+import json
+import threading
+import urllib.request
+
+from kubernetes import client, config
+
 from manage_unused_replicasets import __version__
+from manage_unused_replicasets.deployment import Deployment
+from manage_unused_replicasets.inventory import Inventory, ResourceWatcher
+from manage_unused_replicasets.listing import iter_projected_items, list_all_items
+from manage_unused_replicasets.records import DeploymentRecord, ReplicaSetRecord
+from manage_unused_replicasets.replicaset import ReplicaSet
+from manage_unused_replicasets.server import InventoryServer
+from manage_unused_replicasets.stream import JsonListStream
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def _replicaset(name: str, replicas: int, owner_uid: str = None) -> dict:
+    metadata: dict = {"name": name, "namespace": "default"}
+    if owner_uid is not None:
+        metadata["ownerReferences"] = [
+            {"kind": "Deployment", "name": "app", "uid": owner_uid}
+        ]
+    return {"metadata": metadata, "status": {"replicas": replicas}}
+
+
+def test_unused_replicasets_are_grouped_by_owner_uid(monkeypatch):
+    items: list = [
+        _replicaset("app-1", 0, "uid-a"),
+        _replicaset("app-2", 2, "uid-a"),
+        _replicaset("app-3", 0, "uid-a"),
+        _replicaset("other-1", 0, "uid-b"),
+        _replicaset("orphan-1", 0),
+    ]
+    monkeypatch.setattr(config, "load_kube_config", lambda: None)
+    monkeypatch.setattr(
+        ReplicaSet,
+        "_iter_all_replicaset_records",
+        staticmethod(lambda: map(ReplicaSet._project, items)),
+    )
+    assert ReplicaSet().get_unused_replicasets_by_owner() == {
+        "uid-a": ["app-1", "app-3"],
+        "uid-b": ["other-1"],
+    }
+
+
+def test_deployments_with_a_high_revision_history_limit(monkeypatch):
+    items: list = [
+        {
+            "apiVersion": "apps/v1",
+            "metadata": {"name": "api", "namespace": "web", "uid": "uid-a"},
+            "spec": {"revisionHistoryLimit": 20},
+        },
+        {"apiVersion": "apps/v1", "metadata": {"name": "worker"}, "spec": {}},
+    ]
+    monkeypatch.setattr(config, "load_kube_config", lambda: None)
+    monkeypatch.setattr(
+        Deployment,
+        "_iter_all_deployment_records",
+        staticmethod(lambda: map(Deployment._project, items)),
+    )
+    assert Deployment().get_deployments_with_high_revision_history_limit() == [
+        DeploymentRecord("web", "api", "uid-a", "apps/v1", 20)
+    ]
+
+
+def test_list_all_items_follows_the_continue_token():
+    def replicaset(name: str) -> client.V1ReplicaSet:
+        return client.V1ReplicaSet(
+            metadata=client.V1ObjectMeta(name=name),
+            spec=client.V1ReplicaSetSpec(selector=client.V1LabelSelector()),
+        )
+
+    pages: dict = {
+        None: client.V1ReplicaSetList(
+            api_version="apps/v1",
+            kind="ReplicaSetList",
+            items=[replicaset("rs-1")],
+            metadata=client.V1ListMeta(_continue="page-2"),
+        ),
+        "page-2": client.V1ReplicaSetList(
+            api_version="apps/v1",
+            kind="ReplicaSetList",
+            items=[replicaset("rs-2")],
+            metadata=client.V1ListMeta(),
+        ),
+    }
+    calls: list = []
+
+    def list_replica_set(limit: int, _continue: str = None, namespace: str = None):
+        calls.append((limit, _continue, namespace))
+        return pages[_continue]
+
+    items: list = list_all_items(list_replica_set, limit=1, namespace="default")
+    assert [item["metadata"]["name"] for item in items] == ["rs-1", "rs-2"]
+    assert items[0]["apiVersion"] == "apps/v1" and items[0]["kind"] == "ReplicaSet"
+    assert calls == [(1, None, "default"), (1, "page-2", "default")]
+
+
+def test_json_list_stream_yields_items_across_chunk_boundaries():
+    text: str = json.dumps(
+        {
+            "apiVersion": "v1",
+            "kind": "List",
+            "metadata": {"continue": "page-2", "resourceVersion": "12"},
+            "items": [
+                {"metadata": {"name": "rs-æøå"}, "status": {"replicas": 10}},
+                {"metadata": {"name": "rs-2"}, "status": {"replicas": 0}},
+            ],
+        },
+        ensure_ascii=False,
+    ).encode()
+    chunks: list = [text[start : start + 7] for start in range(0, len(text), 7)]
+    items: JsonListStream = JsonListStream(chunks)
+    assert [item["metadata"]["name"] for item in items] == ["rs-æøå", "rs-2"]
+    assert items.fields["metadata"]["continue"] == "page-2"
+    assert list(JsonListStream([b'{"items": []}'])) == []
+
+
+class _StreamedResponse:
+    def __init__(self, body: dict):
+        self.body: bytes = json.dumps(body).encode()
+        self.released: bool = False
+
+    def stream(self, amount: int):
+        yield self.body
+
+    def release_conn(self):
+        self.released = True
+
+
+def test_iter_projected_items_streams_every_page():
+    responses: dict = {
+        None: _StreamedResponse(
+            {"metadata": {"continue": "page-2"}, "items": [{"name": "a"}]}
+        ),
+        "page-2": _StreamedResponse({"metadata": {}, "items": [{"name": "b"}]}),
+    }
+
+    def list_replica_set(limit: int, _continue: str, _preload_content: bool):
+        assert _preload_content is False
+        return responses[_continue]
+
+    names: list = list(
+        iter_projected_items(list_replica_set, lambda item: item["name"])
+    )
+    assert names == ["a", "b"]
+    assert all(response.released for response in responses.values())
+
+
+def test_inventory_follows_events_and_relists_after_410(monkeypatch):
+    deployment: dict = {
+        "apiVersion": "apps/v1",
+        "metadata": {"name": "app", "namespace": "default", "uid": "uid-a"},
+        "spec": {"revisionHistoryLimit": 20},
+    }
+    replicasets: list = [_replicaset("app-1", 0, "uid-a")]
+    events: list = [
+        {"type": "ADDED", "raw_object": _replicaset("app-2", 0, "uid-a")},
+        {"type": "MODIFIED", "raw_object": _replicaset("app-1", 3, "uid-a")},
+        {"type": "BOOKMARK", "raw_object": {"metadata": {}}},
+        {"type": "ERROR", "raw_object": {"code": 410, "message": "too old"}},
+    ]
+    for number, event in enumerate(events[:3]):
+        event["raw_object"]["metadata"]["resourceVersion"] = str(number + 2)
+    lists: list = []
+
+    def list_replica_set(**kwargs):
+        lists.append(kwargs.get("_continue"))
+        return _StreamedResponse(
+            {"metadata": {"resourceVersion": "1"}, "items": replicasets}
+        )
+
+    inventory: Inventory = Inventory()
+    inventory.replace(DeploymentRecord, [Deployment._project(deployment)])
+    watcher: ResourceWatcher = ResourceWatcher(
+        inventory, list_replica_set, ReplicaSet._project, ReplicaSetRecord
+    )
+
+    def stream(list_function, resource_version: str, **kwargs):
+        assert resource_version == "1" and kwargs["allow_watch_bookmarks"]
+        if len(lists) == 1:
+            yield from events
+        else:
+            watcher._stopped.set()
+
+    monkeypatch.setattr(watcher._watch, "stream", stream)
+    watcher.run()
+    assert lists == [None, None]
+    # the relist after the 410 replaced the state built from the events
+    report: io.StringIO = io.StringIO()
+    inventory.write_cvs_report(report)
+    assert report.getvalue().splitlines()[1] == "default,app,apps/v1,20,1,0"
+
+    inventory.put(ReplicaSet._project(_replicaset("app-2", 0, "uid-a")))
+    inventory.put(ReplicaSet._project(_replicaset("app-3", 0, "uid-a")))
+    inventory.put(ReplicaSet._project(_replicaset("app-1", 2, "uid-a")))
+    server: InventoryServer = InventoryServer(inventory, "127.0.0.1", 0)
+    thread: threading.Thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url: str = f"http://127.0.0.1:{server.port}/unused-replicasets"
+        with urllib.request.urlopen(url) as response:
+            lines: list = response.read().decode().splitlines()
+    finally:
+        server.shutdown()
+        thread.join()
+    assert lines[1] == "default,app,apps/v1,20,2,0"